@@ -0,0 +1,179 @@
+"""Vectorized term-level attendance analytics.
+
+Attendance for a class (or every class a teacher owns) over a date range is
+bulk-loaded from the attendance store into columnar arrays and pivoted into a
+students x sessions status matrix. Every statistic is then computed with
+whole-array NumPy/pandas operations rather than per-record Python loops.
+
+Matrix cells hold ``ABSENT``, ``PRESENT`` or ``MISSING`` (no row recorded).
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rollups import SESSION_ORDER
+
+MISSING, PRESENT, ABSENT = -1, 0, 1
+LOAD_FIELDS = ("student_id", "class_id", "date", "session", "status")
+
+
+@dataclass
+class StatusMatrix:
+    student_ids: pd.Index
+    student_classes: np.ndarray
+    dates: pd.DatetimeIndex
+    sessions: np.ndarray
+    statuses: np.ndarray  # int8, shape (students, sessions)
+
+
+async def load_columns(store, query: dict, batch_size: int = 5000) -> Dict[str, list]:
+    """Read the matching records into columns, ``batch_size`` records at a time.
+
+    Records already buffered by the cursor come back without suspending, so the
+    event loop is handed back explicitly after every batch; a term of records
+    never holds up other requests for longer than one batch takes to copy.
+    """
+    columns = {field: [] for field in LOAD_FIELDS}
+    loaded = 0
+    async for record in store.iter_records(query, batch_size):
+        for field in LOAD_FIELDS:
+            columns[field].append(record[field])
+        loaded += 1
+        if loaded % batch_size == 0:
+            await asyncio.sleep(0)
+    return columns
+
+
+def build_matrix(columns: Dict[str, list]) -> StatusMatrix:
+    frame = pd.DataFrame(columns, columns=list(LOAD_FIELDS))
+    # Same chronological key as rollups.session_position, built column-wise
+    session_rank = frame["session"].map(SESSION_ORDER).fillna(len(SESSION_ORDER)).astype(int).astype(str)
+    positions = frame["date"] + "#" + session_rank + frame["session"]
+    student_codes, student_ids = pd.factorize(frame["student_id"], sort=True)
+    session_codes, session_keys = pd.factorize(positions, sort=True)
+
+    statuses = np.full((len(student_ids), len(session_keys)), MISSING, dtype=np.int8)
+    statuses[student_codes, session_codes] = np.where(frame["status"].to_numpy() == "absent", ABSENT, PRESENT)
+
+    # One representative row per student and per session for the labels
+    student_classes = np.empty(len(student_ids), dtype=object)
+    student_classes[student_codes] = frame["class_id"].to_numpy()
+    session_dates = np.empty(len(session_keys), dtype=object)
+    session_dates[session_codes] = frame["date"].to_numpy()
+    session_names = np.empty(len(session_keys), dtype=object)
+    session_names[session_codes] = frame["session"].to_numpy()
+
+    return StatusMatrix(
+        student_ids=pd.Index(student_ids),
+        student_classes=student_classes,
+        dates=pd.DatetimeIndex(pd.to_datetime(session_dates)),
+        sessions=session_names,
+        statuses=statuses
+    )
+
+
+def absence_rates(matrix: StatusMatrix) -> np.ndarray:
+    recorded = (matrix.statuses != MISSING).sum(axis=1)
+    absent = (matrix.statuses == ABSENT).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(recorded > 0, 100.0 * absent / recorded, 0.0)
+
+
+def absence_runs(matrix: StatusMatrix):
+    """Return (longest, current) consecutive-absence run per student.
+
+    Sessions with no record are skipped over rather than breaking a run.
+    """
+    absent = matrix.statuses == ABSENT
+    recorded = matrix.statuses != MISSING
+    # Cumulative absence count, reset to zero at every recorded present session
+    counts = np.cumsum(absent, axis=1)
+    resets = np.where(recorded & ~absent, counts, 0)
+    runs = counts - np.maximum.accumulate(resets, axis=1)
+    longest = runs.max(axis=1) if runs.size else np.zeros(len(matrix.student_ids), dtype=int)
+    current = runs[:, -1] if runs.size else np.zeros(len(matrix.student_ids), dtype=int)
+    return longest, current
+
+
+def heatmap(matrix: StatusMatrix) -> List[dict]:
+    """Absence rate per (weekday, session) across every student."""
+    absent = (matrix.statuses == ABSENT).sum(axis=0)
+    recorded = (matrix.statuses != MISSING).sum(axis=0)
+    frame = pd.DataFrame({
+        "weekday": matrix.dates.day_name(),
+        "weekday_number": matrix.dates.weekday,
+        "session": matrix.sessions,
+        "absent": absent,
+        "recorded": recorded
+    })
+    grouped = frame.groupby(["weekday_number", "weekday", "session"], sort=True)[["absent", "recorded"]].sum()
+    grouped["absence_rate"] = np.round(100.0 * grouped["absent"] / grouped["recorded"].where(grouped["recorded"] > 0), 2)
+    grouped = grouped.fillna({"absence_rate": 0.0}).reset_index()
+    return [
+        {
+            "weekday": row.weekday,
+            "session": row.session,
+            "absent": int(row.absent),
+            "recorded": int(row.recorded),
+            "absence_rate": float(row.absence_rate)
+        }
+        for row in grouped.itertuples(index=False)
+    ]
+
+
+def student_table(matrix: StatusMatrix) -> pd.DataFrame:
+    longest, current = absence_runs(matrix)
+    return pd.DataFrame({
+        "student_id": matrix.student_ids,
+        "class_id": matrix.student_classes,
+        "sessions_recorded": (matrix.statuses != MISSING).sum(axis=1),
+        "absent": (matrix.statuses == ABSENT).sum(axis=1),
+        "absence_rate": np.round(absence_rates(matrix), 2),
+        "longest_absence_streak": longest,
+        "current_absence_streak": current
+    })
+
+
+def at_risk(table: pd.DataFrame, rate_threshold: float, streak_threshold: int) -> pd.DataFrame:
+    flagged = (table["absence_rate"] >= rate_threshold) | (table["current_absence_streak"] >= streak_threshold)
+    return table[flagged].sort_values(["absence_rate", "current_absence_streak"], ascending=False)
+
+
+def _records(frame: pd.DataFrame) -> List[dict]:
+    return [
+        {key: (value.item() if isinstance(value, np.generic) else value) for key, value in row.items()}
+        for row in frame.to_dict(orient="records")
+    ]
+
+
+def analyze(columns: Dict[str, list], rate_threshold: float = 20.0, streak_threshold: int = 3,
+            include: Optional[set] = None) -> dict:
+    """Compute the requested report sections from bulk-loaded columns.
+
+    ``include`` limits the output to some of "students", "heatmap" and
+    "at_risk"; the overall totals are always returned.
+    """
+    include = include or {"students", "heatmap", "at_risk"}
+    if not columns["student_id"]:
+        return {"students_count": 0, "sessions_count": 0, "absence_rate": 0.0,
+                **{section: [] for section in include}}
+
+    matrix = build_matrix(columns)
+    recorded = int((matrix.statuses != MISSING).sum())
+    absent = int((matrix.statuses == ABSENT).sum())
+    report = {
+        "students_count": len(matrix.student_ids),
+        "sessions_count": matrix.statuses.shape[1],
+        "absence_rate": round(100.0 * absent / recorded, 2) if recorded else 0.0
+    }
+    table = student_table(matrix)
+    if "students" in include:
+        report["students"] = _records(table.sort_values("student_id"))
+    if "heatmap" in include:
+        report["heatmap"] = heatmap(matrix)
+    if "at_risk" in include:
+        report["at_risk"] = _records(at_risk(table, rate_threshold, streak_threshold))
+    return report
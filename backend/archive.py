@@ -0,0 +1,242 @@
+"""Cold archive of closed academic years.
+
+``python manage.py archive-year 2023-2024`` moves a year out of MongoDB into
+a directory of NumPy files under ``ATTENDANCE_ARCHIVE_DIR``:
+
+* every string column (class_id, date, session, student_id, status,
+  recorded_by) is dictionary-encoded into ``<column>.values.npy`` (the sorted
+  distinct values) and ``<column>.codes.npy`` (the narrowest integer type that
+  fits), which shrinks a year of attendance to a few bytes per row;
+* ``recorded_at`` is stored as ``datetime64[ms]``;
+* rows are sorted by (class_id, date, session, student_id), so a class is a
+  contiguous run found by binary search on the class codes.
+
+Readers memory-map the code columns, so opening a year costs a manifest read
+and only the pages a report touches are ever loaded. Archived records get a
+synthetic id, ``class_id:date:session:student_id``, which is as unique as the
+original.
+"""
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from attendance import RECORD_FIELDS
+from pagination import decode_cursor, encode_cursor
+
+MANIFEST = "manifest.json"
+STRING_COLUMNS = ["class_id", "date", "session", "student_id", "status", "recorded_by"]
+SORT_COLUMNS = ["class_id", "date", "session", "student_id"]
+
+
+def _code_dtype(distinct: int):
+    for dtype in (np.int8, np.int16, np.int32):
+        if distinct <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+async def write_archive(store, directory: str, year: str, query: dict, batch_size: int = 5000) -> dict:
+    """Archive every record of ``store`` matching ``query`` as ``directory/year``.
+
+    Codes are spooled to disk batch by batch, so memory holds only the
+    dictionaries, never the year's records.
+    """
+    target = os.path.join(directory, year)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    dictionaries: Dict[str, Dict[str, int]] = {column: {} for column in STRING_COLUMNS}
+    spools = {column: open(os.path.join(staging, f"{column}.spool"), "wb") for column in STRING_COLUMNS + ["recorded_at"]}
+    rows = 0
+
+    def spool(batch: List[dict]):
+        for column in STRING_COLUMNS:
+            dictionary = dictionaries[column]
+            codes = [dictionary.setdefault(record[column] or "", len(dictionary)) for record in batch]
+            np.asarray(codes, dtype=np.int64).tofile(spools[column])
+        timestamps = np.array([record["recorded_at"] for record in batch], dtype="datetime64[ms]")
+        timestamps.view(np.int64).tofile(spools["recorded_at"])
+
+    try:
+        batch = []
+        async for record in store.iter_records(query, batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                spool(batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            spool(batch)
+            rows += len(batch)
+    finally:
+        for handle in spools.values():
+            handle.close()
+
+    # Renumber codes so they sort like their values, then sort the rows
+    columns: Dict[str, np.ndarray] = {}
+    for column in STRING_COLUMNS:
+        values = np.array(list(dictionaries[column]), dtype=str)
+        order = np.argsort(values, kind="stable")
+        rank = np.empty(len(values), dtype=np.int64)
+        rank[order] = np.arange(len(values))
+        codes = np.fromfile(os.path.join(staging, f"{column}.spool"), dtype=np.int64)
+        columns[column] = rank[codes].astype(_code_dtype(len(values))) if len(values) else codes.astype(np.int8)
+        np.save(os.path.join(staging, f"{column}.values.npy"), values[order])
+    columns["recorded_at"] = np.fromfile(os.path.join(staging, "recorded_at.spool"), dtype=np.int64).view("datetime64[ms]")
+
+    row_order = np.lexsort([columns[column] for column in reversed(SORT_COLUMNS)])
+    if not np.array_equal(row_order, np.arange(rows)):
+        columns = {column: values[row_order] for column, values in columns.items()}
+    for column, values in columns.items():
+        suffix = "codes" if column in STRING_COLUMNS else "values"
+        np.save(os.path.join(staging, f"{column}.{suffix}.npy"), values)
+        os.remove(os.path.join(staging, f"{column}.spool"))
+
+    manifest = {
+        "year": year,
+        "rows": rows,
+        "storage": store.mode,
+        "archived_at": datetime.utcnow().isoformat(),
+        "columns": {column: str(values.dtype) for column, values in columns.items()}
+    }
+    with open(os.path.join(staging, MANIFEST), "w") as handle:
+        json.dump(manifest, handle, indent=2)
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(staging, target)
+    return manifest
+
+
+def _code_bounds(values: np.ndarray, condition) -> Tuple[int, int]:
+    """Translate an equality or range filter on a sorted dictionary into a [low, high) code range."""
+    if isinstance(condition, str):
+        low = int(np.searchsorted(values, condition, side="left"))
+        high = int(np.searchsorted(values, condition, side="right"))
+        return low, high
+    low, high = 0, len(values)
+    for operator, bound in (condition or {}).items():
+        if operator == "$gte":
+            low = max(low, int(np.searchsorted(values, bound, side="left")))
+        elif operator == "$gt":
+            low = max(low, int(np.searchsorted(values, bound, side="right")))
+        elif operator == "$lte":
+            high = min(high, int(np.searchsorted(values, bound, side="right")))
+        elif operator == "$lt":
+            high = min(high, int(np.searchsorted(values, bound, side="left")))
+        else:
+            raise ValueError(f"Unsupported archive filter operator: {operator}")
+    return low, high
+
+
+class ArchivedYear:
+    """Read side of one archived year; columns are opened on first use."""
+
+    mode = "archive"
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as handle:
+            self.manifest = json.load(handle)
+        self._values: Dict[str, np.ndarray] = {}
+        self._codes: Dict[str, np.ndarray] = {}
+
+    def _open(self):
+        if self._codes:
+            return
+        for column in STRING_COLUMNS:
+            self._values[column] = np.load(os.path.join(self.path, f"{column}.values.npy"))
+            self._codes[column] = np.load(os.path.join(self.path, f"{column}.codes.npy"), mmap_mode="r")
+        self._codes["recorded_at"] = np.load(os.path.join(self.path, "recorded_at.values.npy"), mmap_mode="r")
+
+    def _class_ranges(self, condition) -> List[Tuple[int, int]]:
+        values, codes = self._values["class_id"], self._codes["class_id"]
+        if condition is None:
+            return [(0, len(codes))]
+        class_ids = condition["$in"] if isinstance(condition, dict) else [condition]
+        ranges = []
+        for class_id in sorted(class_ids):
+            low, high = _code_bounds(values, class_id)
+            if low < high:
+                ranges.append((int(np.searchsorted(codes, low, side="left")),
+                               int(np.searchsorted(codes, low, side="right"))))
+        return ranges
+
+    def _rows(self, query: dict, batch_size: int) -> Iterator[np.ndarray]:
+        """Yield row positions matching ``query`` in batches, in archive (key) order."""
+        self._open()
+        filters = [
+            (column, _code_bounds(self._values[column], query[column]))
+            for column in ("date", "session", "student_id") if column in query
+        ]
+        for start, end in self._class_ranges(query.get("class_id")):
+            for offset in range(start, end, batch_size):
+                stop = min(offset + batch_size, end)
+                mask = np.ones(stop - offset, dtype=bool)
+                for column, (low, high) in filters:
+                    codes = self._codes[column][offset:stop]
+                    mask &= (codes >= low) & (codes < high)
+                positions = np.flatnonzero(mask) + offset
+                if len(positions):
+                    yield positions
+
+    def _records(self, positions: np.ndarray) -> List[dict]:
+        columns = {
+            column: self._values[column][self._codes[column][positions]].tolist() for column in STRING_COLUMNS
+        }
+        columns["recorded_at"] = self._codes["recorded_at"][positions].astype("datetime64[ms]").tolist()
+        records = []
+        for values in zip(*(columns[field] for field in RECORD_FIELDS)):
+            record = dict(zip(RECORD_FIELDS, values))
+            record["id"] = f"{record['class_id']}:{record['date']}:{record['session']}:{record['student_id']}"
+            records.append(record)
+        return records
+
+    async def iter_records(self, query: dict, batch_size: int = 1000) -> AsyncIterator[dict]:
+        for positions in self._rows(query, batch_size):
+            for record in self._records(positions):
+                yield record
+            # Decoding is CPU work on the event loop; let other requests in between batches
+            await asyncio.sleep(0)
+
+    async def session_records(self, class_id: str, date: str, session: str, limit: int,
+                              cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        query = {"class_id": class_id, "date": date, "session": session}
+        if cursor:
+            [after] = decode_cursor(cursor, ["student_id"])
+            query["student_id"] = {"$gt": after}
+        records = []
+        for positions in self._rows(query, limit + 1):
+            records.extend(self._records(positions[:limit + 1 - len(records)]))
+            if len(records) > limit:
+                break
+        if len(records) <= limit:
+            return records, None
+        records = records[:limit]
+        return records, encode_cursor([records[-1]["student_id"]])
+
+
+class Archive:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._years: Dict[str, ArchivedYear] = {}
+
+    def years(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.isfile(os.path.join(self.directory, name, MANIFEST))
+        )
+
+    def has(self, year: str) -> bool:
+        return year in self._years or os.path.isfile(os.path.join(self.directory, year, MANIFEST))
+
+    def open(self, year: str) -> ArchivedYear:
+        if year not in self._years:
+            self._years[year] = ArchivedYear(os.path.join(self.directory, year))
+        return self._years[year]
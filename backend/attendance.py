@@ -0,0 +1,514 @@
+"""Attendance storage.
+
+Two interchangeable stores sit behind the attendance routes, selected with
+``ATTENDANCE_STORAGE``:
+
+``records`` (default)
+    One document per student per session in ``attendance``, keyed on
+    (class_id, date, session, student_id), which the unique index in
+    ``indexes.py`` enforces. Submissions are written as upserts that only set
+    fields on insert, so re-submitting a session never overwrites what was
+    recorded first and two concurrent submissions cannot double-insert:
+    whichever arrives second sees its rows reported as conflicts. Every
+    write first claims its sessions in ``attendance_sessions``, unique on
+    (class_id, date, session). With ``whole_sessions`` a submission whose
+    session is already claimed, or already has rows, writes nothing and
+    reports every student as a conflict, so a session is recorded by one
+    submission only, as it is in the compact store.
+
+``compact``
+    One document per (class_id, date, session) in ``attendance_sheets``,
+    holding the roster order and one status bit per student packed into a
+    binary field. A session is read and written as a single document.
+
+Both stores expose the same methods and hand back the same per-student
+record dicts, so routes never see the storage layout. Existing record rows
+are converted with ``python manage.py migrate-attendance``. New rows and
+sheets are stamped with a change sequence number (see ``changes.py``).
+"""
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from bson import Binary
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from changes import Change, ChangeSequence, Tombstones, find_changes
+from pagination import decode_cursor, encode_cursor, fetch_page
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Bit value per status in a packed sheet; the position in this tuple is the code
+SHEET_STATUSES = ("present", "absent")
+
+SESSION_CLAIMS = "attendance_sessions"
+
+RECORD_FIELDS = ["class_id", "date", "session", "student_id", "status", "recorded_at", "recorded_by"]
+
+
+class InvalidStatus(ValueError):
+    pass
+
+
+def attendance_key(class_id: str, date: str, session: str, student_id: str) -> dict:
+    return {"class_id": class_id, "date": date, "session": session, "student_id": student_id}
+
+
+def session_key(class_id: str, date: str, session: str) -> dict:
+    return {"class_id": class_id, "date": date, "session": session}
+
+
+def _new_result(class_id: str, submission) -> dict:
+    return {
+        "class_id": class_id,
+        "date": submission.date,
+        "session": submission.session,
+        "inserted": 0,
+        "conflicts": [],
+        "skipped": []
+    }
+
+
+def _finish_results(results: List[dict]) -> List[dict]:
+    for result in results:
+        if result["skipped"] and not (result["inserted"] or result["conflicts"]):
+            result["status"] = "skipped"
+        elif result["conflicts"] and not result["inserted"]:
+            result["status"] = "conflict"
+        elif result["conflicts"] or result["skipped"]:
+            result["status"] = "partial"
+        else:
+            result["status"] = "submitted"
+    return results
+
+
+async def _bulk_upsert(collection, operations: List[UpdateOne], ordered: bool) -> Tuple[Dict[int, object], int]:
+    """Run the upserts and return (upserted ids by operation index, operations attempted)."""
+    if not operations:
+        return {}, 0
+    try:
+        outcome = await collection.bulk_write(operations, ordered=ordered)
+        return outcome.upserted_ids, len(operations)
+    except BulkWriteError as exc:
+        details = exc.details
+        upserted = {entry["index"]: entry["_id"] for entry in details.get("upserted", [])}
+        for error in details.get("writeErrors", []):
+            # A duplicate key means we lost a race with a concurrent upsert of
+            # the same row, which is reported as a conflict like any other
+            if error["code"] != DUPLICATE_KEY_ERROR:
+                raise
+        attempted = len(operations)
+        if ordered and details.get("writeErrors"):
+            attempted = details["writeErrors"][0]["index"] + 1
+        return upserted, attempted
+
+
+def pack_statuses(statuses: Sequence[str]) -> bytes:
+    packed = bytearray((len(statuses) + 7) // 8)
+    for position, status in enumerate(statuses):
+        try:
+            code = SHEET_STATUSES.index(status)
+        except ValueError:
+            raise InvalidStatus(f"Unknown attendance status: {status}")
+        if code:
+            packed[position >> 3] |= 1 << (position & 7)
+    return bytes(packed)
+
+
+def unpack_statuses(packed: bytes, count: int) -> List[str]:
+    return [SHEET_STATUSES[(packed[position >> 3] >> (position & 7)) & 1] for position in range(count)]
+
+
+def build_sheet(class_id: str, date: str, session: str, records: Sequence[dict], teacher_id: str,
+                recorded_at: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        **session_key(class_id, date, session),
+        "student_ids": [record["student_id"] for record in records],
+        "statuses": Binary(pack_statuses([record["status"] for record in records])),
+        "recorded_at": recorded_at,
+        "recorded_by": teacher_id
+    }
+
+
+def expand_sheet(sheet: dict) -> List[dict]:
+    """Decode a sheet into per-student record dicts, ordered by student_id."""
+    student_ids = sheet["student_ids"]
+    statuses = unpack_statuses(sheet["statuses"], len(student_ids))
+    records = [
+        {
+            "id": f"{sheet['id']}:{student_id}",
+            "class_id": sheet["class_id"],
+            "student_id": student_id,
+            "date": sheet["date"],
+            "session": sheet["session"],
+            "status": status,
+            "recorded_at": sheet["recorded_at"],
+            "recorded_by": sheet["recorded_by"]
+        }
+        for student_id, status in zip(student_ids, statuses)
+    ]
+    records.sort(key=lambda record: record["student_id"])
+    return records
+
+
+async def _change_stamps(sequence: Optional[ChangeSequence], count: int) -> List[dict]:
+    """``change_seq``/``changed_at`` for ``count`` new documents; rows that turn out to conflict leave gaps."""
+    if sequence is None or not count:
+        return [{}] * count
+    first = await sequence.allocate(count)
+    changed_at = datetime.utcnow()
+    return [{"change_seq": first + offset, "changed_at": changed_at} for offset in range(count)]
+
+
+class RecordStore:
+    mode = "records"
+
+    def __init__(self, collection, sequence: Optional[ChangeSequence] = None, claims=None):
+        self.collection = collection
+        self.sequence = sequence
+        self.claims = claims if claims is not None else collection.database[SESSION_CLAIMS]
+
+    async def write_sessions(self, submissions: Sequence, teacher_id: str, ordered: bool = True,
+                             recorded_at: Optional[datetime] = None,
+                             recorded_by: Optional[Sequence[str]] = None,
+                             whole_sessions: bool = False) -> List[dict]:
+        """Write several session submissions as a single ``bulk_write`` of upserts.
+
+        ``submissions`` is a sequence of ``(class_id, AttendanceSubmission)`` pairs.
+        Returns one result per submission with the number of rows inserted and the
+        student ids that were already recorded (conflicts) or, for an ordered
+        write that stopped early, never attempted (skipped). ``recorded_by``
+        gives a teacher per submission when one write mixes several teachers.
+        With ``whole_sessions`` a submission is only written if it claims its
+        session first; otherwise every one of its students is a conflict.
+        """
+        recorded_at = recorded_at or datetime.now()
+        recorded_by = recorded_by or [teacher_id] * len(submissions)
+        results = [_new_result(class_id, submission) for class_id, submission in submissions]
+        claim = str(uuid.uuid4())
+        if whole_sessions:
+            owned = await self._claim_sessions(submissions, claim, recorded_at, recorded_by)
+        else:
+            await self._share_sessions(submissions, recorded_at, recorded_by)
+            owned = set(range(len(submissions)))
+        for position, (_, submission) in enumerate(submissions):
+            if position not in owned:
+                results[position]["conflicts"] = [record["student_id"] for record in submission.attendance_data]
+
+        stamps = await _change_stamps(
+            self.sequence, sum(len(submissions[position][1].attendance_data) for position in owned)
+        )
+        operations = []
+        owners = []  # operation index -> (submission index, student_id)
+        for position, (class_id, submission) in enumerate(submissions):
+            if position not in owned:
+                continue
+            for record in submission.attendance_data:
+                key = attendance_key(class_id, submission.date, submission.session, record["student_id"])
+                operations.append(UpdateOne(
+                    key,
+                    {"$setOnInsert": {
+                        **key,
+                        "id": str(uuid.uuid4()),
+                        "status": record["status"],
+                        "recorded_at": recorded_at,
+                        "recorded_by": recorded_by[position],
+                        **stamps[len(operations)]
+                    }},
+                    upsert=True
+                ))
+                owners.append((position, record["student_id"]))
+
+        try:
+            upserted, attempted = await _bulk_upsert(self.collection, operations, ordered)
+        except Exception:
+            # Hand the sessions back so the submission can be retried
+            if whole_sessions:
+                await self.claims.delete_many({"claim": claim})
+            raise
+        for index, (position, student_id) in enumerate(owners):
+            result = results[position]
+            if index >= attempted:
+                result["skipped"].append(student_id)
+            elif index in upserted:
+                result["inserted"] += 1
+            else:
+                result["conflicts"].append(student_id)
+        return _finish_results(results)
+
+    def _claim_documents(self, submissions: Sequence, recorded_at: datetime,
+                         recorded_by: Sequence[str]) -> List[dict]:
+        return [
+            {**session_key(class_id, submission.date, submission.session),
+             "claimed_at": recorded_at, "claimed_by": recorded_by[position]}
+            for position, (class_id, submission) in enumerate(submissions)
+        ]
+
+    async def _claim_sessions(self, submissions: Sequence, claim: str, recorded_at: datetime,
+                              recorded_by: Sequence[str]) -> Set[int]:
+        """Claim each submission's session before any row is written; return the positions claimed.
+
+        The unique index on the claims lets one submission per session through,
+        however the writes interleave, so nothing written ever has to be taken
+        back. Sessions recorded before claims existed have rows but no claim,
+        so a fresh claim is only kept as ownership if the session is empty.
+        """
+        if not submissions:
+            return set()
+        documents = [{**document, "claim": claim}
+                     for document in self._claim_documents(submissions, recorded_at, recorded_by)]
+        claimed = set(range(len(submissions)))
+        try:
+            await self.claims.bulk_write([InsertOne(document) for document in documents], ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details.get("writeErrors", []):
+                if error["code"] != DUPLICATE_KEY_ERROR:
+                    raise
+                claimed.discard(error["index"])
+        if not claimed:
+            return claimed
+        recorded = self.collection.aggregate([
+            {"$match": {"$or": [session_key(documents[position]["class_id"], documents[position]["date"],
+                                            documents[position]["session"]) for position in sorted(claimed)]}},
+            {"$group": {"_id": {"class_id": "$class_id", "date": "$date", "session": "$session"}}}
+        ])
+        existing = {(entry["_id"]["class_id"], entry["_id"]["date"], entry["_id"]["session"])
+                    async for entry in recorded}
+        return {position for position in claimed
+                if (documents[position]["class_id"], documents[position]["date"],
+                    documents[position]["session"]) not in existing}
+
+    async def _share_sessions(self, submissions: Sequence, recorded_at: datetime, recorded_by: Sequence[str]):
+        """Claim the sessions of a batch write without owning them.
+
+        Batch writes keep their per-student conflicts, but the claim stops a
+        whole-session write that arrives later from treating the session as free.
+        """
+        if not submissions:
+            return
+        operations = [
+            UpdateOne(session_key(document["class_id"], document["date"], document["session"]),
+                      {"$setOnInsert": document}, upsert=True)
+            for document in self._claim_documents(submissions, recorded_at, recorded_by)
+        ]
+        await _bulk_upsert(self.claims, operations, ordered=False)
+
+    def validate(self, submission):
+        """Raise ``InvalidStatus`` now for anything ``write_sessions`` would reject later."""
+
+    async def session_records(self, class_id: str, date: str, session: str, limit: int,
+                              cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        return await fetch_page(
+            self.collection, session_key(class_id, date, session), ["student_id"], limit, cursor, {"_id": 0}
+        )
+
+    def day_lookup(self, date: str, as_field: str) -> dict:
+        """``$lookup`` stage joining a class to its attendance counts for ``date``.
+
+        Combines ``localField``/``foreignField`` with a ``pipeline``, which
+        needs MongoDB 5.0 or later; the join key then uses the session index.
+        """
+        return {"$lookup": {
+            "from": self.collection.name,
+            "localField": "id",
+            "foreignField": "class_id",
+            "pipeline": [
+                {"$match": {"date": date}},
+                {"$group": {"_id": {"session": "$session", "status": "$status"}, "count": {"$sum": 1}}}
+            ],
+            "as": as_field
+        }}
+
+    @staticmethod
+    def day_counts(entries: List[dict]) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for entry in entries:
+            session = counts.setdefault(entry["_id"]["session"], {"present": 0, "absent": 0})
+            session[entry["_id"]["status"]] = session.get(entry["_id"]["status"], 0) + entry["count"]
+        return counts
+
+    async def iter_records(self, query: dict, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield records matching a class_id/date/session filter in key order."""
+        cursor = self.collection.find(query, {"_id": 0, **{field: 1 for field in RECORD_FIELDS}})
+        cursor = cursor.sort([("class_id", 1), ("date", 1), ("session", 1), ("student_id", 1)]).batch_size(batch_size)
+        async for record in cursor:
+            yield record
+
+    async def changes(self, class_ids, since: int, limit: int) -> List[Change]:
+        """Records of ``class_ids`` written after change ``since``, one change per record."""
+        return await find_changes(
+            self.collection, {"class_id": {"$in": list(class_ids)}}, since, limit,
+            {"id": 1, "change_seq": 1, "changed_at": 1, **{field: 1 for field in RECORD_FIELDS}}
+        )
+
+
+class SheetStore:
+    mode = "compact"
+
+    def __init__(self, collection, sequence: Optional[ChangeSequence] = None):
+        self.collection = collection
+        self.sequence = sequence
+
+    async def write_sessions(self, submissions: Sequence, teacher_id: str, ordered: bool = True,
+                             recorded_at: Optional[datetime] = None,
+                             recorded_by: Optional[Sequence[str]] = None,
+                             whole_sessions: bool = False) -> List[dict]:
+        """Write one sheet per submission as a single ``bulk_write`` of upserts.
+
+        A sheet is written whole: if one already exists for the session, every
+        student of the submission is reported as a conflict, so
+        ``whole_sessions`` changes nothing here.
+        """
+        recorded_at = recorded_at or datetime.now()
+        recorded_by = recorded_by or [teacher_id] * len(submissions)
+        stamps = await _change_stamps(self.sequence, len(submissions))
+        operations = [
+            UpdateOne(
+                session_key(class_id, submission.date, submission.session),
+                {"$setOnInsert": {**build_sheet(
+                    class_id, submission.date, submission.session, submission.attendance_data, teacher, recorded_at
+                ), **stamp}},
+                upsert=True
+            )
+            for (class_id, submission), teacher, stamp in zip(submissions, recorded_by, stamps)
+        ]
+
+        results = [_new_result(class_id, submission) for class_id, submission in submissions]
+        upserted, attempted = await _bulk_upsert(self.collection, operations, ordered)
+        for index, (result, (_, submission)) in enumerate(zip(results, submissions)):
+            student_ids = [record["student_id"] for record in submission.attendance_data]
+            if index >= attempted:
+                result["skipped"] = student_ids
+            elif index in upserted:
+                result["inserted"] = len(student_ids)
+            else:
+                result["conflicts"] = student_ids
+        return _finish_results(results)
+
+    def validate(self, submission):
+        pack_statuses([record["status"] for record in submission.attendance_data])
+
+    async def session_records(self, class_id: str, date: str, session: str, limit: int,
+                              cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        sheet = await self.collection.find_one(session_key(class_id, date, session), {"_id": 0})
+        records = expand_sheet(sheet) if sheet else []
+        if cursor:
+            [after] = decode_cursor(cursor, ["student_id"])
+            records = [record for record in records if record["student_id"] > after]
+        if len(records) <= limit:
+            return records, None
+        records = records[:limit]
+        return records, encode_cursor([records[-1]["student_id"]])
+
+    def day_lookup(self, date: str, as_field: str) -> dict:
+        """``$lookup`` stage joining a class to its sheets for ``date``.
+
+        Combines ``localField``/``foreignField`` with a ``pipeline``, which
+        needs MongoDB 5.0 or later; the join key then uses the session index.
+        """
+        return {"$lookup": {
+            "from": self.collection.name,
+            "localField": "id",
+            "foreignField": "class_id",
+            "pipeline": [
+                {"$match": {"date": date}},
+                {"$project": {"_id": 0, "session": 1, "statuses": 1, "count": {"$size": "$student_ids"}}}
+            ],
+            "as": as_field
+        }}
+
+    @staticmethod
+    def day_counts(entries: List[dict]) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for entry in entries:
+            # Absent students are the set bits; padding bits are always zero
+            absent = int.from_bytes(entry["statuses"], "little").bit_count()
+            counts[entry["session"]] = {"present": entry["count"] - absent, "absent": absent}
+        return counts
+
+    async def iter_records(self, query: dict, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield records matching a class_id/date/session filter in key order."""
+        cursor = self.collection.find(query, {"_id": 0})
+        cursor = cursor.sort([("class_id", 1), ("date", 1), ("session", 1)]).batch_size(max(1, batch_size // 25))
+        async for sheet in cursor:
+            for record in expand_sheet(sheet):
+                record.pop("id")
+                yield record
+
+    async def changes(self, class_ids, since: int, limit: int) -> List[Change]:
+        """Sheets of ``class_ids`` written after change ``since``, one change per sheet."""
+        changes = await find_changes(self.collection, {"class_id": {"$in": list(class_ids)}}, since, limit)
+        return [(change_seq, changed_at, expand_sheet(sheet)) for change_seq, changed_at, [sheet] in changes]
+
+
+def get_attendance_store(db, mode: str = "records"):
+    if mode == "records":
+        return RecordStore(db.attendance, ChangeSequence(db.counters), db[SESSION_CLAIMS])
+    if mode == "compact":
+        return SheetStore(db.attendance_sheets, ChangeSequence(db.counters))
+    raise ValueError(f"Unknown attendance storage mode: {mode}")
+
+
+async def migrate_records_to_sheets(db, delete_source: bool = False, batch_size: int = 500,
+                                    tombstones: Optional[Tombstones] = None) -> Dict[str, int]:
+    """Fold per-student attendance rows into one packed sheet per session.
+
+    Sessions that already have a sheet are left alone. Rows are only deleted
+    once every sheet has been written, and only with ``delete_source``. Sheet
+    records carry new ids, so every deleted row is tombstoned for sync clients.
+    """
+    pipeline = [
+        {"$sort": {"class_id": 1, "date": 1, "session": 1, "student_id": 1}},
+        {"$group": {
+            "_id": {"class_id": "$class_id", "date": "$date", "session": "$session"},
+            "records": {"$push": {"student_id": "$student_id", "status": "$status"}},
+            "recorded_at": {"$min": "$recorded_at"},
+            "recorded_by": {"$first": "$recorded_by"}
+        }}
+    ]
+    counts = {"sessions": 0, "sheets_written": 0, "records_deleted": 0}
+    sequence = ChangeSequence(db.counters)
+    sheets = []
+
+    async def flush():
+        if sheets:
+            # Sheets are new documents to sync clients, whatever the rows they replace carried
+            await sequence.stamp(sheets)
+            operations = [
+                UpdateOne(session_key(sheet["class_id"], sheet["date"], sheet["session"]), {"$setOnInsert": sheet},
+                          upsert=True)
+                for sheet in sheets
+            ]
+            outcome = await db.attendance_sheets.bulk_write(operations, ordered=False)
+            counts["sheets_written"] += outcome.upserted_count
+            sheets.clear()
+
+    async for group in db.attendance.aggregate(pipeline, allowDiskUse=True):
+        key = group["_id"]
+        sheets.append(build_sheet(
+            key["class_id"], key["date"], key["session"], group["records"], group["recorded_by"], group["recorded_at"]
+        ))
+        counts["sessions"] += 1
+        if len(sheets) >= batch_size:
+            await flush()
+    await flush()
+
+    if delete_source:
+        tombstones = tombstones or Tombstones(db.tombstones, sequence)
+        rows = []
+
+        async def delete():
+            await tombstones.record("attendance", rows)
+            outcome = await db.attendance.delete_many({"_id": {"$in": [row["_id"] for row in rows]}})
+            counts["records_deleted"] += outcome.deleted_count
+            rows.clear()
+
+        async for row in db.attendance.find({}, {"_id": 1, "id": 1, "class_id": 1}).batch_size(batch_size):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                await delete()
+        if rows:
+            await delete()
+    return counts
@@ -0,0 +1,300 @@
+"""Load and latency benchmarks for the attendance API.
+
+Seeds a local MongoDB with a configurable school, then drives concurrent
+async clients through the flows that hurt in production:
+
+``login``   every teacher logging in at once (bcrypt bound)
+``roster``  class list followed by a class roster
+``submit``  attendance submission for a fresh session
+
+The app runs either in-process (ASGI transport, no network) or under uvicorn
+with N workers. Results are written as JSON with per-route p50/p95/p99
+latency and requests/sec, and ``compare`` checks a report against a saved
+baseline. Run from the backend directory::
+
+    python -m benchmarks.load run --teachers 50 --requests 2000 --out report.json
+    python -m benchmarks.load compare report.json baseline.json
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+import typer
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from datagen import SchoolGenerator, SchoolSpec, write_school
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PASSWORD = "password123"
+FLOWS = ("login", "roster", "submit")
+
+cli = typer.Typer(help="Attendance API load benchmarks")
+
+
+async def seed(mongo_url: str, db_name: str, teachers: int, classes_per_teacher: int, students_per_class: int,
+               attendance_days: int, seed_value: int) -> List[dict]:
+    """Reset ``db_name`` and fill it with a generated school; returns the teacher logins.
+
+    Attendance is written in the layout selected by ``ATTENDANCE_STORAGE``.
+    """
+    client = AsyncIOMotorClient(mongo_url)
+    await client.drop_database(db_name)
+    today = date.today()
+    spec = SchoolSpec(
+        teachers=teachers,
+        classes=teachers * classes_per_teacher,
+        students=teachers * classes_per_teacher * students_per_class,
+        start_date=today - timedelta(days=attendance_days) if attendance_days else None,
+        end_date=today - timedelta(days=1) if attendance_days else None,
+        password=PASSWORD,
+        seed=seed_value
+    )
+    generator = SchoolGenerator(spec)
+    await write_school(
+        client[db_name], generator, storage=os.environ.get("ATTENDANCE_STORAGE", "records"),
+        partitioning=os.environ.get("ATTENDANCE_PARTITIONING", "none")
+    )
+    client.close()
+    return [{"username": teacher["username"], "id": teacher["id"]} for teacher in generator.teacher_docs]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        begin = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            samples = np.array(self.latencies.get(route, []), dtype=float) * 1000
+            routes[route] = {
+                "count": int(samples.size),
+                "errors": self.errors.get(route, 0),
+                "rps": round(samples.size / elapsed, 2) if elapsed else 0.0,
+                "mean_ms": round(float(samples.mean()), 3) if samples.size else None,
+                "p50_ms": round(float(np.percentile(samples, 50)), 3) if samples.size else None,
+                "p95_ms": round(float(np.percentile(samples, 95)), 3) if samples.size else None,
+                "p99_ms": round(float(np.percentile(samples, 99)), 3) if samples.size else None
+            }
+        return {"elapsed_s": round(elapsed, 3), "routes": routes}
+
+
+async def login(client: httpx.AsyncClient, recorder: Recorder, username: str) -> Optional[str]:
+    response = await recorder.request(
+        client, "POST /api/auth/login", "POST", "/api/auth/login", json={"username": username, "password": PASSWORD}
+    )
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()["access_token"]
+
+
+async def run_flow(flow: str, client: httpx.AsyncClient, recorder: Recorder, teachers: List[dict],
+                   requests: int, concurrency: int):
+    tokens: Dict[str, str] = {}
+    if flow != "login":
+        # Authenticate once per teacher outside the measured routes
+        warmup = Recorder()
+        for teacher in teachers[:concurrency]:
+            tokens[teacher["username"]] = await login(client, warmup, teacher["username"])
+        recorder.started = time.perf_counter()
+    remaining = iter(range(requests))
+    submit_day = date.today()
+
+    async def worker(worker_id: int):
+        teacher = teachers[worker_id % len(teachers)]
+        headers = {"Authorization": f"Bearer {tokens.get(teacher['username'])}"}
+        for index in remaining:
+            if flow == "login":
+                await login(client, recorder, teachers[index % len(teachers)]["username"])
+                continue
+            response = await recorder.request(client, "GET /api/classes", "GET", "/api/classes", headers=headers)
+            if response is None or response.status_code != 200 or not response.json():
+                continue
+            class_doc = random.choice(response.json())
+            students = await recorder.request(
+                client, "GET /api/classes/{class_id}/students", "GET",
+                f"/api/classes/{class_doc['id']}/students", headers=headers
+            )
+            if flow == "submit" and students is not None and students.status_code == 200:
+                day = (submit_day + timedelta(days=1 + index)).isoformat()
+                await recorder.request(
+                    client, "POST /api/classes/{class_id}/attendance", "POST",
+                    f"/api/classes/{class_doc['id']}/attendance", headers=headers,
+                    json={
+                        "class_id": class_doc["id"],
+                        "date": day,
+                        "session": "morning",
+                        "attendance_data": [
+                            {"student_id": student["id"], "status": "present"} for student in students.json()
+                        ]
+                    }
+                )
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+
+async def drive(base_url: Optional[str], flows: List[str], teachers: List[dict], requests: int,
+                concurrency: int) -> dict:
+    results = {}
+    if base_url:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await run_flows(client, flows, teachers, requests, concurrency, results)
+        return results
+
+    from server import create_app
+    app = create_app()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+    async with app.router.lifespan_context(app), client:
+        await run_flows(client, flows, teachers, requests, concurrency, results)
+    return results
+
+
+async def run_flows(client: httpx.AsyncClient, flows: List[str], teachers: List[dict], requests: int,
+                    concurrency: int, results: dict):
+    for flow in flows:
+        recorder = Recorder()
+        await run_flow(flow, client, recorder, teachers, requests, concurrency)
+        recorder.finished = time.perf_counter()
+        results[flow] = recorder.report()
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+@cli.command()
+def run(
+    out: Path = typer.Option(Path("bench_report.json"), help="Where to write the JSON report"),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="Local mongod to benchmark against"),
+    db_name: str = typer.Option("attendance_bench", help="Database to (re)create for the run"),
+    teachers: int = typer.Option(20),
+    classes_per_teacher: int = typer.Option(3),
+    students_per_class: int = typer.Option(30),
+    attendance_days: int = typer.Option(20),
+    requests: int = typer.Option(500, help="Requests per flow"),
+    concurrency: int = typer.Option(50, help="Concurrent clients"),
+    flow: List[str] = typer.Option(list(FLOWS), help="Flows to run, in order"),
+    workers: int = typer.Option(0, help="Run under uvicorn with this many workers; 0 runs in-process"),
+    port: int = typer.Option(8765),
+    seed_value: int = typer.Option(1234, "--seed", help="Random seed for generated data"),
+):
+    """Seed a school, run the flows and write the latency report."""
+    unknown = set(flow) - set(FLOWS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown flows: {', '.join(sorted(unknown))}")
+    random.seed(seed_value)
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["ATTENDANCE_DB_NAME"] = db_name
+
+    logins = asyncio.run(
+        seed(mongo_url, db_name, teachers, classes_per_teacher, students_per_class, attendance_days, seed_value)
+    )
+    typer.echo(f"Seeded {teachers} teachers, {teachers * classes_per_teacher} classes, "
+               f"{teachers * classes_per_teacher * students_per_class} students")
+
+    process = None
+    base_url = None
+    if workers:
+        base_url = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "server:create_app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=dict(os.environ)
+        )
+    try:
+        if process:
+            wait_until_ready(base_url, process)
+        results = asyncio.run(drive(base_url, flow, logins, requests, concurrency))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "mode": f"uvicorn x{workers}" if workers else "in-process",
+            "python": platform.python_version(),
+            "teachers": teachers,
+            "classes_per_teacher": classes_per_teacher,
+            "students_per_class": students_per_class,
+            "attendance_days": attendance_days,
+            "requests_per_flow": requests,
+            "concurrency": concurrency,
+            "attendance_storage": os.environ.get("ATTENDANCE_STORAGE", "records")
+        },
+        "flows": results
+    }
+    out.write_text(json.dumps(report, indent=2))
+    for flow_name, flow_report in results.items():
+        for route, stats in flow_report["routes"].items():
+            typer.echo(f"{flow_name:7} {route:45} {stats['rps']:>9} req/s  p50 {stats['p50_ms']} ms  "
+                       f"p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms  errors {stats['errors']}")
+    typer.echo(f"Report written to {out}")
+
+
+@cli.command()
+def compare(
+    report: Path,
+    baseline: Path,
+    tolerance: float = typer.Option(0.15, help="Allowed relative regression in p95 latency and req/s"),
+):
+    """Fail if any route's p95 latency or throughput regressed past the tolerance."""
+    current = json.loads(report.read_text())["flows"]
+    reference = json.loads(baseline.read_text())["flows"]
+    regressions = []
+    for flow_name, flow_report in reference.items():
+        for route, before in flow_report["routes"].items():
+            after = current.get(flow_name, {}).get("routes", {}).get(route)
+            if after is None:
+                regressions.append(f"{flow_name} {route}: missing from report")
+                continue
+            if before["p95_ms"] and after["p95_ms"] and after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{flow_name} {route}: p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+            if before["rps"] and after["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(f"{flow_name} {route}: {before['rps']} -> {after['rps']} req/s")
+    for regression in regressions:
+        typer.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        raise typer.Exit(code=1)
+    typer.echo("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    cli()
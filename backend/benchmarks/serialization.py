@@ -0,0 +1,95 @@
+"""Per-request serialization cost for list responses.
+
+Compares the old path (full documents with an ObjectId ``_id``, a Python loop
+converting it to ``str``, ``jsonable_encoder`` and the stdlib ``JSONResponse``)
+with the current one (``_id`` projected away, the typed response model, and
+``ORJSONResponse`` or its stdlib fallback). Run from the backend directory::
+
+    python -m benchmarks.serialization --sizes 100 --sizes 1000 --sizes 10000
+"""
+import statistics
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, List
+
+import typer
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from server import AttendanceRecord, DefaultResponse
+
+
+def make_records(count: int, with_object_id: bool) -> List[dict]:
+    class_id = str(uuid.uuid4())
+    records = []
+    for index in range(count):
+        record = {
+            "id": str(uuid.uuid4()),
+            "class_id": class_id,
+            "student_id": str(uuid.uuid4()),
+            "date": "2024-10-01",
+            "session": "morning",
+            "status": "absent" if index % 7 == 0 else "present",
+            "recorded_at": datetime(2024, 10, 1, 8, 15),
+            "recorded_by": str(uuid.uuid4())
+        }
+        if with_object_id:
+            record["_id"] = ObjectId()
+        records.append(record)
+    return records
+
+
+def legacy_path(records: List[dict]) -> bytes:
+    for record in records:
+        if "_id" in record:
+            record["_id"] = str(record["_id"])
+    return JSONResponse(jsonable_encoder(records)).body
+
+
+adapter = TypeAdapter(List[AttendanceRecord])
+
+
+def typed_path(response_class) -> Callable[[List[dict]], bytes]:
+    def serialize(records: List[dict]) -> bytes:
+        # Mirrors FastAPI's response_model handling: validate, dump to JSON types, render
+        content = adapter.dump_python(adapter.validate_python(records), mode="json")
+        return response_class(content).body
+    return serialize
+
+
+def measure(serialize: Callable[[List[dict]], bytes], size: int, with_object_id: bool, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        records = make_records(size, with_object_id)
+        started = time.perf_counter()
+        serialize(records)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+cli = typer.Typer(help="Response serialization benchmarks")
+
+
+@cli.command()
+def run(
+    sizes: List[int] = typer.Option([100, 1000, 10000], help="Documents per response; repeat for several"),
+    repeat: int = typer.Option(15, help="Timed runs per size and variant"),
+):
+    """Median time to serialize one list response, per variant and size."""
+    variants = [
+        ("legacy: _id loop + jsonable_encoder + JSONResponse", legacy_path, True),
+        ("typed model + JSONResponse", typed_path(JSONResponse), False),
+        (f"typed model + {DefaultResponse.__name__}", typed_path(DefaultResponse), False),
+    ]
+    typer.echo(f"{'documents':>10}  {'variant':55} {'median ms':>10} {'us/doc':>8}")
+    for size in sizes:
+        for name, serialize, with_object_id in variants:
+            elapsed = measure(serialize, size, with_object_id, repeat)
+            typer.echo(f"{size:>10}  {name:55} {elapsed:>10.3f} {1000 * elapsed / size:>8.2f}")
+
+
+if __name__ == "__main__":
+    cli()
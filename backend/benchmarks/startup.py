@@ -0,0 +1,156 @@
+"""Worker startup time: import plus first request.
+
+Every uvicorn worker, and every restart, pays for importing the app and for
+whatever its first request has to set up before it serves at full speed.
+Each run starts a fresh interpreter against a running MongoDB and records:
+
+``import``          ``import server`` and ``create_app()``, which does no I/O
+``startup``         the lifespan startup (schools listed in ``WARM_SCHOOLS``)
+``first_request``   the first request, ``GET /health/ready`` by default, which
+                    connects and opens the default school
+``second_request``  the same request again, what every later one costs
+
+The command fails when the median of import + startup + first request is over
+the budget. Run from the backend directory::
+
+    python -m benchmarks.startup --runs 10 --budget-ms 1500
+    python -m benchmarks.startup --slowest-imports 15 --out startup.json
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PHASES = ("import", "startup", "first_request", "second_request")
+
+# Runs in the fresh interpreter: nothing but the stdlib is imported before the server
+PROBE = """
+import time
+started = time.perf_counter()
+import server
+app = server.create_app()
+imported = time.perf_counter()
+import asyncio, json, sys
+import httpx
+
+async def main(path):
+    before_startup = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+            first = await client.get(path)
+            answered = time.perf_counter()
+            await client.get(path)
+            again = time.perf_counter()
+    print(json.dumps({
+        "status": first.status_code,
+        "import": imported - started,
+        "startup": ready - before_startup,
+        "first_request": answered - ready,
+        "second_request": again - answered,
+    }))
+
+asyncio.run(main(sys.argv[1]))
+"""
+
+cli = typer.Typer(help="Worker startup time benchmarks")
+
+
+def probe(path: str, env: Dict[str, str], importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE, path]
+    return subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120)
+
+
+def slowest_imports(stderr: str, count: int) -> List[tuple]:
+    """The modules ``server`` imports directly, by cumulative time, from ``-X importtime`` output."""
+    children, imported_by_server = [], []
+    for line in stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        # Nesting is two spaces per level; a module is listed after everything it imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(fields[1]) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == "server":
+                imported_by_server = children
+            children = []
+    return sorted(imported_by_server, reverse=True)[:count]
+
+
+@cli.command()
+def run(
+    runs: int = typer.Option(5, help="Fresh interpreters to measure"),
+    warmup: int = typer.Option(1, help="Unmeasured runs first, so .pyc files are written"),
+    budget_ms: float = typer.Option(2000.0, help="Budget for the median import + startup + first request"),
+    path: str = typer.Option("/health/ready", help="The first request"),
+    mongo_url: Optional[str] = typer.Option(None, help="MongoDB to connect to; MONGO_URL by default"),
+    slowest_imports_count: int = typer.Option(0, "--slowest-imports", help="Also list the N slowest imports"),
+    out: Optional[Path] = typer.Option(None, help="Write the results as JSON"),
+):
+    """Measure worker startup in fresh interpreters and check it against the budget."""
+    env = dict(os.environ)
+    if mongo_url:
+        env["MONGO_URL"] = mongo_url
+
+    samples: Dict[str, List[float]] = {phase: [] for phase in PHASES + ("total", "process")}
+    for index in range(warmup + runs):
+        launched = time.perf_counter()
+        result = probe(path, env)
+        elapsed = time.perf_counter() - launched
+        if result.returncode != 0:
+            typer.echo(result.stderr, err=True)
+            raise typer.Exit(code=2)
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        if timings["status"] >= 400:
+            typer.echo(f"{path} answered {timings['status']}; is MongoDB running?", err=True)
+            raise typer.Exit(code=2)
+        if index < warmup:
+            continue
+        for phase in PHASES:
+            samples[phase].append(timings[phase] * 1000)
+        samples["total"].append(sum(timings[phase] for phase in PHASES[:3]) * 1000)
+        samples["process"].append(elapsed * 1000)
+
+    report = {
+        "meta": {"runs": runs, "path": path, "budget_ms": budget_ms, "python": sys.version.split()[0]},
+        "phases": {
+            phase: {
+                "p50_ms": round(float(np.percentile(values, 50)), 2),
+                "max_ms": round(max(values), 2)
+            }
+            for phase, values in samples.items()
+        }
+    }
+    for phase, stats in report["phases"].items():
+        typer.echo(f"{phase:15} p50 {stats['p50_ms']:>9} ms  max {stats['max_ms']:>9} ms")
+
+    if slowest_imports_count:
+        result = probe(path, env, importtime=True)
+        report["slowest_imports"] = [
+            {"module": name, "ms": round(ms, 2)} for ms, name in slowest_imports(result.stderr, slowest_imports_count)
+        ]
+        for entry in report["slowest_imports"]:
+            typer.echo(f"import {entry['module']:40} {entry['ms']:>9} ms")
+    if out:
+        out.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Report written to {out}")
+
+    total = report["phases"]["total"]["p50_ms"]
+    if total > budget_ms:
+        typer.echo(f"OVER BUDGET import + startup + first request {total} ms > {budget_ms} ms", err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"Within budget: {total} ms <= {budget_ms} ms")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,108 @@
+"""In-process caches for per-request authorization lookups.
+
+``TTLCache`` is a small LRU with per-entry expiry. ``AuthorizationCache``
+builds on it to remember which classes each teacher owns and each teacher's
+public profile, so class routes can skip the ownership round-trip to Mongo.
+
+Each worker process holds its own cache; nothing is shared between workers.
+Writes made inside a worker call the matching ``invalidate_*`` hook on that
+worker's cache. Writes from anywhere else (other workers, ``manage.py``,
+``datagen.py``) cannot reach it and are picked up when the entries expire,
+after ``AUTH_CACHE_TTL`` seconds at most.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def items(self):
+        now = self.clock()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class AuthorizationCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.owned_classes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.profiles = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_owned_classes(self, teacher_id: str) -> Optional[FrozenSet[str]]:
+        return self.owned_classes.get(teacher_id)
+
+    def set_owned_classes(self, teacher_id: str, class_ids) -> FrozenSet[str]:
+        class_ids = frozenset(class_ids)
+        self.owned_classes.set(teacher_id, class_ids)
+        return class_ids
+
+    def get_profile(self, teacher_id: str) -> Optional[dict]:
+        return self.profiles.get(teacher_id)
+
+    def set_profile(self, teacher_id: str, profile: dict):
+        self.profiles.set(teacher_id, profile)
+
+    # Invalidation hooks
+    def invalidate_teacher(self, teacher_id: str):
+        self.owned_classes.pop(teacher_id)
+        self.profiles.pop(teacher_id)
+
+    def invalidate_class(self, class_id: str):
+        for teacher_id, class_ids in self.owned_classes.items():
+            if class_id in class_ids:
+                self.owned_classes.pop(teacher_id)
+
+    def class_reassigned(self, class_id: str, old_teacher_id: Optional[str], new_teacher_id: Optional[str]):
+        self.invalidate_class(class_id)
+        for teacher_id in (old_teacher_id, new_teacher_id):
+            if teacher_id:
+                self.owned_classes.pop(teacher_id)
+
+    def clear(self):
+        self.owned_classes.clear()
+        self.profiles.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"owned_classes": self.owned_classes.stats(), "profiles": self.profiles.stats()}
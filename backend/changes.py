@@ -0,0 +1,177 @@
+"""Change sequence numbers and delta sync.
+
+Every write to classes, students and attendance stamps the documents it
+creates or changes with ``change_seq``, taken from a per-school counter (the
+``changes`` document in ``counters``, advanced by one ``$inc`` per write
+batch), and ``changed_at``. Deletions leave a tombstone in ``tombstones``
+with a sequence number of its own. ``GET /api/sync?since=`` then returns what
+a teacher can see that changed after ``since``, in sequence order, so a client
+keeping a local copy pulls only the difference.
+
+Numbers are allocated before the write commits, so a sync running alongside
+two writes could see 12 before 11 is visible and step over 11. Sync therefore
+only serves changes older than ``settle`` seconds; a write that takes longer
+than that to commit can still be missed by a client syncing in between.
+
+Tombstones expire after a retention period. Resume tokens carry the time up
+to which the client is known to be complete, and a client whose token is
+older than the retention gets ``reset`` and must rebuild from ``since=0``.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# One change: (change_seq, changed_at, documents). A compact attendance sheet
+# is one change carrying a record per student.
+Change = Tuple[int, datetime, List[dict]]
+
+
+class ChangeSequence:
+    def __init__(self, counters, name: str = "changes"):
+        self.counters = counters
+        self.name = name
+
+    async def allocate(self, count: int = 1) -> int:
+        """Reserve ``count`` consecutive sequence numbers and return the first."""
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.name}, {"$inc": {"seq": count}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"] - count + 1
+
+    async def current(self) -> int:
+        counter = await self.counters.find_one({"_id": self.name})
+        return counter["seq"] if counter else 0
+
+    async def stamp(self, documents: Sequence[dict]) -> Sequence[dict]:
+        """Give each document its own sequence number, in place."""
+        if documents:
+            first = await self.allocate(len(documents))
+            changed_at = datetime.utcnow()
+            for offset, document in enumerate(documents):
+                document["change_seq"] = first + offset
+                document["changed_at"] = changed_at
+        return documents
+
+    async def next_stamp(self) -> dict:
+        """Fields to ``$set`` alongside an update."""
+        return {"change_seq": await self.allocate(), "changed_at": datetime.utcnow()}
+
+
+async def find_changes(collection, query: dict, since: int, limit: int,
+                       projection: Optional[dict] = None) -> List[Change]:
+    """The first ``limit`` documents of ``query`` changed after ``since``, one change each."""
+    cursor = collection.find({**query, "change_seq": {"$gt": since}}, {"_id": 0, **(projection or {})})
+    documents = await cursor.sort("change_seq", 1).limit(limit).to_list(limit)
+    return [(document["change_seq"], document.pop("changed_at"), [document]) for document in documents]
+
+
+async def stamp_existing(collection, sequence: ChangeSequence, batch_size: int = 1000) -> int:
+    """Stamp documents written before change sequences existed, so a sync from 0 includes them."""
+    stamped = 0
+    ids = []
+
+    async def flush():
+        first = await sequence.allocate(len(ids))
+        changed_at = datetime.utcnow()
+        await collection.bulk_write([
+            UpdateOne({"_id": _id, "change_seq": {"$exists": False}},
+                      {"$set": {"change_seq": first + offset, "changed_at": changed_at}})
+            for offset, _id in enumerate(ids)
+        ], ordered=False)
+        ids.clear()
+
+    async for document in collection.find({"change_seq": {"$exists": False}}, {"_id": 1}).batch_size(batch_size):
+        ids.append(document["_id"])
+        stamped += 1
+        if len(ids) >= batch_size:
+            await flush()
+    if ids:
+        await flush()
+    return stamped
+
+
+class Tombstones:
+    """Deleted classes, students and attendance, kept for ``ttl`` seconds so replicas can drop them."""
+
+    def __init__(self, collection, sequence: ChangeSequence, ttl: float = 30 * 86400.0):
+        self.collection = collection
+        self.sequence = sequence
+        self.ttl = ttl
+
+    async def record(self, kind: str, documents: Sequence[dict]):
+        """Tombstone deleted ``documents``; each needs ``id`` and the ``class_id`` or ``teacher_id`` it belonged to."""
+        tombstones = [
+            {
+                "kind": kind,
+                "id": document["id"],
+                "class_id": document.get("class_id"),
+                "teacher_id": document.get("teacher_id")
+            }
+            for document in documents
+        ]
+        if not tombstones:
+            return
+        await self.sequence.stamp(tombstones)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        for tombstone in tombstones:
+            tombstone["expires_at"] = expires_at
+        await self.collection.insert_many(tombstones)
+
+    async def changes(self, class_ids, teacher_id: str, since: int, limit: int) -> List[Change]:
+        query = {"$or": [{"class_id": {"$in": list(class_ids)}}, {"teacher_id": teacher_id}]}
+        return await find_changes(
+            self.collection, query, since, limit, {"kind": 1, "id": 1, "class_id": 1, "change_seq": 1, "changed_at": 1}
+        )
+
+
+def parse_since(since: str) -> Tuple[int, Optional[float]]:
+    """``since`` is a bare sequence number or the ``resume_token`` of a previous sync."""
+    if since.isdigit():
+        return int(since), None
+    seq, complete_until = decode_cursor(since, ["change_seq", "complete_until"])
+    if not isinstance(seq, int) or not isinstance(complete_until, (int, float)):
+        raise InvalidCursor("Malformed resume token")
+    return seq, complete_until
+
+
+async def collect_changes(sources: Dict[str, Callable[[int, int], Awaitable[List[Change]]]], since: str, limit: int,
+                          settle: float, retention: float) -> dict:
+    """Merge the changes of every source after ``since`` into one page of at most ``limit`` changes."""
+    seq, complete_until = parse_since(since)
+    now = datetime.utcnow()
+    if complete_until is not None and now.timestamp() - complete_until > retention:
+        return {"reset": True, "since": seq, "resume_token": None, "has_more": False}
+
+    # Each source's first limit + 1 changes are enough to know the global first limit and whether more exist
+    fetched = await asyncio.gather(*(fetch(seq, limit + 1) for fetch in sources.values()))
+    pending = sorted(
+        ((change_seq, changed_at, documents, kind)
+         for kind, changes in zip(sources, fetched) for change_seq, changed_at, documents in changes),
+        key=lambda change: change[0]
+    )
+
+    cutoff = now - timedelta(seconds=settle)
+    page: Dict[str, List[dict]] = {kind: [] for kind in sources}
+    last_seq, last_changed_at, taken, has_more = seq, None, 0, False
+    for change_seq, changed_at, documents, kind in pending:
+        if changed_at > cutoff:
+            break
+        if taken == limit:
+            has_more = True
+            break
+        page[kind].extend(documents)
+        last_seq, last_changed_at, taken = change_seq, changed_at, taken + 1
+
+    # Once nothing settled is left, the client is complete up to the cutoff
+    horizon = last_changed_at if has_more else cutoff
+    return {
+        "reset": False,
+        "since": seq,
+        "resume_token": encode_cursor([last_seq, horizon.timestamp()]),
+        "has_more": has_more,
+        **page
+    }
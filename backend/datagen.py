@@ -0,0 +1,208 @@
+"""Synthetic school generator.
+
+Builds a school of any size (teachers, classes, students and a school year of
+morning/afternoon attendance) from a seed, so the same arguments always give
+the same ids, names and statuses. Documents are produced lazily and written
+with batched ``insert_many`` calls, a few batches in flight at a time, so a
+year of attendance for tens of thousands of students never sits in memory.
+Attendance goes where the server reads it (``storage`` and ``partitioning``
+as in ``ATTENDANCE_STORAGE``/``ATTENDANCE_PARTITIONING``), and the rollups
+are rebuilt from it once everything is written.
+
+Every teacher shares one precomputed bcrypt hash: hashing is the slowest part
+of seeding and the generated logins only need to work, not differ.
+"""
+import asyncio
+import itertools
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from passlib.context import CryptContext
+
+from attendance import build_sheet
+from changes import ChangeSequence
+from indexes import ensure_indexes
+from partitions import PartitionedStore, academic_year, open_attendance_store
+from rollups import rebuild_rollups
+from versions import ResourceVersions
+
+LEVELS = [("Common Core", "General"), ("1st Baccalaureate", "Science"), ("1st Baccalaureate", "Arts"),
+          ("2nd Baccalaureate", "Science"), ("2nd Baccalaureate", "Arts")]
+SUBJECTS = ["Mathematics", "Physics", "Literature", "History", "Biology", "Chemistry", "Philosophy", "English"]
+FIRST_NAMES = ["Amina", "Youssef", "Sara", "Omar", "Lina", "Adam", "Hiba", "Karim", "Salma", "Mehdi", "Nora", "Ilyas",
+               "Rania", "Anas", "Imane", "Hamza", "Yasmine", "Ayoub", "Meryem", "Zakaria"]
+LAST_NAMES = ["Alaoui", "Benali", "Chraibi", "Idrissi", "El Amrani", "Tazi", "Bennani", "Berrada", "Fassi", "Kettani",
+              "Lahlou", "Naciri", "Ouazzani", "Sqalli", "Zniber"]
+SESSIONS = ("morning", "afternoon")
+
+
+@dataclass
+class SchoolSpec:
+    teachers: int = 2
+    classes: int = 3
+    students: int = 75
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    absence_rate: float = 0.08
+    password: str = "password123"
+    seed: int = 1
+
+    def school_days(self) -> List[date]:
+        if self.start_date is None or self.end_date is None:
+            return []
+        days = (self.end_date - self.start_date).days + 1
+        return [
+            self.start_date + timedelta(days=offset)
+            for offset in range(days)
+            if (self.start_date + timedelta(days=offset)).weekday() < 5
+        ]
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class SchoolGenerator:
+    def __init__(self, spec: SchoolSpec, hashed_password: Optional[str] = None):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.hashed_password = hashed_password or CryptContext(schemes=["bcrypt"], deprecated="auto").hash(spec.password)
+        self.teacher_docs: List[dict] = []
+        self.class_docs: List[dict] = []
+        self.student_docs: List[dict] = []
+        self.absence_rates: Dict[str, float] = {}
+        self._build_directory()
+
+    def _build_directory(self):
+        spec, rng = self.spec, self.rng
+        for index in range(spec.teachers):
+            self.teacher_docs.append({
+                "id": _uuid(rng),
+                "username": f"teacher{index + 1}",
+                "email": f"teacher{index + 1}@school.com",
+                "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "hashed_password": self.hashed_password
+            })
+        for index in range(spec.classes):
+            level, stream = LEVELS[index % len(LEVELS)]
+            subject = SUBJECTS[(index // len(LEVELS)) % len(SUBJECTS)]
+            self.class_docs.append({
+                "id": _uuid(rng),
+                "name": f"{subject} - {level} {stream} {index // (len(LEVELS) * len(SUBJECTS)) + 1}",
+                "level": level,
+                "stream": stream,
+                "teacher_id": self.teacher_docs[index % spec.teachers]["id"] if spec.teachers else None,
+                "students": []
+            })
+        for index in range(spec.students):
+            class_doc = self.class_docs[index % spec.classes]
+            student = {
+                "id": _uuid(rng),
+                "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "class_id": class_doc["id"]
+            }
+            class_doc["students"].append(student["id"])
+            self.student_docs.append(student)
+            # A skewed per-student rate gives a realistic tail of frequently absent students
+            self.absence_rates[student["id"]] = min(1.0, spec.absence_rate * rng.expovariate(1.0))
+
+    def sessions(self) -> Iterator[tuple]:
+        """Yield (class_doc, date, session, records) for every class session of the year."""
+        for day in self.spec.school_days():
+            for session in SESSIONS:
+                for class_doc in self.class_docs:
+                    records = [
+                        {
+                            "student_id": student_id,
+                            "status": "absent" if self.rng.random() < self.absence_rates[student_id] else "present"
+                        }
+                        for student_id in class_doc["students"]
+                    ]
+                    yield class_doc, day, session, records
+
+    def attendance_documents(self, compact: bool) -> Iterator[dict]:
+        for class_doc, day, session, records in self.sessions():
+            recorded_at = datetime.combine(day, time(8 if session == "morning" else 14, 15))
+            if compact:
+                sheet = build_sheet(class_doc["id"], day.isoformat(), session, records, class_doc["teacher_id"],
+                                    recorded_at)
+                sheet["id"] = _uuid(self.rng)
+                yield sheet
+                continue
+            for record in records:
+                yield {
+                    "id": _uuid(self.rng),
+                    "class_id": class_doc["id"],
+                    "date": day.isoformat(),
+                    "session": session,
+                    "recorded_at": recorded_at,
+                    "recorded_by": class_doc["teacher_id"],
+                    **record
+                }
+
+
+def _batches(documents, batch_size: int) -> Iterator[List[dict]]:
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def insert_batched(collection, documents, batch_size: int = 5000, concurrency: int = 4,
+                         sequence: Optional[ChangeSequence] = None) -> int:
+    """Insert ``documents`` with up to ``concurrency`` unordered ``insert_many`` calls in flight."""
+    pending = set()
+    inserted = 0
+    for batch in _batches(documents, batch_size):
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        if sequence is not None:
+            await sequence.stamp(batch)
+        pending.add(asyncio.ensure_future(collection.insert_many(batch, ordered=False)))
+        inserted += len(batch)
+    if pending:
+        await asyncio.gather(*pending)
+    return inserted
+
+
+async def write_school(db, generator: SchoolGenerator, storage: str = "records", partitioning: str = "none",
+                       batch_size: int = 5000, concurrency: int = 4) -> Dict[str, int]:
+    """Write the generated school, then create the managed indexes and rebuild the rollups.
+
+    Returns the number of documents written per collection.
+    """
+    sequence = ChangeSequence(db.counters)
+    counts = {"teachers": await insert_batched(db.teachers, generator.teacher_docs, batch_size, concurrency)}
+    for name, documents in (("classes", generator.class_docs), ("students", generator.student_docs)):
+        counts[name] = await insert_batched(db[name], documents, batch_size, concurrency, sequence)
+
+    store = open_attendance_store(db, storage, partitioning)
+    documents = generator.attendance_documents(storage == "compact")
+    if isinstance(store, PartitionedStore):
+        # Sessions come out day by day, so every academic year is one run of documents
+        for year, year_documents in itertools.groupby(documents, key=lambda document: academic_year(document["date"])):
+            collection = store.store_for_year(year).collection
+            counts[collection.name] = await insert_batched(
+                collection, year_documents, batch_size, concurrency, sequence
+            )
+        await store.refresh()
+    else:
+        counts[store.collection.name] = await insert_batched(
+            store.collection, documents, batch_size, concurrency, sequence
+        )
+
+    # Indexes first: the rebuild reads attendance in key order
+    await ensure_indexes(db)
+    counts.update(await rebuild_rollups(db, store, batch_size=batch_size))
+    # Cached class lists, rosters and sheets predate the new school
+    await ResourceVersions(db.resource_versions).reset()
+    return counts
@@ -0,0 +1,194 @@
+"""Live attendance events.
+
+``EventBus`` is an in-process pub/sub bus: every subscriber owns a bounded
+queue and a policy for when it falls behind. ``drop_oldest`` and
+``drop_newest`` shed events (counted in ``events_dropped_total``) so the
+publisher never waits; ``block`` applies backpressure, making the publisher
+wait up to ``block_timeout`` for room before the subscriber is disconnected.
+
+A bus only reaches subscribers in its own process. With several uvicorn
+workers, ``MongoEventRelay`` publishes by inserting into a small TTL-indexed
+collection and every worker tails it through a change stream, republishing
+onto its local bus. Change streams need a replica set; a single node started
+with ``mongod --replSet rs0`` and ``rs.initiate()`` is enough.
+
+A stream only ends when its client leaves or the bus is closed by the
+lifespan shutdown, and uvicorn waits for open connections to finish before
+it runs the lifespan shutdown. Serve with a graceful shutdown timeout
+(``GRACEFUL_SHUTDOWN_TIMEOUT``, which ``python server.py`` passes on, or
+``uvicorn --timeout-graceful-shutdown 10``): streams still open when it runs
+out are cancelled, and shutdown goes on to drain the ingest queue. Clients
+reconnect on their own (``retry:``).
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import event_subscribers, events_dropped, events_published
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+_CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", accepts: Callable[[dict], bool], maxsize: int, policy: str):
+        self.bus = bus
+        self.accepts = accepts
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    async def get(self) -> Optional[dict]:
+        """Next event, or None once the subscription has been closed."""
+        if self.closed and self.queue.empty():
+            return None
+        event = await self.queue.get()
+        return None if event is _CLOSED else event
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, maxsize: int = 100, policy: str = DROP_OLDEST, block_timeout: float = 0.5):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, accepts: Optional[Callable[[dict], bool]] = None, maxsize: Optional[int] = None,
+                  policy: Optional[str] = None) -> Subscription:
+        subscription = Subscription(self, accepts or (lambda event: True), maxsize or self.maxsize,
+                                    policy or self.policy)
+        self._subscribers.add(subscription)
+        event_subscribers.set(len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.closed:
+            return
+        subscription.closed = True
+        self._subscribers.discard(subscription)
+        event_subscribers.set(len(self._subscribers))
+        # Wake a reader waiting on get(); a full queue is emptied first so the marker fits
+        while subscription.queue.full():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(_CLOSED)
+
+    def close(self):
+        """Disconnect every subscriber, e.g. on shutdown so open streams end."""
+        for subscription in list(self._subscribers):
+            self.unsubscribe(subscription)
+
+    async def publish(self, event: dict):
+        events_published.inc()
+        blocked = []
+        for subscription in list(self._subscribers):
+            if not subscription.accepts(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                if subscription.policy == BLOCK:
+                    blocked.append(self._put_blocking(subscription, event))
+                    continue
+                if subscription.policy == DROP_OLDEST:
+                    subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(event)
+                subscription.dropped += 1
+                events_dropped.inc(policy=subscription.policy)
+        if blocked:
+            await asyncio.gather(*blocked)
+
+    async def _put_blocking(self, subscription: Subscription, event: dict):
+        try:
+            await asyncio.wait_for(subscription.queue.put(event), self.block_timeout)
+        except asyncio.TimeoutError:
+            subscription.dropped += 1
+            events_dropped.inc(policy=BLOCK)
+            logger.warning("Disconnecting event subscriber that stayed full for %.1fs", self.block_timeout)
+            self.unsubscribe(subscription)
+
+
+class MongoEventRelay:
+    """Publish through a collection and fan change-stream inserts out to the local bus."""
+
+    def __init__(self, collection, bus: EventBus, retry_delay: float = 2.0):
+        self.collection = collection
+        self.bus = bus
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, event: dict):
+        await self.collection.insert_one({**event, "created_at": datetime.utcnow()})
+
+    async def run(self):
+        resume_token = None
+        while True:
+            try:
+                async with self.collection.watch([{"$match": {"operationType": "insert"}}],
+                                                 resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = change["fullDocument"]
+                        event.pop("_id", None)
+                        event.pop("created_at", None)
+                        await self.bus.publish(event)
+            except OperationFailure as exc:
+                # Most often the resume point fell off the oplog; start again from now
+                logger.warning("Attendance change stream failed (%s), restarting without resume token", exc)
+                resume_token = None
+            except PyMongoError as exc:
+                logger.warning("Attendance change stream interrupted: %s", exc)
+            await asyncio.sleep(self.retry_delay)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def sse_stream(subscription: Subscription, heartbeat: float = 15.0):
+    """Server-Sent Events body for ``subscription``; comment lines keep idle proxies from closing it."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+    finally:
+        subscription.close()
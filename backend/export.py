@@ -0,0 +1,69 @@
+"""Streaming attendance export.
+
+Rows are pulled from the attendance store's cursor in server-side batches and
+written out one chunk per batch, so an export holds at most ``batch_size``
+rows in memory no matter how many the query matches.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from attendance import RECORD_FIELDS as EXPORT_FIELDS
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_filter(class_ids, start_date: Optional[str], end_date: Optional[str], session: Optional[str]) -> dict:
+    query = {"class_id": {"$in": list(class_ids)}}
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = start_date
+        if end_date:
+            query["date"]["$lte"] = end_date
+    if session:
+        query["session"] = session
+    return query
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def _batches(rows: AsyncIterable[dict], batch_size: int):
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_csv(rows: AsyncIterable[dict], batch_size: int) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for batch in _batches(rows, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows({field: _cell(row.get(field)) for field in EXPORT_FIELDS} for row in batch)
+        yield buffer.getvalue()
+
+
+async def stream_ndjson(rows: AsyncIterable[dict], batch_size: int) -> AsyncIterator[str]:
+    async for batch in _batches(rows, batch_size):
+        yield "".join(json.dumps(row, default=_cell) + "\n" for row in batch)
+
+
+def stream_export(rows: AsyncIterable[dict], export_format: str, batch_size: int) -> AsyncIterator[str]:
+    if export_format == "csv":
+        return stream_csv(rows, batch_size)
+    return stream_ndjson(rows, batch_size)
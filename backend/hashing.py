@@ -0,0 +1,67 @@
+"""Password hashing off the event loop.
+
+bcrypt releases the GIL, so a small thread pool lets several checks run in
+parallel while uvicorn keeps serving other requests. Admission is bounded:
+at most ``max_concurrency`` hashes run at once and at most ``max_queue``
+callers wait for a slot; anyone beyond that gets ``HashingSaturated``
+immediately instead of piling up behind bcrypt.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+
+class HashingSaturated(Exception):
+    """Raised when the hashing pool and its wait queue are both full."""
+
+
+class PasswordHasher:
+    def __init__(self, context: CryptContext, max_concurrency: int = 4, max_queue: int = 64,
+                 queue_timeout: Optional[float] = 5.0):
+        self.context = context
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._admitted = 0  # running plus waiting
+        self._running = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._admitted - self._running
+
+    async def _run(self, func, *args):
+        # Checked and counted before the first await: calls arriving in the same
+        # tick would otherwise all see a free semaphore and pass together
+        if self._admitted >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise HashingSaturated("Password hashing queue is full")
+        self._admitted += 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise HashingSaturated("Timed out waiting for a password hashing slot")
+            self._running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+            finally:
+                self._running -= 1
+                self._slots.release()
+        finally:
+            self._admitted -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,111 @@
+"""Idempotency keys for write endpoints.
+
+A client that sends ``Idempotency-Key`` on a write gets the first response
+for that key replayed on every retry, without the write running again. Keys
+are scoped to the teacher and the route, and bound to a fingerprint of the
+request body: reusing a key for a different body is rejected.
+
+``begin`` claims a key by inserting a pending marker into ``idempotency_keys``
+(the unique ``_id`` makes the claim race-free across workers) and ``complete``
+stores the response there with an ``expires_at`` for the TTL index. Completed
+responses are also kept in an in-process LRU, so most replays cost no round
+trip at all.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from metrics import idempotency_requests
+
+PENDING = "pending"
+COMPLETED = "completed"
+
+
+class IdempotencyInProgress(Exception):
+    """Another request with the same key has not finished yet."""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was first used with a different request body."""
+
+
+def fingerprint(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, collection, ttl: float = 86400.0, cache_size: int = 10000, pending_timeout: float = 60.0):
+        self.collection = collection
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    @staticmethod
+    def _checked(stored: dict, request_fingerprint: str) -> dict:
+        if stored["fingerprint"] != request_fingerprint:
+            idempotency_requests.inc(outcome="mismatch")
+            raise IdempotencyMismatch("Idempotency-Key was already used for a different request")
+        return stored
+
+    async def begin(self, key: str, request_fingerprint: str) -> Optional[dict]:
+        """Claim ``key``, or return the stored response if it already completed."""
+        stored = self.cache.get(key)
+        if stored is not None:
+            stored = self._checked(stored, request_fingerprint)
+            idempotency_requests.inc(outcome="replayed_cache")
+            return stored
+
+        now = datetime.utcnow()
+        pending = {
+            "fingerprint": request_fingerprint,
+            "state": PENDING,
+            "expires_at": now + timedelta(seconds=self.pending_timeout)
+        }
+        try:
+            await self.collection.insert_one({"_id": key, **pending})
+            idempotency_requests.inc(outcome="new")
+            return None
+        except DuplicateKeyError:
+            pass
+
+        document = await self.collection.find_one({"_id": key})
+        if document is None or (document["state"] == PENDING and document["expires_at"] <= now):
+            # The claim was abandoned or its request died mid-flight; take the key over.
+            # The upsert fails with a duplicate key if someone else got there first.
+            try:
+                await self.collection.update_one(
+                    {"_id": key, "state": PENDING, "expires_at": {"$lte": now}}, {"$set": pending}, upsert=True
+                )
+                idempotency_requests.inc(outcome="new")
+                return None
+            except DuplicateKeyError:
+                document = await self.collection.find_one({"_id": key})
+
+        if document is None:
+            idempotency_requests.inc(outcome="in_progress")
+            raise IdempotencyInProgress("A request with this Idempotency-Key is still being processed")
+        stored = self._checked(document, request_fingerprint)
+        if stored["state"] == PENDING:
+            idempotency_requests.inc(outcome="in_progress")
+            raise IdempotencyInProgress("A request with this Idempotency-Key is still being processed")
+        self.cache.set(key, stored)
+        idempotency_requests.inc(outcome="replayed_store")
+        return stored
+
+    async def complete(self, key: str, request_fingerprint: str, status_code: int, body):
+        stored = {
+            "fingerprint": request_fingerprint,
+            "state": COMPLETED,
+            "status_code": status_code,
+            "body": body,
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)
+        }
+        await self.collection.update_one({"_id": key}, {"$set": stored}, upsert=True)
+        self.cache.set(key, stored)
+
+    async def abandon(self, key: str):
+        """Release a claim whose request failed, so a retry runs the write again."""
+        await self.collection.delete_one({"_id": key, "state": PENDING})
@@ -0,0 +1,193 @@
+"""Managed MongoDB indexes for the attendance system.
+
+Every index the API relies on is declared in ``MANAGED_INDEXES``. At startup
+``ensure_indexes`` reconciles the live collections against that declaration,
+and ``verify_query_plans`` runs ``explain()`` on each route query so a missing
+index shows up as a COLLSCAN instead of a slow attendance page.
+"""
+import logging
+import re
+from typing import Dict, List
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Per-academic-year attendance collections, e.g. attendance_2024_2025
+PARTITION_NAME = re.compile(r"^(attendance|attendance_sheets)_(\d{4})_(\d{4})$")
+
+# Index declarations, keyed by collection name
+MANAGED_INDEXES: Dict[str, List[IndexModel]] = {
+    "teachers": [
+        IndexModel([("id", ASCENDING)], name="teachers_id", unique=True),
+        IndexModel([("username", ASCENDING)], name="teachers_username", unique=True),
+    ],
+    "classes": [
+        IndexModel([("id", ASCENDING)], name="classes_id", unique=True),
+        IndexModel([("teacher_id", ASCENDING), ("id", ASCENDING)], name="classes_teacher_id"),
+        IndexModel([("teacher_id", ASCENDING), ("change_seq", ASCENDING)], name="classes_teacher_change_seq"),
+    ],
+    "students": [
+        IndexModel([("id", ASCENDING)], name="students_id", unique=True),
+        IndexModel(
+            [("class_id", ASCENDING), ("full_name", ASCENDING), ("id", ASCENDING)],
+            name="students_class_full_name",
+        ),
+        IndexModel([("class_id", ASCENDING), ("change_seq", ASCENDING)], name="students_class_change_seq"),
+    ],
+    "attendance": [
+        IndexModel(
+            [("class_id", ASCENDING), ("date", ASCENDING), ("session", ASCENDING), ("student_id", ASCENDING)],
+            name="attendance_class_date_session_student",
+            unique=True,
+        ),
+        IndexModel([("class_id", ASCENDING), ("change_seq", ASCENDING)], name="attendance_class_change_seq"),
+    ],
+    "attendance_sheets": [
+        IndexModel(
+            [("class_id", ASCENDING), ("date", ASCENDING), ("session", ASCENDING)],
+            name="attendance_sheets_class_date_session",
+            unique=True,
+        ),
+        IndexModel([("class_id", ASCENDING), ("change_seq", ASCENDING)], name="attendance_sheets_class_change_seq"),
+    ],
+    "attendance_sessions": [
+        IndexModel(
+            [("class_id", ASCENDING), ("date", ASCENDING), ("session", ASCENDING)],
+            name="attendance_sessions_class_date_session",
+            unique=True,
+        ),
+    ],
+    "attendance_student_months": [
+        IndexModel([("student_id", ASCENDING), ("month", ASCENDING)], name="student_months_student_month", unique=True),
+        IndexModel([("class_id", ASCENDING), ("month", ASCENDING)], name="student_months_class_month"),
+    ],
+    "attendance_class_days": [
+        IndexModel([("class_id", ASCENDING), ("date", ASCENDING)], name="class_days_class_date", unique=True),
+    ],
+    "attendance_student_streaks": [
+        IndexModel([("student_id", ASCENDING)], name="student_streaks_student", unique=True),
+    ],
+    # Relay log for the change-stream event source; only recent inserts matter
+    "attendance_events": [
+        IndexModel([("created_at", ASCENDING)], name="attendance_events_created_at", expireAfterSeconds=3600),
+    ],
+    # Stored responses for Idempotency-Key replays, each expiring at its own expires_at
+    "idempotency_keys": [
+        IndexModel([("expires_at", ASCENDING)], name="idempotency_keys_expires_at", expireAfterSeconds=0),
+    ],
+    "report_jobs": [
+        IndexModel([("expires_at", ASCENDING)], name="report_jobs_expires_at", expireAfterSeconds=0),
+    ],
+    # Deletions for /api/sync, kept until expires_at
+    "tombstones": [
+        IndexModel([("class_id", ASCENDING), ("change_seq", ASCENDING)], name="tombstones_class_change_seq"),
+        IndexModel([("teacher_id", ASCENDING), ("change_seq", ASCENDING)], name="tombstones_teacher_change_seq"),
+        IndexModel([("expires_at", ASCENDING)], name="tombstones_expires_at", expireAfterSeconds=0),
+    ],
+    "ingest_acks": [
+        IndexModel([("created_at", ASCENDING)], name="ingest_acks_created_at", expireAfterSeconds=86400),
+    ],
+}
+
+# Representative filters for every query issued by the API routes
+ROUTE_QUERIES = [
+    ("login", "teachers", {"username": "teacher1"}),
+    ("get_teacher_profile", "teachers", {"id": "teacher-id"}),
+    ("get_teacher_classes", "classes", {"teacher_id": "teacher-id"}),
+    ("class ownership check", "classes", {"id": "class-id", "teacher_id": "teacher-id"}),
+    ("get_class_students", "students", {"class_id": "class-id"}),
+    ("get_class_attendance", "attendance", {"class_id": "class-id", "date": "2024-01-01", "session": "morning"}),
+    ("get_class_attendance (compact)", "attendance_sheets", {"class_id": "class-id", "date": "2024-01-01", "session": "morning"}),
+    ("student_absence", "attendance_student_months", {"student_id": "student-id"}),
+    ("class_summary", "attendance_class_days", {"class_id": "class-id", "date": {"$gte": "2024-01", "$lt": "2024-01~"}}),
+    ("class_summary", "attendance_student_months", {"class_id": "class-id", "month": "2024-01"}),
+    ("export_attendance", "attendance", {"class_id": {"$in": ["class-id"]}, "date": {"$gte": "2024-01-01", "$lte": "2024-06-30"}}),
+    ("sync", "classes", {"teacher_id": "teacher-id", "change_seq": {"$gt": 0}}),
+    ("sync", "students", {"class_id": {"$in": ["class-id"]}, "change_seq": {"$gt": 0}}),
+    ("sync", "attendance", {"class_id": {"$in": ["class-id"]}, "change_seq": {"$gt": 0}}),
+]
+
+
+def _index_options(spec: dict) -> dict:
+    return {
+        "key": list(spec["key"].items()),
+        "unique": bool(spec.get("unique", False)),
+        "expireAfterSeconds": spec.get("expireAfterSeconds"),
+    }
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create missing managed indexes and rebuild ones whose definition drifted.
+
+    Returns the names of the indexes created per collection.
+    """
+    created: Dict[str, List[str]] = {}
+    for collection_name, models in MANAGED_INDEXES.items():
+        names = await ensure_collection_indexes(db[collection_name], models)
+        if names:
+            created[collection_name] = names
+    # Year partitions (see partitions.py) carry the indexes of their base collection
+    for collection_name in await db.list_collection_names():
+        match = PARTITION_NAME.match(collection_name)
+        if match:
+            names = await ensure_collection_indexes(db[collection_name], MANAGED_INDEXES[match.group(1)])
+            if names:
+                created[collection_name] = names
+    return created
+
+
+async def ensure_collection_indexes(collection, models: List[IndexModel]) -> List[str]:
+    """Reconcile one collection against ``models``; returns the names of the indexes created."""
+    existing = {}
+    async for spec in collection.list_indexes():
+        existing[spec["name"]] = _index_options(spec)
+
+    missing = []
+    for model in models:
+        wanted = _index_options(model.document)
+        name = model.document["name"]
+        current = existing.get(name)
+        if current == wanted:
+            continue
+        if current is not None:
+            logger.warning("Index %s.%s changed definition, rebuilding", collection.name, name)
+            await collection.drop_index(name)
+        missing.append(model)
+
+    if not missing:
+        return []
+    try:
+        created = await collection.create_indexes(missing)
+    except OperationFailure as exc:
+        # Typically duplicate rows blocking a unique index; keep serving and report it
+        logger.error("Could not create indexes on %s: %s", collection.name, exc)
+        return []
+    logger.info("Created indexes on %s: %s", collection.name, ", ".join(created))
+    return created
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def explain_stages(collection, query: dict) -> List[str]:
+    explanation = await collection.find(query).explain()
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    return [stage for stage in _plan_stages(winning_plan) if stage]
+
+
+async def verify_query_plans(db) -> List[str]:
+    """Explain every route query and return a description of each COLLSCAN found."""
+    failures = []
+    for route, collection_name, query in ROUTE_QUERIES:
+        stages = await explain_stages(db[collection_name], query)
+        if "COLLSCAN" in stages:
+            failures.append(f"{route}: {collection_name}.find({query}) uses {' -> '.join(stages)}")
+    return failures
@@ -0,0 +1,162 @@
+"""Write-behind attendance ingestion with group commit.
+
+With ``ATTENDANCE_INGEST=queued`` the submit route validates a submission,
+puts it on an ``IngestQueue`` and answers 202 with an acknowledgement token.
+A single flusher task collects queued submissions until ``max_batch`` are
+waiting or ``max_delay`` seconds have passed since the first one, then writes
+them all with one ``write_sessions`` call (one ``bulk_write``) and one
+``after_write`` callback for rollups, versions and events. Submissions from
+the start-of-session rush therefore cost a handful of MongoDB operations
+instead of several each.
+
+Each flush also inserts the outcome of every token into ``ingest_acks``
+(TTL-indexed), so ``status`` can answer for tokens accepted by another worker
+once they are committed. ``drain`` stops intake and flushes everything still
+queued; call it on shutdown.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+COMMITTED = "committed"
+FAILED = "failed"
+
+
+class IngestSaturated(Exception):
+    """The queue is full or draining; the caller should retry shortly."""
+
+
+class IngestQueue:
+    def __init__(self, store, acks_collection,
+                 after_write: Callable[[Sequence, List[dict], List[str]], Awaitable[None]],
+                 max_batch: int = 200, max_delay: float = 0.05, max_pending: int = 10000,
+                 status_ttl: float = 900.0):
+        self.store = store
+        self.acks = acks_collection
+        self.after_write = after_write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.status_ttl = status_ttl
+        self._queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self._statuses = TTLCache(maxsize=max_pending * 4, ttl=status_ttl)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.flushes = 0
+        self.flushed_submissions = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, class_id: str, submission, teacher_id: str) -> dict:
+        """Validate and enqueue one submission; returns its acknowledgement."""
+        if self._closing:
+            raise IngestSaturated("Attendance ingestion is shutting down")
+        self.store.validate(submission)
+        token = str(uuid.uuid4())
+        try:
+            self._queue.put_nowait((token, class_id, submission, teacher_id))
+        except asyncio.QueueFull:
+            raise IngestSaturated("Attendance ingestion queue is full")
+        status = {"token": token, "teacher_id": teacher_id, "status": QUEUED, "queued_at": datetime.utcnow()}
+        self._statuses.set(token, status)
+        return status
+
+    async def status(self, token: str, teacher_id: str) -> Optional[dict]:
+        """The acknowledgement for ``token``, or None if it is unknown, expired or not ``teacher_id``'s."""
+        status = self._statuses.get(token)
+        if status is None:
+            status = await self.acks.find_one({"_id": token})
+            if status is not None:
+                status["token"] = status.pop("_id")
+        if status is None or status.get("teacher_id") != teacher_id:
+            return None
+        return status
+
+    async def _next_batch(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[tuple]):
+        tokens = [token for token, _, _, _ in batch]
+        submissions = [(class_id, submission) for _, class_id, submission, _ in batch]
+        teachers = [teacher_id for _, _, _, teacher_id in batch]
+        committed_at = datetime.utcnow()
+        try:
+            results = await self.store.write_sessions(
+                submissions, teachers[0], ordered=False, recorded_by=teachers, whole_sessions=True
+            )
+        except Exception as exc:
+            logger.exception("Group commit of %d attendance submissions failed", len(batch))
+            statuses = [{"status": FAILED, "error": str(exc)} for _ in batch]
+        else:
+            statuses = [{"status": COMMITTED, "result": result} for result in results]
+            try:
+                await self.after_write(submissions, results, teachers)
+            except Exception:
+                # The rows are durable; derived data can be rebuilt with manage.py rebuild-rollups
+                logger.exception("Post-commit processing failed for %d attendance submissions", len(batch))
+
+        for token, teacher_id, status in zip(tokens, teachers, statuses):
+            status["teacher_id"] = teacher_id
+            status["committed_at"] = committed_at
+            self._statuses.set(token, {"token": token, **status})
+        try:
+            await self.acks.insert_many(
+                [{"_id": token, "created_at": committed_at, **status} for token, status in zip(tokens, statuses)],
+                ordered=False
+            )
+        except Exception:
+            logger.exception("Could not record ingestion acknowledgements")
+        self.flushes += 1
+        self.flushed_submissions += len(batch)
+
+    async def run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def drain(self):
+        """Refuse new submissions, commit everything queued, then stop the flusher."""
+        self._closing = True
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "flushes": self.flushes, "flushed_submissions": self.flushed_submissions}
@@ -0,0 +1,359 @@
+"""Maintenance commands for the attendance backend.
+
+Run from the backend directory, e.g. ``python manage.py check-indexes``.
+Commands work on the default school; pass ``--school <id>`` before the
+command for a school routed in ``SCHOOL_ROUTES``.
+"""
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import date, datetime
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+
+from archive import write_archive
+from attendance import migrate_records_to_sheets
+from changes import ChangeSequence, Tombstones, stamp_existing
+from datagen import SchoolGenerator, SchoolSpec, write_school
+from indexes import PARTITION_NAME, ensure_indexes, verify_query_plans
+from partitions import (
+    PartitionedStore, academic_year, is_closed, open_attendance_store, partition_collection, partition_name, year_bounds
+)
+from rollups import rebuild_rollups
+from schools import archive_directory
+from search import StudentSearch
+from settings import Settings
+from versions import SHEET_PREFIX, ResourceVersions
+
+load_dotenv()
+
+cli = typer.Typer(help="Attendance system maintenance commands")
+
+settings = Settings.from_env()
+DEFAULT_SCHOOL_ID = settings.default_school_id
+selected = {"school": DEFAULT_SCHOOL_ID}
+
+
+@cli.callback()
+def main(school: str = typer.Option(DEFAULT_SCHOOL_ID, help="School whose database the command works on")):
+    selected["school"] = school
+
+
+def get_database():
+    routes = settings.routes()
+    if selected["school"] not in routes:
+        raise typer.BadParameter(f"No route for school {selected['school']!r} in SCHOOL_ROUTES")
+    uri, name = routes[selected["school"]]
+    return AsyncIOMotorClient(uri, **settings.mongo_client_options())[name]
+
+
+def get_archive_directory(base: str) -> str:
+    return archive_directory(base, selected["school"], DEFAULT_SCHOOL_ID)
+
+
+@cli.command("create-admin")
+def create_admin_command(
+    username: str = typer.Argument(..., help="Login of the administrator"),
+    full_name: Optional[str] = typer.Option(None, help="Name of a new account; prompted for when omitted"),
+    email: Optional[str] = typer.Option(None, help="Email of a new account; prompted for when omitted"),
+    password: Optional[str] = typer.Option(None, help="Password of a new account; prompted for when omitted"),
+    role: str = typer.Option(
+        "admin", help='"admin" manages one school; "operator" reaches the profiler, which every school shares'
+    ),
+):
+    """Create an administrator, or give an existing teacher the admin role.
+
+    The role is read when a token is issued, so a promoted teacher logs in
+    again to get an administrator token.
+    """
+    if role not in ("admin", "operator"):
+        raise typer.BadParameter("role must be admin or operator", param_hint="--role")
+
+    async def run():
+        db = get_database()
+        await ensure_indexes(db)
+        outcome = await db.teachers.update_one({"username": username}, {"$set": {"role": role}})
+        if outcome.matched_count:
+            return False
+        admin = {
+            "id": str(uuid.uuid4()),
+            "username": username,
+            "email": email or typer.prompt("Email"),
+            "full_name": full_name or typer.prompt("Full name"),
+            "hashed_password": CryptContext(schemes=["bcrypt"]).hash(
+                password or typer.prompt("Password", hide_input=True, confirmation_prompt=True)
+            ),
+            "role": role
+        }
+        await db.teachers.insert_one(admin)
+        return True
+
+    created = asyncio.run(run())
+    typer.echo(f"Created {role} {username}" if created else f"Gave {username} the {role} role")
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create or rebuild the managed indexes."""
+    created = asyncio.run(ensure_indexes(get_database()))
+    for collection_name, names in created.items():
+        typer.echo(f"{collection_name}: created {', '.join(names)}")
+    if not created:
+        typer.echo("All managed indexes are up to date")
+
+
+@cli.command("check-indexes")
+def check_indexes_command(reconcile: bool = typer.Option(True, help="Reconcile indexes before explaining")):
+    """Explain every route query and fail if any of them falls back to a COLLSCAN."""
+    async def run():
+        db = get_database()
+        if reconcile:
+            await ensure_indexes(db)
+        return await verify_query_plans(db)
+
+    failures = asyncio.run(run())
+    for failure in failures:
+        typer.echo(f"COLLSCAN {failure}", err=True)
+    if failures:
+        raise typer.Exit(code=1)
+    typer.echo("All route queries use an index")
+
+
+@cli.command("migrate-attendance")
+def migrate_attendance_command(
+    delete_source: bool = typer.Option(False, help="Delete per-student rows once every sheet is written"),
+    batch_size: int = typer.Option(500, help="Sheets per bulk_write"),
+):
+    """Convert per-student attendance rows into compact per-session sheets."""
+    async def run():
+        db = get_database()
+        await ensure_indexes(db)
+        tombstones = Tombstones(db.tombstones, ChangeSequence(db.counters), ttl=settings.sync_tombstone_ttl)
+        counts = await migrate_records_to_sheets(
+            db, delete_source=delete_source, batch_size=batch_size, tombstones=tombstones
+        )
+        # Records read back from sheets carry new ids
+        await ResourceVersions(db.resource_versions).reset(SHEET_PREFIX)
+        return counts
+
+    counts = asyncio.run(run())
+    typer.echo(
+        f"{counts['sessions']} sessions, {counts['sheets_written']} sheets written, "
+        f"{counts['records_deleted']} records deleted"
+    )
+    typer.echo("Set ATTENDANCE_STORAGE=compact to serve attendance from the sheets")
+
+
+@cli.command("rebuild-rollups")
+def rebuild_rollups_command(
+    storage: str = typer.Option(settings.attendance_storage, help="Attendance storage to read"),
+    partitioning: str = typer.Option(settings.attendance_partitioning, help="none or year"),
+    archive_dir: str = typer.Option(settings.archive_dir, help="Archived years to include"),
+    batch_size: int = typer.Option(1000, help="Documents per read batch and per insert"),
+):
+    """Recompute the attendance rollups from raw attendance."""
+    async def run():
+        db = get_database()
+        await ensure_indexes(db)
+        store = open_attendance_store(db, storage, partitioning, get_archive_directory(archive_dir))
+        if isinstance(store, PartitionedStore):
+            await store.refresh()
+        return await rebuild_rollups(db, store, batch_size=batch_size)
+
+    for collection_name, count in asyncio.run(run()).items():
+        typer.echo(f"{collection_name}: {count} documents")
+
+
+@cli.command("stamp-changes")
+def stamp_changes_command(batch_size: int = typer.Option(1000, help="Documents per bulk_write")):
+    """Give documents written before delta sync a change sequence number."""
+    async def run():
+        db = get_database()
+        sequence = ChangeSequence(db.counters)
+        names = ["classes", "students", "attendance", "attendance_sheets"]
+        names += sorted(name for name in await db.list_collection_names() if PARTITION_NAME.match(name))
+        stamped = {name: await stamp_existing(db[name], sequence, batch_size) for name in names}
+        await ResourceVersions(db.resource_versions).reset()
+        return stamped
+
+    for collection_name, count in asyncio.run(run()).items():
+        typer.echo(f"{collection_name}: stamped {count} documents")
+
+
+@cli.command("partition-attendance")
+def partition_attendance_command(
+    storage: str = typer.Option(settings.attendance_storage, help="Attendance storage to split"),
+    delete_source: bool = typer.Option(False, help="Drop the unpartitioned collection once it is copied"),
+    batch_size: int = typer.Option(1000, help="Documents per insert"),
+):
+    """Copy unpartitioned attendance into one collection per academic year."""
+    async def run():
+        db = get_database()
+        copied = await partition_collection(db, storage, delete_source, batch_size)
+        await ResourceVersions(db.resource_versions).reset(SHEET_PREFIX)
+        return copied
+
+    copied = asyncio.run(run())
+    for year, count in sorted(copied.items()):
+        typer.echo(f"{year}: {count} documents")
+    typer.echo("Set ATTENDANCE_PARTITIONING=year to serve attendance from the partitions")
+
+
+@cli.command("archive-year")
+def archive_year_command(
+    year: str = typer.Argument(..., help="Academic year to archive, e.g. 2023-2024"),
+    storage: str = typer.Option(settings.attendance_storage, help="Attendance storage to read"),
+    archive_dir: str = typer.Option(settings.archive_dir),
+    drop_partition: bool = typer.Option(False, help="Drop the year's collection once the archive is written"),
+    batch_size: int = typer.Option(5000, help="Records per read batch"),
+    force: bool = typer.Option(False, help="Archive even if the year has not ended"),
+):
+    """Move a closed academic year into memory-mapped columnar files."""
+    archive_dir = get_archive_directory(archive_dir)
+    if academic_year(year_bounds(year)[0]) != year:
+        raise typer.BadParameter("Expected an academic year such as 2023-2024")
+    if not is_closed(year) and not force:
+        typer.echo(f"{year} has not ended yet; pass --force to archive it anyway", err=True)
+        raise typer.Exit(code=1)
+
+    async def run():
+        db = get_database()
+        store = PartitionedStore(db, storage)
+        collection = store.store_for_year(year).collection
+        if collection.name not in await db.list_collection_names():
+            typer.echo(f"No {partition_name(store.base, year)} collection; run partition-attendance first", err=True)
+            raise typer.Exit(code=1)
+        manifest = await write_archive(store.store_for_year(year), archive_dir, year, {}, batch_size)
+        if drop_partition:
+            # Sync stops serving an archived year: clients keep the copies they hold,
+            # which the archive still backs, so nothing is tombstoned
+            await collection.drop()
+            await ResourceVersions(db.resource_versions).reset(SHEET_PREFIX)
+        return manifest
+
+    started = time.perf_counter()
+    manifest = asyncio.run(run())
+    directory = os.path.join(archive_dir, year)
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    typer.echo(
+        f"Archived {manifest['rows']} records to {directory} ({size / 1_048_576:.1f} MiB, "
+        f"{size / max(manifest['rows'], 1):.1f} bytes/record) in {time.perf_counter() - started:.1f}s"
+    )
+
+
+@cli.command("generate")
+def generate_command(
+    teachers: int = typer.Option(200, min=1),
+    classes: int = typer.Option(2000, min=1),
+    students: int = typer.Option(60000, min=0),
+    start_date: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="Defaults to 1 September"),
+    end_date: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="Defaults to 30 June"),
+    no_attendance: bool = typer.Option(False, help="Only generate teachers, classes and students"),
+    absence_rate: float = typer.Option(0.08, min=0.0, max=1.0, help="Mean per-session absence probability"),
+    password: str = typer.Option("password123", help="Password for every generated teacher"),
+    password_hash: Optional[str] = typer.Option(None, help="Precomputed bcrypt hash to use instead of hashing"),
+    seed: int = typer.Option(1, help="Random seed; the same seed always generates the same school"),
+    storage: str = typer.Option(settings.attendance_storage, help="records or compact"),
+    partitioning: str = typer.Option(settings.attendance_partitioning, help="none or year"),
+    batch_size: int = typer.Option(5000, min=1, help="Documents per insert_many"),
+    concurrency: int = typer.Option(4, min=1, help="insert_many calls in flight"),
+    drop: bool = typer.Option(False, help="Drop the database before generating"),
+):
+    """Generate a deterministic school of any size, with its indexes and rollups."""
+    default_start = date.fromisoformat(year_bounds(academic_year(date.today().isoformat()))[0])
+    # Classes end with June; the academic year itself runs to the end of August
+    default_end = date(default_start.year + 1, 6, 30)
+    spec = SchoolSpec(
+        teachers=teachers,
+        classes=classes,
+        students=students,
+        start_date=None if no_attendance else (start_date.date() if start_date else default_start),
+        end_date=None if no_attendance else (end_date.date() if end_date else default_end),
+        absence_rate=absence_rate,
+        password=password,
+        seed=seed,
+    )
+
+    async def run():
+        db = get_database()
+        if drop:
+            await db.client.drop_database(db.name)
+        generator = SchoolGenerator(spec, hashed_password=password_hash)
+        return await write_school(
+            db, generator, storage=storage, partitioning=partitioning, batch_size=batch_size, concurrency=concurrency
+        )
+
+    started = time.perf_counter()
+    counts = asyncio.run(run())
+    for collection_name, count in counts.items():
+        typer.echo(f"{collection_name}: {count} documents")
+    typer.echo(f"Generated in {time.perf_counter() - started:.1f}s; log in as teacher1 / {password}")
+
+
+
+def _fuzzy_queries(names, count: int, rng: random.Random):
+    """Prefixes, whole names and names with one dropped character, as typed into a search box."""
+    for _ in range(count):
+        name = rng.choice(names)
+        kind = rng.randrange(3)
+        if kind == 0:
+            yield name.split()[-1][:rng.randint(2, 4)]
+        elif kind == 1:
+            yield name
+        else:
+            position = rng.randrange(len(name))
+            yield name[:position] + name[position + 1:]
+
+
+@cli.command("search-report")
+def search_report_command(
+    queries: int = typer.Option(1000, min=1, help="Timed lookups per scope"),
+    limit: int = typer.Option(20, min=1),
+    seed: int = typer.Option(1)
+):
+    """Build the student search index from the database and report its footprint and lookup latency."""
+    async def run():
+        db = get_database()
+        search = StudentSearch(db.students)
+        started = time.perf_counter()
+        class_ids = await db.classes.distinct("id")
+        await search.load_classes(class_ids, force=True)
+        build_seconds = time.perf_counter() - started
+        scopes = {}
+        async for class_doc in db.classes.find({}, {"_id": 0, "id": 1, "teacher_id": 1}):
+            scopes.setdefault(class_doc.get("teacher_id"), []).append(class_doc["id"])
+        return search.index, build_seconds, class_ids, list(scopes.values())
+
+    index, build_seconds, class_ids, teacher_scopes = asyncio.run(run())
+    report = index.memory_report()
+    typer.echo(f"Indexed {report['students']} students in {report['classes']} classes in {build_seconds:.2f}s")
+    for part in ("student_bytes", "prefix_bytes", "trigram_bytes", "total_bytes"):
+        typer.echo(f"  {part:14} {report[part] / 1_048_576:8.2f} MiB")
+
+    names = [entry[0] for class_index in index.classes.values() for entry in class_index.students.values()]
+    if not names:
+        return
+    rng = random.Random(seed)
+    for scope_name, pick_scope in (("teacher", lambda: rng.choice(teacher_scopes)), ("school", lambda: class_ids)):
+        timings = []
+        for query in _fuzzy_queries(names, queries, rng):
+            scope = pick_scope()
+            started = time.perf_counter()
+            index.search(query, scope, limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        typer.echo(
+            f"{scope_name:8} p50 {statistics.median(timings):.3f} ms  "
+            f"p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms  max {timings[-1]:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    cli()
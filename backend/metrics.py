@@ -0,0 +1,335 @@
+"""Request, MongoDB and password-hashing metrics in Prometheus text format.
+
+``MetricsMiddleware`` records per-route latency histograms, in-flight gauges
+and status counts. ``MongoCommandTimer`` is a pymongo ``CommandListener``
+that times every command by collection and operation and logs the ones
+slower than a threshold, and ``PoolMonitor`` follows each connection pool
+(open, checked-out and waiting connections) for the gauges and the health
+endpoints. Everything lands in one ``Registry`` rendered at ``/metrics``.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple, object] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in series]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if position < len(self.buckets):
+                series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items()]
+        lines = self.header()
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Run ``collector`` before every render, e.g. to copy pool stats into gauges."""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served", ("method",))
+http_responses = registry.counter("http_responses_total", "HTTP responses by route and status", ("method", "route", "status"))
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+mongo_command_failures = registry.counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+mongo_pool_connections = registry.gauge(
+    "mongo_pool_connections", "MongoDB connections by server: open, checked out, and callers waiting for one",
+    ("address", "state")
+)
+mongo_pool_checkout_failures = registry.counter(
+    "mongo_pool_checkout_failures_total", "Connection checkouts that failed, by reason", ("address", "reason")
+)
+mongo_pool_cleared = registry.counter(
+    "mongo_pool_cleared_total", "Pools cleared after a network error or a primary change", ("address",)
+)
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "Time spent waiting for and running bcrypt", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+idempotency_requests = registry.counter(
+    "idempotency_requests_total", "Write requests carrying an Idempotency-Key, by outcome", ("outcome",)
+)
+report_jobs = registry.counter("report_jobs_total", "Report job requests by outcome", ("outcome",))
+report_job_duration = registry.histogram(
+    "report_job_duration_seconds", "Time to load and build a report", ("kind",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+event_subscribers = registry.gauge("event_subscribers", "Open live attendance event subscriptions")
+events_published = registry.counter("events_published_total", "Attendance events published on this worker's bus")
+events_dropped = registry.counter(
+    "events_dropped_total", "Attendance events dropped for slow subscribers", ("policy",)
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec(method=method)
+            # FastAPI records the matched route in the scope during routing
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            http_request_duration.observe(elapsed, method=method, route=route_path)
+            http_responses.inc(method=method, route=route_path, status=status["code"])
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self, slow_threshold_ms: float = 100.0):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._pending: Dict[Tuple[int, int], Tuple[str, str]] = {}
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        return target if isinstance(target, str) else ""
+
+    def started(self, event):
+        self._pending[(event.request_id, event.operation_id)] = (self._collection(event), event.command_name)
+
+    def _finish(self, event, failed: bool):
+        collection, command = self._pending.pop((event.request_id, event.operation_id), ("", event.command_name))
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(seconds, collection=collection, command=command)
+        if failed:
+            mongo_command_failures.inc(collection=collection, command=command)
+        if seconds * 1000 >= self.slow_threshold_ms:
+            logger.warning("Slow MongoDB command %s on %s took %.1f ms", command, collection or "-", seconds * 1000)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool state per server, from pymongo's CMAP events.
+
+    ``waiting`` counts callers blocked in checkout: a pool at ``maxPoolSize``
+    with callers waiting is the pool, not MongoDB, being the bottleneck.
+    Events arrive on pymongo's threads as well as the event loop's.
+    """
+
+    STATES = ("open", "in_use", "waiting")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, int]] = {}
+
+    def _update(self, address, **changes):
+        name = f"{address[0]}:{address[1]}"
+        with self._lock:
+            pool = self._pools.setdefault(name, dict.fromkeys(self.STATES + ("checkout_failures", "cleared"), 0))
+            for field, change in changes.items():
+                pool[field] += change
+            for state in self.STATES:
+                mongo_pool_connections.set(pool[state], address=name, state=state)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(pool) for name, pool in self._pools.items()}
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+        mongo_pool_cleared.inc(address=f"{event.address[0]}:{event.address[1]}")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failures=1)
+        mongo_pool_checkout_failures.inc(address=f"{event.address[0]}:{event.address[1]}", reason=event.reason)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
@@ -0,0 +1,57 @@
+"""Keyset (cursor) pagination for list routes.
+
+A page is requested with ``limit`` and an opaque ``cursor``. The cursor encodes
+the sort-key values of the last row of the previous page, and the next page
+is everything strictly after it in the index order, so deep pages cost the
+same as the first one. Routes return the page as the response body and the
+token for the following page in the ``X-Next-Cursor`` header.
+"""
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fields: Sequence[str]) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor("Cursor does not match this listing")
+    return values
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence) -> dict:
+    """Filter for rows sorting strictly after ``values`` on ascending ``fields``."""
+    clauses = []
+    for position, field in enumerate(fields):
+        clause = {previous: values[index] for index, previous in enumerate(fields[:position])}
+        clause[field] = {"$gt": values[position]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+async def fetch_page(collection, query: dict, fields: Sequence[str], limit: int, cursor: Optional[str] = None,
+                     projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of ``query`` ordered by ``fields`` and the cursor for the next page."""
+    if cursor:
+        query = {"$and": [query, keyset_filter(fields, decode_cursor(cursor, fields))]}
+    rows = await collection.find(query, projection).sort([(field, 1) for field in fields]).limit(limit + 1).to_list(limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1][field] for field in fields])
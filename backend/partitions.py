@@ -0,0 +1,229 @@
+"""Attendance partitioned by academic year.
+
+With ``ATTENDANCE_PARTITIONING=year`` attendance lives in one collection per
+academic year (September to August), e.g. ``attendance_2024_2025`` or
+``attendance_sheets_2024_2025`` in compact storage, each carrying the same
+indexes as the unpartitioned collection. ``PartitionedStore`` exposes the
+store interface from ``attendance.py`` and routes every read and write to the
+partition for its date, so the collections and indexes the API works
+against only ever hold the current years.
+
+Closed years can be moved to the cold archive (``archive.py``) with
+``python manage.py archive-year``. Reads for an archived year are served from
+its memory-mapped files; writes to it are refused with ``ArchivedYearError``.
+Existing unpartitioned attendance is copied into partitions with
+``python manage.py partition-attendance``.
+"""
+from collections import OrderedDict
+from datetime import date as date_type
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from archive import Archive
+from attendance import DUPLICATE_KEY_ERROR, RecordStore, SheetStore, get_attendance_store
+from changes import Change, ChangeSequence
+from indexes import MANAGED_INDEXES, PARTITION_NAME, ensure_collection_indexes
+
+YEAR_START_MONTH = 9
+BASE_COLLECTIONS = {"records": "attendance", "compact": "attendance_sheets"}
+
+
+class ArchivedYearError(Exception):
+    """The academic year has been archived and is read-only."""
+
+
+def academic_year(day: str) -> str:
+    year, month = int(day[:4]), int(day[5:7])
+    start = year if month >= YEAR_START_MONTH else year - 1
+    return f"{start}-{start + 1}"
+
+
+def year_bounds(year: str) -> Tuple[str, str]:
+    """First and last date of an academic year, as ISO strings."""
+    start = int(year[:4])
+    return f"{start}-{YEAR_START_MONTH:02d}-01", f"{start + 1}-{YEAR_START_MONTH - 1:02d}-31"
+
+
+def is_closed(year: str, today: Optional[date_type] = None) -> bool:
+    return year_bounds(year)[1] < (today or date_type.today()).isoformat()
+
+
+def partition_name(base: str, year: str) -> str:
+    return f"{base}_{year.replace('-', '_')}"
+
+
+def _date_range(query: dict) -> Tuple[Optional[str], Optional[str]]:
+    condition = query.get("date")
+    if condition is None:
+        return None, None
+    if isinstance(condition, str):
+        return condition, condition
+    return condition.get("$gte", condition.get("$gt")), condition.get("$lte", condition.get("$lt"))
+
+
+class PartitionedStore:
+    def __init__(self, db, mode: str = "records", archive: Optional[Archive] = None):
+        if mode not in BASE_COLLECTIONS:
+            raise ValueError(f"Unknown attendance storage mode: {mode}")
+        self.db = db
+        self.mode = mode
+        self.base = BASE_COLLECTIONS[mode]
+        self.archive = archive
+        self.store_class = RecordStore if mode == "records" else SheetStore
+        self.day_counts = self.store_class.day_counts
+        self.sequence = ChangeSequence(db.counters)
+        self.years: Set[str] = set()
+        self._stores: Dict[str, object] = {}
+
+    def store_for_year(self, year: str):
+        if year not in self._stores:
+            self._stores[year] = self.store_class(self.db[partition_name(self.base, year)], self.sequence)
+        return self._stores[year]
+
+    def _archived(self, year: str) -> bool:
+        return self.archive is not None and self.archive.has(year)
+
+    def _reader(self, year: str):
+        return self.archive.open(year) if self._archived(year) else self.store_for_year(year)
+
+    async def refresh(self) -> List[str]:
+        """Discover the partitions that exist.
+
+        Another worker or ``manage.py`` can create a partition at any time, so
+        every read spanning years lists them again rather than trusting
+        ``years``; a partition this store missed would silently drop its rows
+        from exports and let sync step over its changes for good.
+        """
+        for name in await self.db.list_collection_names():
+            match = PARTITION_NAME.match(name)
+            if match and match.group(1) == self.base:
+                self.years.add(f"{match.group(2)}-{match.group(3)}")
+        return sorted(self.years)
+
+    async def _ensure_partition(self, year: str):
+        if year in self.years:
+            return
+        await ensure_collection_indexes(self.store_for_year(year).collection, MANAGED_INDEXES[self.base])
+        self.years.add(year)
+
+    def validate(self, submission):
+        year = academic_year(submission.date)
+        if self._archived(year):
+            raise ArchivedYearError(f"Attendance for {year} is archived and read-only")
+        self.store_for_year(year).validate(submission)
+
+    async def write_sessions(self, submissions: Sequence, teacher_id: str, ordered: bool = True,
+                             recorded_at=None, recorded_by: Optional[Sequence[str]] = None,
+                             whole_sessions: bool = False) -> List[dict]:
+        """Split the submissions by academic year and write each group to its partition.
+
+        An ordered write stops at the first partition that reports skipped rows;
+        the submissions after it are reported as skipped.
+        """
+        recorded_by = recorded_by or [teacher_id] * len(submissions)
+        groups: "OrderedDict[str, List[int]]" = OrderedDict()
+        for position, (_, submission) in enumerate(submissions):
+            groups.setdefault(academic_year(submission.date), []).append(position)
+        archived = [year for year in groups if self._archived(year)]
+        if archived:
+            raise ArchivedYearError(f"Attendance for {', '.join(archived)} is archived and read-only")
+
+        results: List[Optional[dict]] = [None] * len(submissions)
+        stopped = False
+        for year, positions in groups.items():
+            if stopped:
+                for position in positions:
+                    class_id, submission = submissions[position]
+                    student_ids = [record["student_id"] for record in submission.attendance_data]
+                    results[position] = {
+                        "class_id": class_id, "date": submission.date, "session": submission.session,
+                        "inserted": 0, "conflicts": [], "skipped": student_ids, "status": "skipped"
+                    }
+                continue
+            await self._ensure_partition(year)
+            written = await self.store_for_year(year).write_sessions(
+                [submissions[position] for position in positions], teacher_id, ordered, recorded_at,
+                [recorded_by[position] for position in positions], whole_sessions
+            )
+            for position, result in zip(positions, written):
+                results[position] = result
+            stopped = ordered and any(result["skipped"] for result in written)
+        return results
+
+    async def session_records(self, class_id: str, date: str, session: str, limit: int,
+                              cursor: Optional[str] = None):
+        return await self._reader(academic_year(date)).session_records(class_id, date, session, limit, cursor)
+
+    def day_lookup(self, date: str, as_field: str) -> dict:
+        return self.store_for_year(academic_year(date)).day_lookup(date, as_field)
+
+    async def _years_for(self, query: dict) -> List[str]:
+        start, end = _date_range(query)
+        years = set(await self.refresh()) | set(self.archive.years() if self.archive else [])
+        return sorted(
+            year for year in years
+            if (start is None or year_bounds(year)[1] >= start[:10]) and (end is None or year_bounds(year)[0] <= end)
+        )
+
+    async def iter_records(self, query: dict, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield matching records year by year, each year in class/date/session/student order."""
+        for year in await self._years_for(query):
+            async for record in self._reader(year).iter_records(query, batch_size):
+                yield record
+
+    async def changes(self, class_ids, since: int, limit: int) -> List[Change]:
+        """Changes across the live partitions; archived years are closed and never change."""
+        years = [year for year in await self.refresh() if not self._archived(year)]
+        changes = [
+            change for year in years
+            for change in await self.store_for_year(year).changes(class_ids, since, limit)
+        ]
+        return sorted(changes, key=lambda change: change[0])[:limit]
+
+
+def open_attendance_store(db, mode: str = "records", partitioning: str = "none", archive_dir: Optional[str] = None):
+    """The store for ``ATTENDANCE_STORAGE`` and ``ATTENDANCE_PARTITIONING`` ("none" or "year")."""
+    if partitioning == "none":
+        return get_attendance_store(db, mode)
+    if partitioning == "year":
+        return PartitionedStore(db, mode, Archive(archive_dir) if archive_dir else None)
+    raise ValueError(f"Unknown attendance partitioning: {partitioning}")
+
+
+async def partition_collection(db, mode: str = "records", delete_source: bool = False,
+                               batch_size: int = 1000) -> Dict[str, int]:
+    """Copy the unpartitioned attendance collection into per-year partitions."""
+    base = BASE_COLLECTIONS[mode]
+    source = db[base]
+    store = PartitionedStore(db, mode)
+    await store.refresh()
+    copied: Dict[str, int] = {}
+    pending: Dict[str, List[dict]] = {}
+
+    async def flush(year: str):
+        documents = pending.pop(year, [])
+        if not documents:
+            return
+        await store._ensure_partition(year)
+        # Re-running the copy is safe: rows already copied fail on the unique index
+        try:
+            await store.store_for_year(year).collection.insert_many(documents, ordered=False)
+        except BulkWriteError as exc:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in exc.details.get("writeErrors", [])):
+                raise
+        copied[year] = copied.get(year, 0) + len(documents)
+
+    async for document in source.find({}).batch_size(batch_size):
+        year = academic_year(document["date"])
+        pending.setdefault(year, []).append(document)
+        if len(pending[year]) >= batch_size:
+            await flush(year)
+    for year in list(pending):
+        await flush(year)
+
+    # Copies keep their id and change_seq, so sync clients see no change and
+    # dropping the source needs no tombstones
+    if delete_source:
+        await source.drop()
+    return copied
@@ -0,0 +1,292 @@
+"""Opt-in sampling profiler for requests.
+
+``ProfilingMiddleware`` picks requests to profile: a random ``sample_rate``
+fraction, every request whose path matches ``route_pattern``, and requests
+carrying the trigger header (``X-Profile`` by default) set to
+``header_token``. Without a ``header_token`` the header triggers nothing, so
+clients cannot turn profiling on for their own requests. While at least one profiled request is in
+flight, a daemon thread wakes every ``interval`` seconds and records one
+stack per profiled request:
+
+* if the request's task is running, the event loop thread's Python stack
+  from ``sys._current_frames()``, rooted at ``[cpu]``;
+* otherwise the task's suspended coroutine chain (``cr_await``), rooted at
+  ``[await]``, which is where time spent waiting on MongoDB or the threadpool
+  (sync dependencies such as ``verify_token``) shows up.
+
+Stacks are folded into the collapsed format (``frame;frame;frame count``)
+read by flamegraph.pl, speedscope and inferno, both aggregated per route and
+kept whole for the slowest ``keep_slowest`` requests. One profiler serves
+every school a worker routes to, so its results mix schools. Nothing runs unless the
+profiler is enabled. While it is, the interpreter's switch interval is lowered
+to the sampling interval, otherwise a CPU-bound request would hold the GIL
+for 5 ms at a time and starve the sampler thread.
+"""
+import asyncio
+import heapq
+import hmac
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+MAX_DEPTH = 80
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame) -> list:
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> List[str]:
+    labels = []
+    while coro is not None and len(labels) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            labels.append(f"<{type(coro).__name__}>")
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, task: asyncio.Task, method: str, path: str):
+        self.id = profile_id
+        self.task = task
+        self.method = method
+        self.path = path
+        self.route = path
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.stacks.values())
+        }
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.0, route_pattern: str = "",
+                 header: str = "x-profile", header_token: str = "", interval: float = 0.005, keep_slowest: int = 20):
+        self._default_switch_interval = sys.getswitchinterval()
+        self.sample_rate = sample_rate
+        self.route_pattern = route_pattern
+        self.header = header.lower()
+        self.header_token = header_token
+        self.interval = interval
+        self.keep_slowest = keep_slowest
+        self.loop_thread_id: Optional[int] = None
+        self.profiled = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._active: Dict[asyncio.Task, RequestProfile] = {}
+        self._routes: Dict[str, Counter] = {}
+        self._slowest: List[tuple] = []  # min-heap of (duration, id, profile)
+        self._ids = itertools.count(1)
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.enabled = enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        self._enabled = enabled
+        self._apply_switch_interval()
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @interval.setter
+    def interval(self, interval: float):
+        self._interval = interval
+        self._apply_switch_interval()
+
+    def _apply_switch_interval(self):
+        if not hasattr(self, "_enabled") or not hasattr(self, "_interval"):
+            return
+        if self._enabled:
+            sys.setswitchinterval(min(self._interval, self._default_switch_interval))
+        else:
+            sys.setswitchinterval(self._default_switch_interval)
+
+    @property
+    def route_pattern(self) -> str:
+        return self._route_regex.pattern if self._route_regex else ""
+
+    @route_pattern.setter
+    def route_pattern(self, pattern: str):
+        self._route_regex = re.compile(pattern) if pattern else None
+
+    def configure(self, **settings) -> dict:
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+        return self.config()
+
+    def config(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "route_pattern": self.route_pattern,
+            "header": self.header,
+            "interval": self.interval,
+            "keep_slowest": self.keep_slowest,
+            "profiled_requests": self.profiled,
+            "samples": self.samples,
+            "active": len(self._active)
+        }
+
+    def should_profile(self, path: str, headers: Dict[bytes, bytes]) -> bool:
+        if not self.enabled:
+            return False
+        trigger = headers.get(self.header.encode())
+        if trigger is not None and self.header_token and hmac.compare_digest(trigger, self.header_token.encode()):
+            return True
+        if self._route_regex and self._route_regex.search(path):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method: str, path: str) -> RequestProfile:
+        self.loop_thread_id = threading.get_ident()
+        profile = RequestProfile(next(self._ids), asyncio.current_task(), method, path)
+        with self._lock:
+            self._active[profile.task] = profile
+        self._ensure_thread()
+        self._wake.set()
+        return profile
+
+    def finish(self, profile: RequestProfile, route: Optional[str]):
+        profile.duration = time.perf_counter() - profile.started
+        profile.route = route or profile.path
+        with self._lock:
+            self._active.pop(profile.task, None)
+            profile.task = None
+            self.profiled += 1
+            self._routes.setdefault(f"{profile.method} {profile.route}", Counter()).update(profile.stacks)
+            entry = (profile.duration, profile.id, profile)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif self._slowest and entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+            if not self._active:
+                self._wake.clear()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        with self._lock:
+            active = list(self._active.values())
+        if not active or self.loop_thread_id is None:
+            return
+        loop_frame = sys._current_frames().get(self.loop_thread_id)
+        thread_stack = _thread_stack(loop_frame)
+        for profile in active:
+            task = profile.task
+            if task is None:
+                continue
+            coro = task.get_coro()
+            root_frame = getattr(coro, "cr_frame", None)
+            try:
+                # Running if the task's outermost coroutine frame is on the loop thread right now
+                if root_frame is not None and root_frame in thread_stack:
+                    position = thread_stack.index(root_frame)
+                    stack = "[cpu];" + ";".join(_frame_label(frame) for frame in thread_stack[position:])
+                else:
+                    stack = "[await];" + ";".join(_await_chain(coro))
+            except (AttributeError, ValueError):
+                # The request moved on while we were reading its frames
+                continue
+            with self._lock:
+                profile.stacks[stack] += 1
+                self.samples += 1
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Collapsed stacks for one route ("METHOD /path") or all routes, ready for flamegraph.pl."""
+        with self._lock:
+            stacks: Counter = Counter()
+            for name, counter in self._routes.items():
+                if route is None or name == route:
+                    stacks.update({f"{name};{stack}": count for stack, count in counter.items()})
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def routes(self) -> List[dict]:
+        with self._lock:
+            return sorted(
+                ({"route": name, "samples": sum(counter.values())} for name, counter in self._routes.items()),
+                key=lambda entry: -entry["samples"]
+            )
+
+    def slowest(self) -> List[dict]:
+        with self._lock:
+            return [profile.summary() for _, _, profile in sorted(self._slowest, reverse=True)]
+
+    def slowest_collapsed(self, profile_id: int) -> Optional[str]:
+        with self._lock:
+            for _, _, profile in self._slowest:
+                if profile.id == profile_id:
+                    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile.stacks.items()))
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._slowest.clear()
+            self.profiled = 0
+            self.samples = 0
+
+
+class ProfilingMiddleware:
+    """Pure ASGI, like ``MetricsMiddleware``, so the profile spans streamed bodies too."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope["path"], dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(scope["method"], scope["path"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            self.profiler.finish(profile, route)
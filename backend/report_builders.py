@@ -0,0 +1,46 @@
+"""Report builders, run in the report worker processes.
+
+Kept apart from ``reports`` so that importing the job queue does not import
+pandas: a server worker only pays for it once it handles a report or an
+analytics request. Keep this module free of server state.
+"""
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from analytics import ABSENT, PRESENT, absence_rates, build_matrix, student_table
+
+
+def class_sheet(columns: Dict[str, list], names: Dict[str, str]) -> pd.DataFrame:
+    """One row per student, one column per session with P/A, and the month's totals."""
+    matrix = build_matrix(columns)
+    labels = [f"{day:%Y-%m-%d} {session}" for day, session in zip(matrix.dates, matrix.sessions)]
+    cells = np.where(matrix.statuses == ABSENT, "A", np.where(matrix.statuses == PRESENT, "P", ""))
+    frame = pd.DataFrame(cells, columns=labels)
+    frame.insert(0, "student_id", matrix.student_ids)
+    frame.insert(0, "full_name", [names.get(student_id, "") for student_id in matrix.student_ids])
+    frame["present"] = (matrix.statuses == PRESENT).sum(axis=1)
+    frame["absent"] = (matrix.statuses == ABSENT).sum(axis=1)
+    frame["absence_rate"] = np.round(absence_rates(matrix), 2)
+    return frame.sort_values(["full_name", "student_id"])
+
+
+def absence_summary(columns: Dict[str, list], names: Dict[str, str]) -> pd.DataFrame:
+    """Per-student absence totals and streaks, most absent first."""
+    table = student_table(build_matrix(columns))
+    table.insert(1, "full_name", [names.get(student_id, "") for student_id in table["student_id"]])
+    return table.sort_values(["absence_rate", "student_id"], ascending=[False, True])
+
+
+BUILDERS = {"class-sheet": class_sheet, "absence-summary": absence_summary}
+
+
+def render_report(kind: str, columns: Dict[str, list], names: Dict[str, str], format: str) -> bytes:
+    if columns["student_id"]:
+        frame = BUILDERS[kind](columns, names)
+    else:
+        frame = pd.DataFrame(columns=["full_name", "student_id"])
+    if format == "csv":
+        return frame.to_csv(index=False).encode()
+    return frame.to_json(orient="records").encode()
@@ -0,0 +1,197 @@
+"""Background report jobs.
+
+``POST /api/reports`` enqueues a report and answers 202 straight away. The job
+reads its attendance columns on the event loop in batches that hand the loop
+back between them, then builds the table in a process pool
+(``report_builders``), so pandas never competes with request handlers for the
+GIL. The finished CSV or JSON is stored in ``report_jobs`` under a content
+key, the SHA-256 of the report kind, parameters and format, and expires via
+a TTL index. Only finished jobs carry ``expires_at``: a queued or running job
+has a ``stale_at`` instead, after which it is presumed lost with its worker
+and the next identical request starts over, so the TTL monitor can never
+delete a job from under the task still writing it.
+
+Because the job id *is* the content key, identical requests share one job:
+a second request while the first is queued or running, or after it finished
+and before it expired, gets the existing job back. The claim is an insert on
+``_id``, so this holds across workers too. Reports are limited to what fits in
+one document (16 MB), which is far above a term report for a school.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from metrics import report_job_duration, report_jobs
+
+logger = logging.getLogger(__name__)
+
+REPORT_KINDS = ("class-sheet", "absence-summary")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "json": "application/json"}
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+STATUS_PROJECTION = {"content": 0}
+
+
+def content_key(kind: str, params: dict, format: str) -> str:
+    canonical = json.dumps({"kind": kind, "params": params, "format": format}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def is_live(document: dict, now: datetime) -> bool:
+    """Whether a job can be shared: finished and unexpired, or queued/running and not stale."""
+    if document["state"] == DONE:
+        return document["expires_at"] > now
+    if document["state"] in (QUEUED, RUNNING):
+        return document["stale_at"] > now
+    return False
+
+
+def job_status(document: dict) -> dict:
+    status = {key: value for key, value in document.items() if key not in ("_id", "content")}
+    status["id"] = document["_id"]
+    return status
+
+
+class ReportJobs:
+    def __init__(self, collection, store, students_collection, max_workers: int = 2, ttl: float = 3600.0,
+                 job_timeout: float = 600.0, executor: Optional[ProcessPoolExecutor] = None):
+        self.collection = collection
+        self.store = store
+        self.students = students_collection
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.job_timeout = job_timeout
+        # A pool passed in is shared with other schools and shut down by its owner
+        self._pool = executor
+        self._owns_pool = executor is None
+        self._slots = asyncio.Semaphore(max_workers)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the server process holds Motor's threads and locks
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def submit(self, kind: str, params: dict, format: str, class_ids: List[str], query: dict) -> dict:
+        """Start the report, or return the live job already producing the same content."""
+        job_id = content_key(kind, params, format)
+        now = datetime.utcnow()
+        existing = await self.collection.find_one({"_id": job_id}, STATUS_PROJECTION)
+        if existing and is_live(existing, now):
+            report_jobs.inc(outcome="deduplicated")
+            return job_status(existing)
+
+        job = {
+            "state": QUEUED,
+            "kind": kind,
+            "params": params,
+            "format": format,
+            "class_ids": sorted(class_ids),
+            "created_at": now,
+            "stale_at": now + timedelta(seconds=self.job_timeout)
+        }
+        if existing:
+            # Replace a failed, expired or stale job only if nobody else replaced it first
+            claimed = await self.collection.replace_one(
+                {"_id": job_id, "state": existing["state"], "created_at": existing["created_at"]}, job
+            )
+            if not claimed.modified_count:
+                report_jobs.inc(outcome="deduplicated")
+                return job_status(await self.collection.find_one({"_id": job_id}, STATUS_PROJECTION))
+        else:
+            try:
+                await self.collection.insert_one({"_id": job_id, **job})
+            except DuplicateKeyError:
+                report_jobs.inc(outcome="deduplicated")
+                return job_status(await self.collection.find_one({"_id": job_id}, STATUS_PROJECTION))
+
+        report_jobs.inc(outcome="started")
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, now, kind, format, class_ids, query))
+        return job_status({"_id": job_id, **job})
+
+    def _finished(self) -> dict:
+        now = datetime.utcnow()
+        return {"finished_at": now, "expires_at": now + timedelta(seconds=self.ttl)}
+
+    async def _run(self, job_id: str, created_at: datetime, kind: str, format: str, class_ids: List[str],
+                   query: dict):
+        # A job that went stale may have been claimed again; its updates then belong to the new claim
+        claim = {"_id": job_id, "created_at": created_at}
+        try:
+            async with self._slots:
+                started = time.perf_counter()
+                running_at = datetime.utcnow()
+                await self.collection.update_one(claim, {"$set": {
+                    "state": RUNNING,
+                    "started_at": running_at,
+                    "stale_at": running_at + timedelta(seconds=self.job_timeout)
+                }})
+                # Imported here so that pandas loads with the first report, not with every worker
+                from analytics import load_columns
+                from report_builders import render_report
+                columns = await load_columns(self.store, query)
+                cursor = self.students.find({"class_id": {"$in": class_ids}}, {"_id": 0, "id": 1, "full_name": 1})
+                names = {student["id"]: student["full_name"] async for student in cursor}
+                loop = asyncio.get_running_loop()
+                content = await loop.run_in_executor(self._executor(), render_report, kind, columns, names, format)
+                report_job_duration.observe(time.perf_counter() - started, kind=kind)
+            await self.collection.update_one(claim, {
+                "$set": {
+                    "state": DONE,
+                    "content": Binary(content),
+                    "size": len(content),
+                    "rows": len(columns["student_id"]),
+                    **self._finished()
+                },
+                "$unset": {"stale_at": ""}
+            })
+            report_jobs.inc(outcome="done")
+        except asyncio.CancelledError:
+            # Shutting down: release the claim so the next identical request starts over
+            await self.collection.update_one(claim, {
+                "$set": {"state": FAILED, "error": "Cancelled at shutdown", **self._finished()},
+                "$unset": {"stale_at": ""}
+            })
+            raise
+        except Exception as exc:
+            logger.exception("Report job %s (%s) failed", job_id, kind)
+            report_jobs.inc(outcome="failed")
+            await self.collection.update_one(claim, {
+                "$set": {"state": FAILED, "error": str(exc), **self._finished()},
+                "$unset": {"stale_at": ""}
+            })
+        finally:
+            if self._tasks.get(job_id) is asyncio.current_task():
+                self._tasks.pop(job_id)
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        document = await self.collection.find_one({"_id": job_id}, STATUS_PROJECTION)
+        return job_status(document) if document else None
+
+    async def result(self, job_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def shutdown(self):
+        """Cancel queued and running jobs and stop the worker processes."""
+        tasks = dict(self._tasks)
+        for task in tasks.values():
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            # A task cancelled before its first step never reaches its own cleanup
+            await self.collection.update_many({"_id": {"$in": list(tasks)}, "state": QUEUED}, {
+                "$set": {"state": FAILED, "error": "Cancelled at shutdown", **self._finished()},
+                "$unset": {"stale_at": ""}
+            })
+        if self._pool is not None and self._owns_pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,217 @@
+"""Incrementally maintained attendance rollups.
+
+Each attendance write also bumps three small collections, so dashboards read
+precomputed counters instead of aggregating raw attendance:
+
+``attendance_student_months``
+    present/absent counts per (student_id, month).
+``attendance_class_days``
+    present/absent counts and submitted sessions per (class_id, date).
+``attendance_student_streaks``
+    current and longest run of consecutive absent sessions per student.
+
+Only rows a write actually inserted are counted, so conflicting re-submissions
+never double count. ``python manage.py rebuild-rollups`` recomputes all three
+from the attendance store for backfills or after drift.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import UpdateOne
+
+SESSION_ORDER = {"morning": 0, "afternoon": 1}
+
+STUDENT_MONTHS = "attendance_student_months"
+CLASS_DAYS = "attendance_class_days"
+STUDENT_STREAKS = "attendance_student_streaks"
+
+
+def session_position(date: str, session: str) -> str:
+    """Sortable key placing a session in chronological order."""
+    return f"{date}#{SESSION_ORDER.get(session, len(SESSION_ORDER))}{session}"
+
+
+def absence_rate(present: int, absent: int) -> float:
+    total = present + absent
+    return round(100.0 * absent / total, 2) if total else 0.0
+
+
+def _counts(status: str) -> Tuple[int, int]:
+    return (0, 1) if status == "absent" else (1, 0)
+
+
+def _streak_update(student_id: str, class_id: str, position: str, absent: bool) -> UpdateOne:
+    # Sessions recorded out of order (an earlier date submitted late) are
+    # counted in the monthly totals but do not move the streak
+    is_newer = {"$lt": [{"$ifNull": ["$last_position", ""]}, position]}
+    current = {"$ifNull": ["$current_absence_streak", 0]}
+    next_current = {"$add": [current, 1]} if absent else 0
+    return UpdateOne(
+        {"student_id": student_id},
+        [
+            {"$set": {
+                "class_id": class_id,
+                "current_absence_streak": {"$cond": [is_newer, next_current, current]},
+                "last_position": {"$cond": [is_newer, position, "$last_position"]}
+            }},
+            {"$set": {
+                "longest_absence_streak": {"$max": [
+                    {"$ifNull": ["$longest_absence_streak", 0]}, "$current_absence_streak"
+                ]}
+            }}
+        ],
+        upsert=True
+    )
+
+
+def inserted_records(submissions: Sequence, results: Sequence[dict]) -> Iterable[Tuple[str, object, dict]]:
+    """Yield (class_id, submission, record) for every row a write inserted."""
+    for (class_id, submission), result in zip(submissions, results):
+        not_written = set(result["conflicts"]) | set(result["skipped"])
+        for record in submission.attendance_data:
+            if record["student_id"] not in not_written:
+                yield class_id, submission, record
+
+
+async def apply_rollups(db, submissions: Sequence, results: Sequence[dict]):
+    """Fold the rows inserted by a ``write_sessions`` call into the rollups."""
+    month_ops, day_counts, streak_ops = [], defaultdict(lambda: [0, 0, set()]), []
+    for class_id, submission, record in inserted_records(submissions, results):
+        present, absent = _counts(record["status"])
+        month_ops.append(UpdateOne(
+            {"student_id": record["student_id"], "month": submission.date[:7]},
+            {"$inc": {"present": present, "absent": absent}, "$set": {"class_id": class_id}},
+            upsert=True
+        ))
+        day = day_counts[(class_id, submission.date)]
+        day[0] += present
+        day[1] += absent
+        day[2].add(submission.session)
+        streak_ops.append(_streak_update(
+            record["student_id"], class_id, session_position(submission.date, submission.session), bool(absent)
+        ))
+
+    day_ops = [
+        UpdateOne(
+            {"class_id": class_id, "date": date},
+            {"$inc": {"present": present, "absent": absent}, "$addToSet": {"sessions": {"$each": sorted(sessions)}}},
+            upsert=True
+        )
+        for (class_id, date), (present, absent, sessions) in day_counts.items()
+    ]
+    for collection_name, operations in ((STUDENT_MONTHS, month_ops), (CLASS_DAYS, day_ops), (STUDENT_STREAKS, streak_ops)):
+        if operations:
+            await db[collection_name].bulk_write(operations, ordered=True)
+
+
+async def rebuild_rollups(db, store, batch_size: int = 1000) -> Dict[str, int]:
+    """Recompute every rollup from the attendance store."""
+    months: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0, None])
+    days: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0, set()])
+    streaks: Dict[str, dict] = {}
+
+    def fold(records: List[dict]):
+        records.sort(key=lambda record: session_position(record["date"], record["session"]))
+        for record in records:
+            present, absent = _counts(record["status"])
+            month = months[(record["student_id"], record["date"][:7])]
+            month[0] += present
+            month[1] += absent
+            month[2] = record["class_id"]
+            day = days[(record["class_id"], record["date"])]
+            day[0] += present
+            day[1] += absent
+            day[2].add(record["session"])
+            streak = streaks.setdefault(record["student_id"], {
+                "class_id": record["class_id"], "current_absence_streak": 0, "longest_absence_streak": 0,
+                "last_position": ""
+            })
+            position = session_position(record["date"], record["session"])
+            if position > streak["last_position"]:
+                streak["current_absence_streak"] = streak["current_absence_streak"] + 1 if absent else 0
+                streak["longest_absence_streak"] = max(streak["longest_absence_streak"], streak["current_absence_streak"])
+                streak["last_position"] = position
+                streak["class_id"] = record["class_id"]
+
+    # Records arrive ordered by class, date, session name; buffer one class-day at
+    # a time so its sessions can be replayed in chronological order
+    pending: List[dict] = []
+    async for record in store.iter_records({}, batch_size):
+        if pending and (pending[0]["class_id"], pending[0]["date"]) != (record["class_id"], record["date"]):
+            fold(pending)
+            pending = []
+        pending.append(record)
+    fold(pending)
+
+    month_docs = [
+        {"student_id": student_id, "month": month, "class_id": class_id, "present": present, "absent": absent}
+        for (student_id, month), (present, absent, class_id) in months.items()
+    ]
+    day_docs = [
+        {"class_id": class_id, "date": date, "present": present, "absent": absent, "sessions": sorted(sessions)}
+        for (class_id, date), (present, absent, sessions) in days.items()
+    ]
+    streak_docs = [{"student_id": student_id, **streak} for student_id, streak in streaks.items()]
+
+    for collection_name, documents in ((STUDENT_MONTHS, month_docs), (CLASS_DAYS, day_docs), (STUDENT_STREAKS, streak_docs)):
+        await db[collection_name].delete_many({})
+        for start in range(0, len(documents), batch_size):
+            await db[collection_name].insert_many(documents[start:start + batch_size], ordered=False)
+    return {STUDENT_MONTHS: len(month_docs), CLASS_DAYS: len(day_docs), STUDENT_STREAKS: len(streak_docs)}
+
+
+async def student_absence(db, student_id: str, start_month: str = None, end_month: str = None) -> dict:
+    query = {"student_id": student_id}
+    if start_month or end_month:
+        query["month"] = {}
+        if start_month:
+            query["month"]["$gte"] = start_month
+        if end_month:
+            query["month"]["$lte"] = end_month
+    months = await db[STUDENT_MONTHS].find(query, {"_id": 0, "student_id": 0}).sort("month", 1).to_list(None)
+    streak = await db[STUDENT_STREAKS].find_one({"student_id": student_id}, {"_id": 0}) or {}
+    present = sum(month["present"] for month in months)
+    absent = sum(month["absent"] for month in months)
+    for month in months:
+        month["absence_rate"] = absence_rate(month["present"], month["absent"])
+    return {
+        "student_id": student_id,
+        "present": present,
+        "absent": absent,
+        "absence_rate": absence_rate(present, absent),
+        "current_absence_streak": streak.get("current_absence_streak", 0),
+        "longest_absence_streak": streak.get("longest_absence_streak", 0),
+        "months": months
+    }
+
+
+async def class_summary(db, class_id: str, month: str) -> dict:
+    days = await db[CLASS_DAYS].find(
+        {"class_id": class_id, "date": {"$gte": month, "$lt": month + "~"}}, {"_id": 0, "class_id": 0}
+    ).sort("date", 1).to_list(None)
+    students = await db[STUDENT_MONTHS].find(
+        {"class_id": class_id, "month": month}, {"_id": 0, "class_id": 0, "month": 0}
+    ).to_list(None)
+    streaks = {
+        streak["student_id"]: streak
+        async for streak in db[STUDENT_STREAKS].find(
+            {"student_id": {"$in": [student["student_id"] for student in students]}}, {"_id": 0}
+        )
+    }
+    for day in days:
+        day["absence_rate"] = absence_rate(day["present"], day["absent"])
+    for student in students:
+        student["absence_rate"] = absence_rate(student["present"], student["absent"])
+        student["current_absence_streak"] = streaks.get(student["student_id"], {}).get("current_absence_streak", 0)
+    students.sort(key=lambda student: student["absence_rate"], reverse=True)
+    present = sum(day["present"] for day in days)
+    absent = sum(day["absent"] for day in days)
+    return {
+        "class_id": class_id,
+        "month": month,
+        "present": present,
+        "absent": absent,
+        "absence_rate": absence_rate(present, absent),
+        "days": days,
+        "students": students
+    }
@@ -0,0 +1,124 @@
+"""Routing schools to their own databases.
+
+One deployment serves many schools, each in a database of its own so that
+no collection, index or cache is shared between them. A school can live on
+the default cluster or on a cluster of its own; moving a busy school to
+another mongod is a change to its route, not to the code.
+
+Routes come from ``SCHOOL_ROUTES``, a JSON object keyed by school id::
+
+    {"ibn-sina": {"uri": "mongodb://db2:27017", "database": "ibn_sina"},
+     "al-farabi": {"database": "al_farabi"}}
+
+``uri`` defaults to ``MONGO_URL`` and ``database`` to ``attendance_<school_id>``.
+The default school (``DEFAULT_SCHOOL_ID``, used for tokens without a
+``school_id`` claim) maps to ``MONGO_URL``/``ATTENDANCE_DB_NAME``, so a
+single-school deployment needs no configuration. Schools on the same URI
+share one Motor client, and so one connection pool.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+SCHOOL_ID = re.compile(r"^[A-Za-z0-9_-]{1,48}$")
+
+Route = Tuple[str, str]  # (MongoDB URI, database name)
+
+
+class UnknownSchool(Exception):
+    """No route is configured for the school."""
+
+
+def load_routes(default_school: str, default_uri: str, default_database: str, config: str = "") -> Dict[str, Route]:
+    routes = {default_school: (default_uri, default_database)}
+    for school_id, target in json.loads(config or "{}").items():
+        if not SCHOOL_ID.match(school_id):
+            raise ValueError(f"Invalid school id in SCHOOL_ROUTES: {school_id!r}")
+        routes[school_id] = (
+            target.get("uri", default_uri),
+            target.get("database", f"attendance_{school_id.replace('-', '_')}")
+        )
+    targets: Dict[Route, str] = {}
+    for school_id, route in routes.items():
+        if route in targets:
+            raise ValueError(f"Schools {targets[route]!r} and {school_id!r} are routed to the same database")
+        targets[route] = school_id
+    return routes
+
+
+def archive_directory(base: str, school_id: str, default_school: str) -> str:
+    """Cold archive of one school; the default school keeps the unrouted layout."""
+    return base if school_id == default_school else os.path.join(base, school_id)
+
+
+class SchoolRouter:
+    """Resolve a school id to its database, opening the school on first use.
+
+    ``open_school(school_id, db)`` builds whatever the caller keeps per school
+    and returns it; it runs once per school however many requests race for
+    it. The returned object must have an async ``close()``.
+    """
+
+    def __init__(self, routes: Dict[str, Route], client_factory: Callable[[str], object],
+                 open_school: Callable[[str, object], Awaitable]):
+        self.routes = routes
+        self.client_factory = client_factory
+        self.open_school = open_school
+        self._clients: Dict[str, object] = {}
+        self._schools: Dict[str, object] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def route(self, school_id: str) -> Route:
+        try:
+            return self.routes[school_id]
+        except KeyError:
+            raise UnknownSchool(f"Unknown school: {school_id}")
+
+    def client(self, uri: str):
+        if uri not in self._clients:
+            self._clients[uri] = self.client_factory(uri)
+        return self._clients[uri]
+
+    def database(self, school_id: str):
+        uri, name = self.route(school_id)
+        return self.client(uri)[name]
+
+    async def get(self, school_id: str):
+        school = self._schools.get(school_id)
+        if school is not None:
+            return school
+        db = self.database(school_id)
+        async with self._locks.setdefault(school_id, asyncio.Lock()):
+            if school_id not in self._schools:
+                self._schools[school_id] = await self.open_school(school_id, db)
+        return self._schools[school_id]
+
+    def opened(self) -> List[object]:
+        return list(self._schools.values())
+
+    async def ping(self, timeout: float) -> Dict[str, dict]:
+        """Round-trip to MongoDB once per client, reported for each opened school using it."""
+        async def ping_client(client) -> dict:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(client.admin.command("ping"), timeout)
+            except Exception as exc:
+                return {"ok": False, "error": type(exc).__name__}
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+        uris = list(self._clients)
+        results = dict(zip(uris, await asyncio.gather(*(ping_client(self._clients[uri]) for uri in uris))))
+        return {school_id: results[self.routes[school_id][0]] for school_id in self._schools}
+
+    def stats(self) -> dict:
+        return {"schools": len(self.routes), "opened": len(self._schools), "clients": len(self._clients)}
+
+    async def close(self):
+        schools, self._schools = list(self._schools.values()), {}
+        await asyncio.gather(*(school.close() for school in schools))
+        for client in self._clients.values():
+            client.close()
+        self._clients = {}
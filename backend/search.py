@@ -0,0 +1,213 @@
+"""In-memory student name search.
+
+Names are normalized (accents stripped, lower-cased) and indexed per class in
+two structures: a sorted list of (name token, student id) pairs for prefix
+matches, found with ``bisect``, and trigram posting lists for fuzzy matches.
+Searches only visit the classes the caller may access, so a teacher's lookup
+touches a few hundred names however large the school is.
+
+``StudentSearch`` loads classes lazily with one ``$in`` query and reloads a
+class once its copy is older than ``refresh_after`` seconds
+(``SEARCH_REFRESH_SECONDS``). Each worker holds its own index: students
+written inside the worker are applied at once through ``upsert``/``remove``,
+while writes from other workers, ``manage.py`` or ``datagen.py`` show up
+once the class is reloaded. Results are ranked by prefix coverage, then trigram similarity
+(Jaccard over padded trigrams), then name.
+"""
+import bisect
+import heapq
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+MIN_SIMILARITY = 0.2
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join("".join(char if char.isalnum() else " " for char in stripped.lower()).split())
+
+
+def trigrams(normalized: str) -> FrozenSet[str]:
+    padded = f"  {normalized} "
+    # Interned, so each distinct trigram is stored once across every class
+    return frozenset(sys.intern(padded[position:position + 3]) for position in range(len(padded) - 2))
+
+
+class ClassIndex:
+    def __init__(self, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.students: Dict[str, Tuple[str, str, int]] = {}  # id -> (full_name, normalized, trigram count)
+        self.tokens: List[Tuple[str, str]] = []
+        # Class rosters are small, so plain lists beat sets on memory
+        self.postings: Dict[str, List[str]] = defaultdict(list)
+
+    def add(self, student_id: str, full_name: str):
+        self.discard(student_id)
+        normalized = normalize(full_name)
+        grams = trigrams(normalized)
+        self.students[student_id] = (full_name, normalized, len(grams))
+        for token in set(normalized.split()):
+            bisect.insort(self.tokens, (token, student_id))
+        for gram in grams:
+            self.postings[gram].append(student_id)
+
+    def discard(self, student_id: str):
+        entry = self.students.pop(student_id, None)
+        if entry is None:
+            return
+        _, normalized, _ = entry
+        for token in set(normalized.split()):
+            position = bisect.bisect_left(self.tokens, (token, student_id))
+            if position < len(self.tokens) and self.tokens[position] == (token, student_id):
+                del self.tokens[position]
+        for gram in trigrams(normalized):
+            posting = self.postings.get(gram)
+            if posting is not None and student_id in posting:
+                posting.remove(student_id)
+                if not posting:
+                    del self.postings[gram]
+
+    def prefix_matches(self, query_tokens: List[str]) -> Dict[str, int]:
+        """Number of query tokens that prefix one of each student's name tokens."""
+        matched: Dict[str, int] = defaultdict(int)
+        for query_token in query_tokens:
+            seen = set()
+            position = bisect.bisect_left(self.tokens, (query_token, ""))
+            while position < len(self.tokens) and self.tokens[position][0].startswith(query_token):
+                student_id = self.tokens[position][1]
+                if student_id not in seen:
+                    seen.add(student_id)
+                    matched[student_id] += 1
+                position += 1
+        return matched
+
+    def shared_trigrams(self, query_grams: FrozenSet[str]) -> Dict[str, int]:
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in query_grams:
+            for student_id in self.postings.get(gram, ()):
+                shared[student_id] += 1
+        return shared
+
+
+class StudentIndex:
+    def __init__(self):
+        self.classes: Dict[str, ClassIndex] = {}
+
+    def load_class(self, class_id: str, students: Iterable[dict], loaded_at: Optional[float] = None):
+        index = ClassIndex(time.monotonic() if loaded_at is None else loaded_at)
+        for student in students:
+            index.add(student["id"], student["full_name"])
+        self.classes[class_id] = index
+
+    def upsert(self, student: dict):
+        """Index a new or renamed student, moving them if their class changed."""
+        for class_id, index in self.classes.items():
+            if class_id != student["class_id"]:
+                index.discard(student["id"])
+        index = self.classes.get(student["class_id"])
+        if index is not None:
+            index.add(student["id"], student["full_name"])
+
+    def remove(self, student_id: str):
+        for index in self.classes.values():
+            index.discard(student_id)
+
+    def search(self, query: str, class_ids: Iterable[str], limit: int = 20) -> List[dict]:
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        query_tokens = normalized.split()
+        query_grams = trigrams(normalized)
+        ranked = []
+        for class_id in class_ids:
+            index = self.classes.get(class_id)
+            if index is None:
+                continue
+            matched = index.prefix_matches(query_tokens)
+            shared = index.shared_trigrams(query_grams)
+            for student_id in matched.keys() | shared.keys():
+                full_name, student_normalized, gram_count = index.students[student_id]
+                common = shared.get(student_id, 0)
+                similarity = common / (len(query_grams) + gram_count - common)
+                coverage = matched.get(student_id, 0) / len(query_tokens)
+                if coverage == 0 and similarity < MIN_SIMILARITY:
+                    continue
+                score = coverage + similarity + (1.0 if student_normalized == normalized else 0.0)
+                ranked.append((score, full_name, student_id, class_id))
+        best = heapq.nsmallest(limit, ranked, key=lambda item: (-item[0], item[1], item[2]))
+        return [
+            {"id": student_id, "full_name": full_name, "class_id": class_id, "score": round(score, 4)}
+            for score, full_name, student_id, class_id in best
+        ]
+
+    def memory_report(self) -> Dict[str, int]:
+        """Approximate footprint in bytes; strings shared between structures are counted once."""
+        seen: Set[int] = set()
+
+        def size(value) -> int:
+            if id(value) in seen:
+                return 0
+            seen.add(id(value))
+            return sys.getsizeof(value)
+
+        students = tokens = postings = 0
+        student_count = 0
+        for index in self.classes.values():
+            student_count += len(index.students)
+            students += sys.getsizeof(index.students)
+            for student_id, entry in index.students.items():
+                students += size(student_id) + sys.getsizeof(entry) + size(entry[0]) + size(entry[1])
+            tokens += sys.getsizeof(index.tokens) + sum(
+                sys.getsizeof(pair) + size(pair[0]) for pair in index.tokens
+            )
+            postings += sys.getsizeof(index.postings) + sum(
+                size(gram) + sys.getsizeof(posting) for gram, posting in index.postings.items()
+            )
+        return {
+            "classes": len(self.classes),
+            "students": student_count,
+            "student_bytes": students,
+            "prefix_bytes": tokens,
+            "trigram_bytes": postings,
+            "total_bytes": students + tokens + postings
+        }
+
+
+class StudentSearch:
+    """A ``StudentIndex`` kept in step with ``students`` by lazy per-class loads."""
+
+    def __init__(self, collection, refresh_after: float = 300.0):
+        self.collection = collection
+        self.refresh_after = refresh_after
+        self.index = StudentIndex()
+
+    async def load_classes(self, class_ids: Iterable[str], force: bool = False):
+        now = time.monotonic()
+        stale = [
+            class_id for class_id in class_ids
+            if force or class_id not in self.index.classes
+            or now - self.index.classes[class_id].loaded_at > self.refresh_after
+        ]
+        if not stale:
+            return
+        rosters: Dict[str, List[dict]] = {class_id: [] for class_id in stale}
+        cursor = self.collection.find({"class_id": {"$in": stale}}, {"_id": 0, "id": 1, "full_name": 1, "class_id": 1})
+        async for student in cursor:
+            rosters[student["class_id"]].append(student)
+        for class_id, students in rosters.items():
+            self.index.load_class(class_id, students, now)
+
+    def upsert(self, student: dict):
+        self.index.upsert(student)
+
+    def remove(self, student_id: str):
+        self.index.remove(student_id)
+
+    async def search(self, query: str, class_ids: Iterable[str], limit: int = 20) -> List[dict]:
+        class_ids = list(class_ids)
+        await self.load_classes(class_ids)
+        return self.index.search(query, class_ids, limit)
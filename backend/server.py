@@ -1,55 +1,236 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
-import os
-from typing import List, Optional
+from pymongo.errors import PyMongoError
+import re
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from datetime import datetime, time, date
 import uuid
 import jwt
 from dotenv import load_dotenv
-from bson import ObjectId
-import json
 
-# Custom JSON encoder to handle ObjectId
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        return json.JSONEncoder.default(self, o)
+from attendance import InvalidStatus
+from cache import AuthorizationCache
+from changes import ChangeSequence, Tombstones, collect_changes, find_changes
+from events import EventBus, MongoEventRelay, sse_stream
+from export import MEDIA_TYPES, export_filter, stream_export
+from hashing import HashingSaturated, PasswordHasher
+from idempotency import IdempotencyInProgress, IdempotencyMismatch, IdempotencyStore, fingerprint
+from indexes import ensure_indexes
+from ingest import IngestQueue, IngestSaturated
+from metrics import MetricsMiddleware, MongoCommandTimer, PoolMonitor, password_hash_duration, registry
+from partitions import ArchivedYearError, PartitionedStore, open_attendance_store
+from profiler import Profiler, ProfilingMiddleware
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, fetch_page
+from reports import MEDIA_TYPES as REPORT_MEDIA_TYPES, REPORT_KINDS, ReportJobs
+from rollups import apply_rollups, class_summary, student_absence
+from schools import SchoolRouter, UnknownSchool, archive_directory
+from search import StudentSearch
+from settings import Settings
+from versions import ResourceVersions, classes_key, http_date, is_not_modified, make_etag, roster_key, sheet_key
 
 load_dotenv()
 
-app = FastAPI(title="Attendance Management System")
-
-# CORS Configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# MongoDB Connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.attendance_system
-
-# Collections
-teachers_collection = db.teachers
-classes_collection = db.classes
-students_collection = db.students
-attendance_collection = db.attendance
+# orjson serializes responses several times faster than the stdlib encoder;
+# fall back to the stdlib when it is not installed
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
-SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
+optional_security = HTTPBearer(auto_error=False)
+
+class Services:
+    """What one app owns across schools: its settings, the school router and the shared pools.
+
+    Built by ``create_app`` without any I/O. A Motor client is created by the
+    first request for a school on its URI, and report worker processes by the
+    first report.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.started_at = datetime.utcnow()
+        self.closing = False
+        # Sampling profiler, off unless PROFILER_ENABLED is set or an operator turns it on
+        self.profiler = Profiler(
+            enabled=settings.profiler_enabled,
+            sample_rate=settings.profiler_sample_rate,
+            route_pattern=settings.profiler_route_pattern,
+            header=settings.profiler_header,
+            header_token=settings.profiler_header_token,
+            interval=settings.profiler_interval,
+            keep_slowest=settings.profiler_keep_slowest,
+        )
+        # Live attendance events: "local" delivers within this worker, "changestream"
+        # relays through MongoDB so every worker sees every submission (needs a replica set)
+        self.event_bus = EventBus(
+            maxsize=settings.event_queue_size,
+            policy=settings.event_queue_policy,
+            block_timeout=settings.event_block_timeout,
+        )
+        self.password_hasher = PasswordHasher(
+            pwd_context,
+            max_concurrency=settings.hash_max_concurrency,
+            max_queue=settings.hash_max_queue,
+            queue_timeout=settings.hash_queue_timeout,
+        )
+        self.pool_monitor = PoolMonitor()
+        # Each school in its own database, on MONGO_URL or the cluster SCHOOL_ROUTES names
+        self.schools = SchoolRouter(
+            settings.routes(),
+            client_factory=self.create_client,
+            open_school=lambda school_id, db: School(school_id, db, self).open(),
+        )
+        self._report_executor: Optional[ProcessPoolExecutor] = None
+
+    def create_client(self, uri: str) -> AsyncIOMotorClient:
+        return AsyncIOMotorClient(
+            uri,
+            event_listeners=[MongoCommandTimer(self.settings.mongo_slow_query_ms), self.pool_monitor],
+            **self.settings.mongo_client_options()
+        )
+
+    @property
+    def report_executor(self) -> ProcessPoolExecutor:
+        # Term reports are built in a process pool shared by every school
+        if self._report_executor is None:
+            self._report_executor = ProcessPoolExecutor(
+                self.settings.report_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._report_executor
+
+    async def close(self):
+        self.closing = True
+        await self.schools.close()
+        self.event_bus.close()
+        if self._report_executor is not None:
+            self._report_executor.shutdown(wait=False, cancel_futures=True)
+        self.password_hasher.shutdown()
+        self.profiler.enabled = False
+
+class School:
+    """One school's collections and the services built on them.
+
+    Everything that reads or writes school data goes through a ``School``
+    from ``Services.schools``, so two schools never share a collection or a cache.
+    """
+
+    def __init__(self, school_id: str, db, services: Services):
+        settings = services.settings
+        self.id = school_id
+        self.db = db
+        self.services = services
+        self.teachers = db.teachers
+        self.classes = db.classes
+        self.students = db.students
+        # Stamped on every class, student and attendance write for /api/sync
+        self.change_sequence = ChangeSequence(db.counters)
+        self.tombstones = Tombstones(db.tombstones, self.change_sequence, ttl=settings.sync_tombstone_ttl)
+        self.attendance_store = open_attendance_store(
+            db, settings.attendance_storage, settings.attendance_partitioning,
+            archive_directory(settings.archive_dir, school_id, settings.default_school_id)
+        )
+        self.report_jobs = ReportJobs(
+            db.report_jobs, self.attendance_store, db.students,
+            max_workers=settings.report_workers, ttl=settings.report_ttl, executor=services.report_executor
+        )
+        # Version counters behind ETag/Last-Modified on class lists, rosters and sheets
+        self.resource_versions = ResourceVersions(db.resource_versions)
+        self.event_relay = (
+            MongoEventRelay(db.attendance_events, services.event_bus) if settings.event_source == 'changestream' else None
+        )
+        self.event_publisher = self.event_relay or services.event_bus
+        # First responses to writes sent with an Idempotency-Key, replayed on retries
+        self.idempotency_store = IdempotencyStore(
+            db.idempotency_keys,
+            ttl=settings.idempotency_ttl,
+            cache_size=settings.idempotency_cache_size,
+        )
+        # Per-class student name index behind /api/students/search, reloaded lazily
+        self.student_search = StudentSearch(db.students, refresh_after=settings.search_refresh)
+        # Teacher -> owned class ids and teacher profiles
+        self.auth_cache = AuthorizationCache(
+            maxsize=settings.auth_cache_size,
+            ttl=settings.auth_cache_ttl,
+        )
+        self.ingest_queue = IngestQueue(
+            self.attendance_store,
+            db.ingest_acks,
+            functools.partial(after_attendance_write, self),
+            max_batch=settings.ingest_max_batch,
+            max_delay=settings.ingest_max_delay,
+            max_pending=settings.ingest_max_pending,
+        ) if settings.attendance_ingest == 'queued' else None
+
+    async def open(self) -> "School":
+        settings = self.services.settings
+        # Deployments that run "manage.py ensure-indexes" can set ENSURE_INDEXES=false
+        # and spare every worker the listIndexes round-trips
+        if settings.ensure_indexes:
+            await ensure_indexes(self.db)
+        if isinstance(self.attendance_store, PartitionedStore):
+            await self.attendance_store.refresh()
+        if settings.seed_sample_data:
+            await init_sample_data(self)
+        if self.event_relay:
+            self.event_relay.start()
+        if self.ingest_queue:
+            self.ingest_queue.start()
+        return self
+
+    async def close(self):
+        if self.ingest_queue:
+            await self.ingest_queue.drain()
+        if self.event_relay:
+            await self.event_relay.stop()
+        await self.report_jobs.shutdown()
+
+# Point-in-time gauges refreshed on every /metrics scrape
+hash_queue_depth = registry.gauge("password_hash_queue_depth", "Callers waiting for a bcrypt slot")
+ingest_queue_depth = registry.gauge("ingest_queue_depth", "Attendance submissions waiting for a group commit")
+ingest_flushes = registry.gauge("ingest_flushes", "Group commits since start, and the submissions they wrote", ("kind",))
+hash_rejections = registry.gauge("password_hash_rejections", "Hash requests rejected with 503 since start")
+auth_cache_lookups = registry.gauge("auth_cache_lookups", "Authorization cache lookups since start", ("cache", "result"))
+school_routes = registry.gauge("school_routes", "Routed schools, schools opened by this worker and Mongo clients", ("kind",))
+
+def collect_runtime_metrics(services: Services):
+    hash_queue_depth.set(services.password_hasher.queue_depth)
+    hash_rejections.set(services.password_hasher.rejected)
+    opened = services.schools.opened()
+    lookups: dict = {}
+    for school in opened:
+        for cache_name, stats in school.auth_cache.stats().items():
+            for result, field in (("hit", "hits"), ("miss", "misses")):
+                lookups[cache_name, result] = lookups.get((cache_name, result), 0) + stats[field]
+    for (cache_name, result), count in lookups.items():
+        auth_cache_lookups.set(count, cache=cache_name, result=result)
+    queues = [school.ingest_queue.stats() for school in opened if school.ingest_queue]
+    if queues:
+        ingest_queue_depth.set(sum(stats["depth"] for stats in queues))
+        ingest_flushes.set(sum(stats["flushes"] for stats in queues), kind="flushes")
+        ingest_flushes.set(sum(stats["flushed_submissions"] for stats in queues), kind="submissions")
+    for kind, count in services.schools.stats().items():
+        school_routes.set(count, kind=kind)
 
 # Models
+# Dates are ISO days; storage derives the academic year from the characters
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
 class Teacher(BaseModel):
     id: str
     username: str
@@ -66,6 +247,7 @@ class TeacherCreate(BaseModel):
 class TeacherLogin(BaseModel):
     username: str
     password: str
+    school_id: Optional[str] = None  # the default school when omitted
 
 class Student(BaseModel):
     id: str
@@ -90,57 +272,252 @@ class AttendanceRecord(BaseModel):
     recorded_at: datetime
     recorded_by: str  # teacher_id
 
+class TeacherProfile(BaseModel):
+    id: str
+    username: str
+    email: EmailStr
+    full_name: str
+
 class AttendanceSubmission(BaseModel):
     class_id: str
-    date: str
+    date: str = Field(pattern=DATE_PATTERN)
     session: str
-    attendance_data: List[dict]  # [{"student_id": "xxx", "status": "present"}]
+    # [{"student_id": "xxx", "status": "present"}]; an empty sheet would block the real submission
+    attendance_data: List[dict] = Field(min_length=1)
+
+class AttendanceBatch(BaseModel):
+    submissions: List[AttendanceSubmission]
+    ordered: bool = False  # ordered writes stop at the first failed row
+
+class ProfilerSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None  # 0..1
+    route_pattern: Optional[str] = None  # regex on the request path
+    interval_ms: Optional[float] = None
+    keep_slowest: Optional[int] = None
+
+class ReportRequest(BaseModel):
+    kind: str  # "class-sheet" (one class, one month) or "absence-summary"
+    class_id: Optional[str] = None
+    month: Optional[str] = None  # YYYY-MM, class-sheet only
+    start_date: Optional[str] = Field(None, pattern=DATE_PATTERN)
+    end_date: Optional[str] = Field(None, pattern=DATE_PATTERN)
+    format: str = "csv"  # "csv" or "json"
 
 # Helper Functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# All password work goes through the hashing pool so bcrypt never blocks the event loop
+async def verify_password(password_hasher: PasswordHasher, plain_password, hashed_password):
+    try:
+        with password_hash_duration.time(operation="verify"):
+            return await password_hasher.verify(plain_password, hashed_password)
+    except HashingSaturated:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password_hasher: PasswordHasher, password):
+    try:
+        with password_hash_duration.time(operation="hash"):
+            return await password_hasher.hash(password)
+    except HashingSaturated:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-def create_access_token(data: dict):
-    return jwt.encode(data, SECRET_KEY, algorithm="HS256")
+def create_access_token(data: dict, secret_key: str):
+    return jwt.encode(data, secret_key, algorithm="HS256")
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token(token: str, secret_key: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
-        teacher_id = payload.get("teacher_id")
-        if teacher_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return teacher_id
+        payload = jwt.decode(token, secret_key, algorithms=["HS256"])
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("teacher_id") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+def get_services(request: Request) -> Services:
+    return request.app.state.services
+
+def token_payload(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    services: Services = Depends(get_services)
+) -> dict:
+    return decode_token(credentials.credentials, services.settings.secret_key)
+
+def verify_token(payload: dict = Depends(token_payload)):
+    return payload["teacher_id"]
+
+def require_admin(payload: dict = Depends(token_payload)):
+    if payload.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Administrator access required")
+    return payload["teacher_id"]
+
+def require_operator(payload: dict = Depends(token_payload)):
+    # The profiler and its samples are shared by every school this worker serves,
+    # so they are for the people running the deployment, not a school's administrators
+    if payload.get("role") != "operator":
+        raise HTTPException(status_code=403, detail="Operator access required")
+    return payload["teacher_id"]
+
+def verify_stream_token(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    services: Services = Depends(get_services)
+):
+    # EventSource cannot set headers, so streams also accept ?token=
+    if credentials is not None:
+        return decode_token(credentials.credentials, services.settings.secret_key)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return decode_token(token, services.settings.secret_key)
+
+async def school_for_token(services: Services, payload: dict) -> School:
+    # Tokens issued before schools were routed carry no claim: they belong to the default school
+    try:
+        return await services.schools.get(payload.get("school_id", services.settings.default_school_id))
+    except UnknownSchool:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def current_school(payload: dict = Depends(token_payload), services: Services = Depends(get_services)) -> School:
+    return await school_for_token(services, payload)
+
+def teacher_profile(teacher: dict) -> dict:
+    return {
+        "id": teacher["id"],
+        "username": teacher["username"],
+        "full_name": teacher["full_name"],
+        "email": teacher["email"]
+    }
+
+async def get_owned_class_ids(school: School, teacher_id: str):
+    class_ids = school.auth_cache.get_owned_classes(teacher_id)
+    if class_ids is None:
+        cursor = school.classes.find({"teacher_id": teacher_id}, {"_id": 0, "id": 1})
+        class_ids = school.auth_cache.set_owned_classes(teacher_id, [doc["id"] async for doc in cursor])
+    return class_ids
+
+async def get_visible_class_ids(school: School, payload: dict):
+    # Administrators see every class of their school; teachers only the classes they own
+    if payload.get("role") == "admin":
+        return frozenset([doc["id"] async for doc in school.classes.find({}, {"_id": 0, "id": 1})])
+    return await get_owned_class_ids(school, payload["teacher_id"])
+
+async def require_class_access(school: School, class_id: str, teacher_id: str):
+    if class_id not in await get_owned_class_ids(school, teacher_id):
+        raise HTTPException(status_code=404, detail="Class not found or access denied")
+
+async def run_analytics(school: School, class_ids, start_date: Optional[str], end_date: Optional[str], **options):
+    # pandas is imported by the first analytics request, not by every worker at boot
+    from analytics import analyze, load_columns
+    columns = await load_columns(school.attendance_store, export_filter(class_ids, start_date, end_date, None))
+    # The vectorized work is CPU-bound; keep it off the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(analyze, columns, **options))
+
+async def check_not_modified(school: School, request: Request, response: Response, key: str) -> Optional[Response]:
+    """Return a 304 if the client's copy of ``key`` is current, else set the validators on ``response``."""
+    revision, updated_at = await school.resource_versions.get(key)
+    etag = make_etag(key, revision, request.url.query)
+    headers = {"ETag": etag, "Last-Modified": http_date(updated_at), "Cache-Control": "private, no-cache"}
+    if is_not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+async def bump_sheet_versions(school: School, results: List[dict]):
+    await school.resource_versions.bump(*(
+        sheet_key(result["class_id"], result["date"], result["session"]) for result in results if result["inserted"]
+    ))
+
+async def publish_attendance_events(school: School, results: List[dict], teacher_id: str):
+    for result in results:
+        if not result["inserted"]:
+            continue
+        await school.event_publisher.publish({
+            "id": str(uuid.uuid4()),
+            "type": "attendance.submitted",
+            "school_id": school.id,
+            "class_id": result["class_id"],
+            "date": result["date"],
+            "session": result["session"],
+            "status": result["status"],
+            "inserted": result["inserted"],
+            "teacher_id": teacher_id,
+            "recorded_at": datetime.utcnow().isoformat()
+        })
+
+async def after_attendance_write(school: School, submissions, results: List[dict], teacher_ids: List[str]):
+    await apply_rollups(school.db, submissions, results)
+    await bump_sheet_versions(school, results)
+    for result, teacher_id in zip(results, teacher_ids):
+        await publish_attendance_events(school, [result], teacher_id)
+
+async def run_idempotent(school: School, request: Request, response: Response, teacher_id: str, payload: BaseModel,
+                         operation):
+    """Run ``operation`` once per ``Idempotency-Key`` and replay its first response on retries."""
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        return await operation()
+    
+    idempotency_store = school.idempotency_store
+    scoped_key = f"{teacher_id}:{request.method}:{request.url.path}:{key}"
+    request_fingerprint = fingerprint(payload.model_dump_json().encode())
+    try:
+        stored = await idempotency_store.begin(scoped_key, request_fingerprint)
+    except IdempotencyInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    except IdempotencyMismatch as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    if stored is not None:
+        return DefaultResponse(stored["body"], status_code=stored["status_code"], headers={"Idempotent-Replayed": "true"})
+    
+    try:
+        body = await operation()
+    except HTTPException as exc:
+        # Client errors are the answer for this key; server errors leave it free for a retry
+        if exc.status_code >= 500:
+            await idempotency_store.abandon(scoped_key)
+            raise
+        await idempotency_store.complete(scoped_key, request_fingerprint, exc.status_code, {"detail": exc.detail})
+        raise
+    except BaseException:
+        await idempotency_store.abandon(scoped_key)
+        raise
+    await idempotency_store.complete(scoped_key, request_fingerprint, response.status_code or 200, jsonable_encoder(body))
+    return body
+
+async def paginate(response: Response, page):
+    try:
+        rows, next_cursor = await page
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows, next_cursor
 
 # Initialize Sample Data
-async def init_sample_data():
+async def init_sample_data(school: School):
     # Check if data already exists
-    if await teachers_collection.count_documents({}) > 0:
+    if await school.teachers.count_documents({}) > 0:
         return
     
     # Sample Teachers
+    hashed_passwords = await asyncio.gather(*(get_password_hash(school.services.password_hasher, "password123") for _ in range(2)))
     teachers = [
         {
             "id": str(uuid.uuid4()),
             "username": "teacher1",
             "email": "teacher1@school.com",
             "full_name": "Sarah Johnson",
-            "hashed_password": get_password_hash("password123")
+            "hashed_password": hashed_passwords[0]
         },
         {
             "id": str(uuid.uuid4()),
             "username": "teacher2",
             "email": "teacher2@school.com",
             "full_name": "Michael Smith",
-            "hashed_password": get_password_hash("password123")
+            "hashed_password": hashed_passwords[1]
         }
     ]
     
-    await teachers_collection.insert_many(teachers)
+    await school.teachers.insert_many(teachers)
     
     # Sample Classes
     classes = [
@@ -170,7 +547,7 @@ async def init_sample_data():
         }
     ]
     
-    await classes_collection.insert_many(classes)
+    await school.classes.insert_many(await school.change_sequence.stamp(classes))
     
     # Sample Students for each class
     for class_doc in classes:
@@ -183,158 +560,659 @@ async def init_sample_data():
             }
             students.append(student)
         
-        await students_collection.insert_many(students)
+        await school.students.insert_many(await school.change_sequence.stamp(students))
+        for student in students:
+            school.student_search.upsert(student)
         
         # Update class with student IDs
         student_ids = [s["id"] for s in students]
-        await classes_collection.update_one(
+        await school.classes.update_one(
             {"id": class_doc["id"]},
-            {"$set": {"students": student_ids}}
+            {"$set": {"students": student_ids, **await school.change_sequence.next_stamp()}}
         )
+    
+    await school.resource_versions.bump(
+        *(classes_key(teacher["id"]) for teacher in teachers), *(roster_key(class_doc["id"]) for class_doc in classes)
+    )
+    for class_doc in classes:
+        school.auth_cache.class_reassigned(class_doc["id"], None, class_doc["teacher_id"])
 
 # API Routes
-@app.on_event("startup")
-async def startup_event():
-    await init_sample_data()
-
-@app.post("/api/auth/login")
-async def login(teacher_data: TeacherLogin):
-    teacher = await teachers_collection.find_one({"username": teacher_data.username})
-    if not teacher or not verify_password(teacher_data.password, teacher["hashed_password"]):
+router = APIRouter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services: Services = app.state.services
+    collector = functools.partial(collect_runtime_metrics, services)
+    registry.add_collector(collector)
+    # Only the schools in WARM_SCHOOLS open before the first request; the rest open on demand
+    await asyncio.gather(*(services.schools.get(school_id) for school_id in services.settings.warm_schools))
+    try:
+        yield
+    finally:
+        registry.remove_collector(collector)
+        await services.close()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/health/live", include_in_schema=False)
+async def liveness(services: Services = Depends(get_services)):
+    # No I/O: a worker that cannot reach MongoDB is unready, not dead, and restarting it would not help
+    return {
+        "status": "alive",
+        "uptime_seconds": round((datetime.utcnow() - services.started_at).total_seconds(), 3),
+        "schools": services.schools.stats(),
+        "pools": services.pool_monitor.snapshot()
+    }
+
+@router.get("/health/ready", include_in_schema=False)
+async def readiness(response: Response, services: Services = Depends(get_services)):
+    settings = services.settings
+    body = {"status": "ready", "schools": services.schools.stats(), "max_pool_size": settings.mongo_max_pool_size}
+    if services.closing:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {**body, "status": "shutting_down"}
+    # The first probe opens the default school, so the first real request does not pay for it
+    try:
+        await services.schools.get(settings.default_school_id)
+    except PyMongoError as exc:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {**body, "status": "unavailable", "error": type(exc).__name__}
+    mongo = await services.schools.ping(settings.readiness_timeout)
+    if not all(check["ok"] for check in mongo.values()):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        body["status"] = "unavailable"
+    return {**body, "schools": services.schools.stats(), "mongo": mongo, "pools": services.pool_monitor.snapshot()}
+
+@router.post("/api/auth/login")
+async def login(teacher_data: TeacherLogin, services: Services = Depends(get_services)):
+    try:
+        school = await services.schools.get(teacher_data.school_id or services.settings.default_school_id)
+    except UnknownSchool as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    teacher = await school.teachers.find_one({"username": teacher_data.username})
+    if not teacher or not await verify_password(services.password_hasher, teacher_data.password, teacher["hashed_password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    access_token = create_access_token({"teacher_id": teacher["id"]})
+    access_token = create_access_token(
+        {"teacher_id": teacher["id"], "role": teacher.get("role", "teacher"), "school_id": school.id},
+        services.settings.secret_key
+    )
+    profile = teacher_profile(teacher)
+    school.auth_cache.set_profile(teacher["id"], profile)
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "teacher": {
-            "id": teacher["id"],
-            "username": teacher["username"],
-            "full_name": teacher["full_name"],
-            "email": teacher["email"]
-        }
+        "teacher": profile
     }
 
-@app.get("/api/teacher/profile")
-async def get_teacher_profile(teacher_id: str = Depends(verify_token)):
-    teacher = await teachers_collection.find_one({"id": teacher_id})
-    if not teacher:
-        raise HTTPException(status_code=404, detail="Teacher not found")
+@router.get("/api/teacher/profile", response_model=TeacherProfile)
+async def get_teacher_profile(teacher_id: str = Depends(verify_token), school: School = Depends(current_school)):
+    profile = school.auth_cache.get_profile(teacher_id)
+    if profile is None:
+        teacher = await school.teachers.find_one({"id": teacher_id})
+        if not teacher:
+            raise HTTPException(status_code=404, detail="Teacher not found")
+        profile = teacher_profile(teacher)
+        school.auth_cache.set_profile(teacher_id, profile)
     
+    return profile
+
+def day_overview(counts: Dict[str, Dict[str, int]]) -> dict:
     return {
-        "id": teacher["id"],
-        "username": teacher["username"],
-        "full_name": teacher["full_name"],
-        "email": teacher["email"]
+        session: {
+            "submitted": session in counts,
+            "present": counts.get(session, {}).get("present", 0),
+            "absent": counts.get(session, {}).get("absent", 0)
+        }
+        for session in ("morning", "afternoon")
     }
 
-@app.get("/api/classes")
-async def get_teacher_classes(teacher_id: str = Depends(verify_token)):
-    cursor = classes_collection.find({"teacher_id": teacher_id})
-    classes = await cursor.to_list(100)
+@router.get("/api/teacher/dashboard")
+async def get_teacher_dashboard(
+    day: Optional[str] = Query(None, alias="date", pattern=DATE_PATTERN),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    day = day or date.today().isoformat()
+    # One aggregation: the teacher's classes, roster sizes and the day's attendance per class
+    # (the attendance $lookup needs MongoDB 5.0+, see day_lookup)
+    pipeline = [
+        {"$match": {"teacher_id": teacher_id}},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "name": 1,
+            "level": 1,
+            "stream": 1,
+            "roster_size": {"$size": {"$ifNull": ["$students", []]}}
+        }},
+        school.attendance_store.day_lookup(day, "day_attendance"),
+        {"$sort": {"name": 1, "id": 1}}
+    ]
+    classes = await school.classes.aggregate(pipeline).to_list(None)
+    school.auth_cache.set_owned_classes(teacher_id, [cls["id"] for cls in classes])
     
-    # Convert ObjectId to string
     for cls in classes:
-        if "_id" in cls:
-            cls["_id"] = str(cls["_id"])
+        cls["attendance"] = day_overview(school.attendance_store.day_counts(cls.pop("day_attendance")))
+    
+    return {
+        "teacher": await get_teacher_profile(teacher_id, school),
+        "date": day,
+        "classes": classes
+    }
+
+@router.get("/api/classes", response_model=List[Class])
+async def get_teacher_classes(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    not_modified = await check_not_modified(school, request, response, classes_key(teacher_id))
+    if not_modified:
+        return not_modified
+    
+    classes, next_cursor = await paginate(
+        response, fetch_page(school.classes, {"teacher_id": teacher_id}, ["id"], limit, cursor, {"_id": 0})
+    )
+    if not cursor and not next_cursor:
+        school.auth_cache.set_owned_classes(teacher_id, [cls["id"] for cls in classes])
     
     return classes
 
-@app.get("/api/classes/{class_id}/students")
-async def get_class_students(class_id: str, teacher_id: str = Depends(verify_token)):
+@router.get("/api/classes/{class_id}/students", response_model=List[Student])
+async def get_class_students(
+    class_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
     # Verify teacher owns this class
-    class_doc = await classes_collection.find_one({"id": class_id, "teacher_id": teacher_id})
-    if not class_doc:
-        raise HTTPException(status_code=404, detail="Class not found or access denied")
-    
-    cursor = students_collection.find({"class_id": class_id})
-    students = await cursor.to_list(100)
+    await require_class_access(school, class_id, teacher_id)
+    not_modified = await check_not_modified(school, request, response, roster_key(class_id))
+    if not_modified:
+        return not_modified
     
-    # Convert ObjectId to string
-    for student in students:
-        if "_id" in student:
-            student["_id"] = str(student["_id"])
+    students, _ = await paginate(
+        response,
+        fetch_page(school.students, {"class_id": class_id}, ["full_name", "id"], limit, cursor, {"_id": 0})
+    )
     
     return students
 
-@app.get("/api/classes/{class_id}/attendance")
+@router.get("/api/classes/{class_id}/attendance", response_model=List[AttendanceRecord])
 async def get_class_attendance(
     class_id: str,
-    date: str,
-    session: str,
-    teacher_id: str = Depends(verify_token)
+    request: Request,
+    response: Response,
+    date: str = Query(..., pattern=DATE_PATTERN),
+    session: str = Query(...),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
 ):
     # Verify teacher owns this class
-    class_doc = await classes_collection.find_one({"id": class_id, "teacher_id": teacher_id})
-    if not class_doc:
-        raise HTTPException(status_code=404, detail="Class not found or access denied")
-    
-    cursor = attendance_collection.find({
-        "class_id": class_id,
-        "date": date,
-        "session": session
-    })
-    attendance_records = await cursor.to_list(100)
+    await require_class_access(school, class_id, teacher_id)
+    not_modified = await check_not_modified(school, request, response, sheet_key(class_id, date, session))
+    if not_modified:
+        return not_modified
     
-    # Convert ObjectId to string
-    for record in attendance_records:
-        if "_id" in record:
-            record["_id"] = str(record["_id"])
+    attendance_records, _ = await paginate(
+        response, school.attendance_store.session_records(class_id, date, session, limit, cursor)
+    )
     
     return attendance_records
 
-@app.post("/api/classes/{class_id}/attendance")
+@router.post("/api/classes/{class_id}/attendance")
 async def submit_attendance(
     class_id: str,
     submission: AttendanceSubmission,
-    teacher_id: str = Depends(verify_token)
+    request: Request,
+    response: Response,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
 ):
+    return await run_idempotent(
+        school, request, response, teacher_id, submission,
+        lambda: write_attendance(school, class_id, submission, response, teacher_id)
+    )
+
+async def write_attendance(school: School, class_id: str, submission: AttendanceSubmission, response: Response,
+                           teacher_id: str):
     # Verify teacher owns this class
-    class_doc = await classes_collection.find_one({"id": class_id, "teacher_id": teacher_id})
-    if not class_doc:
-        raise HTTPException(status_code=404, detail="Class not found or access denied")
+    await require_class_access(school, class_id, teacher_id)
     
-    # Check if attendance already submitted for this session
-    existing = await attendance_collection.find_one({
-        "class_id": class_id,
-        "date": submission.date,
-        "session": submission.session
-    })
+    if school.ingest_queue:
+        try:
+            ack = school.ingest_queue.submit(class_id, submission, teacher_id)
+        except InvalidStatus as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+        except ArchivedYearError as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+        except IngestSaturated as exc:
+            raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": "Attendance queued", "token": ack["token"], "status": ack["status"]}
     
-    if existing:
+    # Upserts keyed on (class_id, date, session, student_id) make the existence
+    # check and the insert a single race-free round-trip; a session that was
+    # already (even partly) submitted is a conflict whatever the storage layout
+    try:
+        [result] = await school.attendance_store.write_sessions(
+            [(class_id, submission)], teacher_id, whole_sessions=True
+        )
+    except InvalidStatus as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except ArchivedYearError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    await after_attendance_write(school, [(class_id, submission)], [result], [teacher_id])
+    if result["conflicts"]:
         raise HTTPException(status_code=400, detail="Attendance already submitted for this session")
     
-    # Create attendance records
-    attendance_records = []
-    for record in submission.attendance_data:
-        attendance_record = {
-            "id": str(uuid.uuid4()),
-            "class_id": class_id,
-            "student_id": record["student_id"],
-            "date": submission.date,
-            "session": submission.session,
-            "status": record["status"],
-            "recorded_at": datetime.now(),
-            "recorded_by": teacher_id
-        }
-        attendance_records.append(attendance_record)
+    return {
+        "message": "Attendance submitted successfully",
+        "records_count": result["inserted"],
+        "conflicts": result["conflicts"]
+    }
+
+@router.get("/api/attendance/acks/{token}")
+async def get_ingest_status(
+    token: str,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    # Another teacher's token is answered like an unknown one
+    ack = await school.ingest_queue.status(token, teacher_id) if school.ingest_queue else None
+    if ack is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired acknowledgement token")
+    return ack
+
+@router.post("/api/attendance/batch")
+async def submit_attendance_batch(
+    batch: AttendanceBatch,
+    request: Request,
+    response: Response,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    return await run_idempotent(
+        school, request, response, teacher_id, batch, lambda: write_attendance_batch(school, batch, teacher_id)
+    )
+
+async def write_attendance_batch(school: School, batch: AttendanceBatch, teacher_id: str):
+    owned_class_ids = await get_owned_class_ids(school, teacher_id)
+    denied = {submission.class_id for submission in batch.submissions} - owned_class_ids
+    if denied:
+        raise HTTPException(status_code=404, detail=f"Class not found or access denied: {', '.join(sorted(denied))}")
+    
+    submissions = [(submission.class_id, submission) for submission in batch.submissions]
+    try:
+        results = await school.attendance_store.write_sessions(submissions, teacher_id, ordered=batch.ordered)
+    except InvalidStatus as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except ArchivedYearError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    await after_attendance_write(school, submissions, results, [teacher_id] * len(results))
+    return {
+        "results": results,
+        "inserted_count": sum(result["inserted"] for result in results),
+        "conflict_count": sum(len(result["conflicts"]) for result in results)
+    }
+
+@router.get("/api/events/attendance")
+async def stream_attendance_events(
+    class_id: Optional[List[str]] = Query(None),
+    token: dict = Depends(verify_stream_token),
+    services: Services = Depends(get_services)
+):
+    school = await school_for_token(services, token)
+    # Administrators follow every class of their school; teachers only the classes they own
+    if token.get("role") == "admin":
+        class_ids = set(class_id) if class_id else None
+    else:
+        class_ids = await get_owned_class_ids(school, token["teacher_id"])
+        if class_id:
+            class_ids = class_ids & set(class_id)
+    
+    subscription = services.event_bus.subscribe(
+        lambda event: event["school_id"] == school.id and (class_ids is None or event["class_id"] in class_ids)
+    )
+    return StreamingResponse(
+        sse_stream(subscription, services.settings.event_heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/api/attendance/export")
+async def export_attendance(
+    class_id: Optional[str] = None,
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    session: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    token: dict = Depends(token_payload),
+    school: School = Depends(current_school)
+):
+    # Without a class filter, export every class the caller can see: the whole school for an administrator
+    class_ids = await get_visible_class_ids(school, token)
+    if class_id:
+        if class_id not in class_ids:
+            raise HTTPException(status_code=404, detail="Class not found or access denied")
+        class_ids = [class_id]
+    
+    rows = school.attendance_store.iter_records(export_filter(class_ids, start_date, end_date, session), batch_size)
+    
+    filename = f"attendance-{class_id or 'all'}.{format}"
+    return StreamingResponse(
+        stream_export(rows, format, batch_size),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/api/sync")
+async def sync_changes(
+    since: str = Query("0", max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school),
+    services: Services = Depends(get_services)
+):
+    # Classes, students and attendance the teacher can see that changed after
+    # ``since``; send back resume_token as ``since`` until has_more is false
+    class_ids = await get_owned_class_ids(school, teacher_id)
+    sources = {
+        "classes": lambda after, count: find_changes(school.classes, {"teacher_id": teacher_id}, after, count),
+        "students": lambda after, count: find_changes(
+            school.students, {"class_id": {"$in": list(class_ids)}}, after, count
+        ),
+        "attendance": lambda after, count: school.attendance_store.changes(class_ids, after, count),
+        "deleted": lambda after, count: school.tombstones.changes(class_ids, teacher_id, after, count),
+    }
+    try:
+        return await collect_changes(sources, since, limit, services.settings.sync_settle, school.tombstones.ttl)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+@router.get("/api/classes/{class_id}/summary")
+async def get_class_summary(
+    class_id: str,
+    month: str = Query(default_factory=lambda: date.today().strftime("%Y-%m"), pattern=r"^\d{4}-\d{2}$"),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    await require_class_access(school, class_id, teacher_id)
+    return await class_summary(school.db, class_id, month)
+
+@router.get("/api/students/search")
+async def search_students(
+    q: str = Query(..., min_length=1, max_length=100),
+    class_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    if class_id:
+        await require_class_access(school, class_id, teacher_id)
+        class_ids = [class_id]
+    else:
+        class_ids = await get_owned_class_ids(school, teacher_id)
+    return await school.student_search.search(q, class_ids, limit)
+
+@router.get("/api/students/search/index")
+async def get_student_search_index(teacher_id: str = Depends(require_admin), school: School = Depends(current_school)):
+    return school.student_search.index.memory_report()
+
+@router.get("/api/students/{student_id}/absence")
+async def get_student_absence(
+    student_id: str,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    student = await school.students.find_one({"id": student_id}, {"_id": 0, "class_id": 1})
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found or access denied")
+    await require_class_access(school, student["class_id"], teacher_id)
+    return await student_absence(school.db, student_id, start_month, end_month)
+
+@router.get("/api/classes/{class_id}/analytics")
+async def get_class_analytics(
+    class_id: str,
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    rate_threshold: float = Query(20.0, ge=0, le=100),
+    streak_threshold: int = Query(3, ge=1),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    await require_class_access(school, class_id, teacher_id)
+    report = await run_analytics(
+        school, [class_id], start_date, end_date, rate_threshold=rate_threshold, streak_threshold=streak_threshold
+    )
+    return {"class_id": class_id, "start_date": start_date, "end_date": end_date, **report}
+
+@router.get("/api/classes/{class_id}/analytics/heatmap")
+async def get_class_heatmap(
+    class_id: str,
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    await require_class_access(school, class_id, teacher_id)
+    report = await run_analytics(school, [class_id], start_date, end_date, include={"heatmap"})
+    return {"class_id": class_id, "start_date": start_date, "end_date": end_date, **report}
+
+@router.get("/api/classes/{class_id}/analytics/at-risk")
+async def get_class_at_risk(
+    class_id: str,
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    rate_threshold: float = Query(20.0, ge=0, le=100),
+    streak_threshold: int = Query(3, ge=1),
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    await require_class_access(school, class_id, teacher_id)
+    report = await run_analytics(
+        school, [class_id], start_date, end_date,
+        rate_threshold=rate_threshold, streak_threshold=streak_threshold, include={"at_risk"}
+    )
+    return {"class_id": class_id, "start_date": start_date, "end_date": end_date, **report}
+
+@router.get("/api/analytics")
+async def get_school_analytics(
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    rate_threshold: float = Query(20.0, ge=0, le=100),
+    streak_threshold: int = Query(3, ge=1),
+    token: dict = Depends(token_payload),
+    school: School = Depends(current_school)
+):
+    # Every class the teacher owns, or every class of the school for an administrator, analysed as one matrix
+    report = await run_analytics(
+        school, await get_visible_class_ids(school, token), start_date, end_date,
+        rate_threshold=rate_threshold, streak_threshold=streak_threshold
+    )
+    return {"start_date": start_date, "end_date": end_date, **report}
+
+@router.post("/api/reports", status_code=status.HTTP_202_ACCEPTED)
+async def create_report(
+    report: ReportRequest,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    if report.kind not in REPORT_KINDS:
+        raise HTTPException(status_code=422, detail=f"Unknown report kind, expected one of {', '.join(REPORT_KINDS)}")
+    if report.format not in REPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=422, detail="Report format must be csv or json")
     
-    await attendance_collection.insert_many(attendance_records)
+    if report.class_id:
+        await require_class_access(school, report.class_id, teacher_id)
+        class_ids = [report.class_id]
+    else:
+        class_ids = sorted(await get_owned_class_ids(school, teacher_id))
     
-    return {"message": "Attendance submitted successfully", "records_count": len(attendance_records)}
+    if report.kind == "class-sheet":
+        if not report.class_id or not report.month or not re.fullmatch(r"\d{4}-\d{2}", report.month):
+            raise HTTPException(status_code=422, detail="class-sheet reports need class_id and month (YYYY-MM)")
+        params = {"class_ids": class_ids, "month": report.month}
+        query = export_filter(class_ids, f"{report.month}-01", f"{report.month}-31", None)
+    else:
+        params = {"class_ids": class_ids, "start_date": report.start_date, "end_date": report.end_date}
+        query = export_filter(class_ids, report.start_date, report.end_date, None)
+    
+    return await school.report_jobs.submit(report.kind, params, report.format, class_ids, query)
+
+async def get_report_job(school: School, job_id: str, teacher_id: str) -> dict:
+    job = await school.report_jobs.status(job_id)
+    if not job or not set(job["class_ids"]) <= await get_owned_class_ids(school, teacher_id):
+        raise HTTPException(status_code=404, detail="Report not found or access denied")
+    return job
+
+@router.get("/api/reports/{job_id}")
+async def get_report_status(
+    job_id: str,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    return await get_report_job(school, job_id, teacher_id)
+
+@router.get("/api/reports/{job_id}/download")
+async def download_report(
+    job_id: str,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    job = await get_report_job(school, job_id, teacher_id)
+    if job["state"] != "done":
+        raise HTTPException(status_code=409, detail=f"Report is {job['state']}, not ready for download")
+    result = await school.report_jobs.result(job_id)
+    if result is None or "content" not in result:
+        raise HTTPException(status_code=404, detail="Report expired")
+    filename = f"{job['kind']}-{job_id[:12]}.{job['format']}"
+    return Response(
+        bytes(result["content"]),
+        media_type=REPORT_MEDIA_TYPES[job["format"]],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/api/admin/profiler")
+async def get_profiler(teacher_id: str = Depends(require_operator), services: Services = Depends(get_services)):
+    return {**services.profiler.config(), "routes": services.profiler.routes()}
+
+@router.put("/api/admin/profiler")
+async def configure_profiler(
+    settings: ProfilerSettings,
+    teacher_id: str = Depends(require_operator),
+    services: Services = Depends(get_services)
+):
+    if settings.sample_rate is not None and not 0 <= settings.sample_rate <= 1:
+        raise HTTPException(status_code=422, detail="sample_rate must be between 0 and 1")
+    if settings.route_pattern:
+        try:
+            re.compile(settings.route_pattern)
+        except re.error as exc:
+            raise HTTPException(status_code=422, detail=f"Invalid route_pattern: {exc}")
+    return services.profiler.configure(
+        enabled=settings.enabled,
+        sample_rate=settings.sample_rate,
+        route_pattern=settings.route_pattern,
+        interval=settings.interval_ms / 1000 if settings.interval_ms else None,
+        keep_slowest=settings.keep_slowest
+    )
+
+@router.delete("/api/admin/profiler")
+async def reset_profiler(teacher_id: str = Depends(require_operator), services: Services = Depends(get_services)):
+    services.profiler.reset()
+    return {"message": "Profiles cleared"}
+
+@router.get("/api/admin/profiler/flamegraph", response_class=PlainTextResponse)
+async def get_profiler_flamegraph(
+    route: Optional[str] = None,
+    teacher_id: str = Depends(require_operator),
+    services: Services = Depends(get_services)
+):
+    # Collapsed stacks: pipe into flamegraph.pl or load into speedscope
+    return services.profiler.collapsed(route)
+
+@router.get("/api/admin/profiler/slowest")
+async def get_slowest_profiles(teacher_id: str = Depends(require_operator), services: Services = Depends(get_services)):
+    return services.profiler.slowest()
+
+@router.get("/api/admin/profiler/slowest/{profile_id}/flamegraph", response_class=PlainTextResponse)
+async def get_slowest_profile_flamegraph(
+    profile_id: int,
+    teacher_id: str = Depends(require_operator),
+    services: Services = Depends(get_services)
+):
+    stacks = services.profiler.slowest_collapsed(profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="Profile not found; it may have been displaced by slower ones")
+    return stacks
 
-@app.get("/api/classes/{class_id}")
-async def get_class_details(class_id: str, teacher_id: str = Depends(verify_token)):
-    class_doc = await classes_collection.find_one({"id": class_id, "teacher_id": teacher_id})
+@router.get("/api/classes/{class_id}", response_model=Class)
+async def get_class_details(
+    class_id: str,
+    teacher_id: str = Depends(verify_token),
+    school: School = Depends(current_school)
+):
+    class_doc = await school.classes.find_one({"id": class_id, "teacher_id": teacher_id}, {"_id": 0})
     if not class_doc:
         raise HTTPException(status_code=404, detail="Class not found or access denied")
     
-    # Convert ObjectId to string
-    if "_id" in class_doc:
-        class_doc["_id"] = str(class_doc["_id"])
-    
     return class_doc
 
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API from ``settings`` (the environment by default).
+
+    Nothing here touches MongoDB: clients, schools and the report pool are
+    created by the requests that first need them. ``uvicorn --factory
+    server:create_app`` builds one per worker; ``uvicorn server:app`` still
+    works, building the app from the environment when ``app`` is first read.
+    """
+    services = Services(settings or Settings.from_env())
+    app = FastAPI(title="Attendance Management System", default_response_class=DefaultResponse, lifespan=lifespan)
+    app.state.services = services
+    
+    # CORS Configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified", "Idempotent-Replayed"],
+    )
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(ProfilingMiddleware, profiler=services.profiler)
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    # Built on first access rather than at import, so that importing this module
+    # (as ``--factory`` does) never builds a second app with its own clients
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    app = create_app()
+    # Without a timeout, one open event stream would hold shutdown forever (see events.py)
+    uvicorn.run(
+        app, host="0.0.0.0", port=8001,
+        timeout_graceful_shutdown=app.state.services.settings.graceful_shutdown_timeout
+    )
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""Server configuration.
+
+``Settings.from_env()`` reads every variable the server understands once, when
+the app is built; ``create_app(settings)`` takes the result, so benchmarks and
+scripts can build an app from explicit settings instead of patching
+``os.environ``. Durations are in seconds unless the name says otherwise; the
+``MONGO_*_MS`` options are passed to pymongo as they are, and 0 leaves the
+limit off.
+
+The pool defaults follow pymongo's except for the timeouts: with a 5 s
+server selection timeout a request fails fast while MongoDB is unreachable
+instead of holding a worker slot for pymongo's 30 s.
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional, Tuple
+
+from schools import Route, load_routes
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _optional_ms(value: int) -> Optional[int]:
+    return value or None
+
+
+@dataclass(frozen=True)
+class Settings:
+    # MongoDB, and the schools routed to it (see schools.py)
+    mongo_url: str = 'mongodb://localhost:27017'
+    database: str = 'attendance_system'
+    default_school_id: str = 'default'
+    school_routes: str = ''
+    mongo_app_name: str = 'attendance-api'
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_connecting: int = 2
+    mongo_max_idle_time_ms: int = 0
+    mongo_wait_queue_timeout_ms: int = 0
+    mongo_connect_timeout_ms: int = 5000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 0
+    mongo_compressors: str = ''  # e.g. "zstd,snappy,zlib"; the first one the server supports is used
+    mongo_slow_query_ms: float = 100.0
+
+    # Startup: schools opened before the worker takes traffic (others open on
+    # their first request), and whether opening a school reconciles its indexes
+    warm_schools: Tuple[str, ...] = ()
+    ensure_indexes: bool = True
+    seed_sample_data: bool = False
+    readiness_timeout: float = 2.0
+    # Shutdown: how long uvicorn waits for open connections (event streams
+    # never finish on their own) before cancelling them
+    graceful_shutdown_timeout: float = 10.0
+
+    # Attendance storage layout, partitioning and ingestion
+    attendance_storage: str = 'records'
+    attendance_partitioning: str = 'none'
+    archive_dir: str = 'archive'
+    attendance_ingest: str = 'direct'
+    ingest_max_batch: int = 200
+    ingest_max_delay: float = 0.05
+    ingest_max_pending: int = 10000
+
+    # Term reports
+    report_workers: int = 2
+    report_ttl: float = 3600.0
+
+    # Live events and delta sync
+    event_source: str = 'local'
+    event_heartbeat: float = 15.0
+    event_queue_size: int = 100
+    event_queue_policy: str = 'drop_oldest'
+    event_block_timeout: float = 0.5
+    sync_settle: float = 1.0
+    sync_tombstone_ttl: float = 30 * 86400.0
+
+    # Per-school caches
+    idempotency_ttl: float = 86400.0
+    idempotency_cache_size: int = 10000
+    search_refresh: float = 300.0
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60.0
+
+    # Security
+    secret_key: str = 'your-secret-key-here'  # In production, set SECRET_KEY
+    hash_max_concurrency: int = 4
+    hash_max_queue: int = 64
+    hash_queue_timeout: float = 5.0
+
+    # Sampling profiler
+    profiler_enabled: bool = False
+    profiler_sample_rate: float = 0.0
+    profiler_route_pattern: str = ''
+    profiler_header: str = 'X-Profile'
+    profiler_header_token: str = ''  # the header only triggers a profile when set, and must carry it
+    profiler_interval: float = 0.005
+    profiler_keep_slowest: int = 20
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        get = environ.get
+        return cls(
+            mongo_url=get('MONGO_URL', cls.mongo_url),
+            database=get('ATTENDANCE_DB_NAME', cls.database),
+            default_school_id=get('DEFAULT_SCHOOL_ID', cls.default_school_id),
+            school_routes=get('SCHOOL_ROUTES', cls.school_routes),
+            mongo_app_name=get('MONGO_APP_NAME', cls.mongo_app_name),
+            mongo_max_pool_size=int(get('MONGO_MAX_POOL_SIZE', cls.mongo_max_pool_size)),
+            mongo_min_pool_size=int(get('MONGO_MIN_POOL_SIZE', cls.mongo_min_pool_size)),
+            mongo_max_connecting=int(get('MONGO_MAX_CONNECTING', cls.mongo_max_connecting)),
+            mongo_max_idle_time_ms=int(get('MONGO_MAX_IDLE_TIME_MS', cls.mongo_max_idle_time_ms)),
+            mongo_wait_queue_timeout_ms=int(get('MONGO_WAIT_QUEUE_TIMEOUT_MS', cls.mongo_wait_queue_timeout_ms)),
+            mongo_connect_timeout_ms=int(get('MONGO_CONNECT_TIMEOUT_MS', cls.mongo_connect_timeout_ms)),
+            mongo_server_selection_timeout_ms=int(
+                get('MONGO_SERVER_SELECTION_TIMEOUT_MS', cls.mongo_server_selection_timeout_ms)
+            ),
+            mongo_socket_timeout_ms=int(get('MONGO_SOCKET_TIMEOUT_MS', cls.mongo_socket_timeout_ms)),
+            mongo_compressors=get('MONGO_COMPRESSORS', cls.mongo_compressors),
+            mongo_slow_query_ms=float(get('MONGO_SLOW_QUERY_MS', cls.mongo_slow_query_ms)),
+            warm_schools=tuple(school_id for school_id in get('WARM_SCHOOLS', '').split(',') if school_id),
+            ensure_indexes=_flag(get('ENSURE_INDEXES', 'true')),
+            seed_sample_data=_flag(get('SEED_SAMPLE_DATA', 'false')),
+            readiness_timeout=float(get('READINESS_TIMEOUT', cls.readiness_timeout)),
+            graceful_shutdown_timeout=float(get('GRACEFUL_SHUTDOWN_TIMEOUT', cls.graceful_shutdown_timeout)),
+            attendance_storage=get('ATTENDANCE_STORAGE', cls.attendance_storage),
+            attendance_partitioning=get('ATTENDANCE_PARTITIONING', cls.attendance_partitioning),
+            archive_dir=get('ATTENDANCE_ARCHIVE_DIR', cls.archive_dir),
+            attendance_ingest=get('ATTENDANCE_INGEST', cls.attendance_ingest),
+            ingest_max_batch=int(get('INGEST_MAX_BATCH', cls.ingest_max_batch)),
+            ingest_max_delay=float(get('INGEST_MAX_DELAY_MS', '50')) / 1000,
+            ingest_max_pending=int(get('INGEST_MAX_PENDING', cls.ingest_max_pending)),
+            report_workers=int(get('REPORT_WORKERS', cls.report_workers)),
+            report_ttl=float(get('REPORT_TTL', cls.report_ttl)),
+            event_source=get('ATTENDANCE_EVENT_SOURCE', cls.event_source),
+            event_heartbeat=float(get('EVENT_HEARTBEAT_SECONDS', cls.event_heartbeat)),
+            event_queue_size=int(get('EVENT_QUEUE_SIZE', cls.event_queue_size)),
+            event_queue_policy=get('EVENT_QUEUE_POLICY', cls.event_queue_policy),
+            event_block_timeout=float(get('EVENT_BLOCK_TIMEOUT', cls.event_block_timeout)),
+            sync_settle=float(get('SYNC_SETTLE_MS', '1000')) / 1000,
+            sync_tombstone_ttl=float(get('SYNC_TOMBSTONE_TTL', cls.sync_tombstone_ttl)),
+            idempotency_ttl=float(get('IDEMPOTENCY_TTL', cls.idempotency_ttl)),
+            idempotency_cache_size=int(get('IDEMPOTENCY_CACHE_SIZE', cls.idempotency_cache_size)),
+            search_refresh=float(get('SEARCH_REFRESH_SECONDS', cls.search_refresh)),
+            auth_cache_size=int(get('AUTH_CACHE_SIZE', cls.auth_cache_size)),
+            auth_cache_ttl=float(get('AUTH_CACHE_TTL', cls.auth_cache_ttl)),
+            secret_key=get('SECRET_KEY', cls.secret_key),
+            hash_max_concurrency=int(get('HASH_MAX_CONCURRENCY', cls.hash_max_concurrency)),
+            hash_max_queue=int(get('HASH_MAX_QUEUE', cls.hash_max_queue)),
+            hash_queue_timeout=float(get('HASH_QUEUE_TIMEOUT', cls.hash_queue_timeout)),
+            profiler_enabled=_flag(get('PROFILER_ENABLED', 'false')),
+            profiler_sample_rate=float(get('PROFILER_SAMPLE_RATE', cls.profiler_sample_rate)),
+            profiler_route_pattern=get('PROFILER_ROUTE_PATTERN', cls.profiler_route_pattern),
+            profiler_header=get('PROFILER_HEADER', cls.profiler_header),
+            profiler_header_token=get('PROFILER_HEADER_TOKEN', cls.profiler_header_token),
+            profiler_interval=float(get('PROFILER_INTERVAL_MS', '5')) / 1000,
+            profiler_keep_slowest=int(get('PROFILER_KEEP_SLOWEST', cls.profiler_keep_slowest)),
+        )
+
+    def routes(self) -> Dict[str, Route]:
+        return load_routes(self.default_school_id, self.mongo_url, self.database, self.school_routes)
+
+    def mongo_client_options(self) -> dict:
+        """Keyword arguments for ``AsyncIOMotorClient``; they override the same options in the URI."""
+        options = {
+            "appname": self.mongo_app_name,
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": self.mongo_min_pool_size,
+            "maxConnecting": self.mongo_max_connecting,
+            "maxIdleTimeMS": _optional_ms(self.mongo_max_idle_time_ms),
+            "waitQueueTimeoutMS": _optional_ms(self.mongo_wait_queue_timeout_ms),
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+            "socketTimeoutMS": _optional_ms(self.mongo_socket_timeout_ms),
+        }
+        if self.mongo_compressors:
+            options["compressors"] = self.mongo_compressors
+        return options
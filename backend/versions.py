@@ -0,0 +1,104 @@
+"""Resource versions for conditional GET.
+
+Every cacheable listing (a teacher's class list, a class roster, a session's
+attendance sheet) has a version counter in ``resource_versions``. GET routes
+turn the version into an ``ETag``/``Last-Modified`` pair and answer a matching
+``If-None-Match`` or ``If-Modified-Since`` with 304 after a single ``_id``
+lookup, without touching the listing itself. Every write that changes a
+listing must ``bump`` its key; bulk writers that cannot name the keys they
+touch (seeding, the generator, maintenance commands) ``reset`` them instead.
+
+A key gets a random epoch when its counter is created, and the ETag covers
+it, so a listing whose counter was reset never repeats a validator a client
+may still hold.
+"""
+import hashlib
+import re
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+SHEET_PREFIX = "sheet:"
+
+
+def classes_key(teacher_id: str) -> str:
+    return f"classes:{teacher_id}"
+
+
+def roster_key(class_id: str) -> str:
+    return f"roster:{class_id}"
+
+
+def sheet_key(class_id: str, date: str, session: str) -> str:
+    return f"{SHEET_PREFIX}{class_id}:{date}:{session}"
+
+
+def _now() -> datetime:
+    # Last-Modified has one-second resolution
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _epoch() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class ResourceVersions:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> Tuple[str, datetime]:
+        """The revision of ``key`` (epoch and counter) and when it last changed."""
+        document = await self.collection.find_one({"_id": key})
+        if not document:
+            document = await self.collection.find_one_and_update(
+                {"_id": key}, {"$setOnInsert": {"version": 0, "epoch": _epoch(), "updated_at": _now()}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        revision = f"{document.get('epoch', '')}.{document['version']}"
+        return revision, document["updated_at"].replace(tzinfo=timezone.utc)
+
+    async def bump(self, *keys: str):
+        if not keys:
+            return
+        now = _now()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"_id": key},
+                {"$inc": {"version": 1}, "$set": {"updated_at": now}, "$setOnInsert": {"epoch": _epoch()}},
+                upsert=True
+            )
+            for key in dict.fromkeys(keys)
+        ], ordered=False)
+
+    async def reset(self, prefix: str = "") -> int:
+        """Drop the counters of every key starting with ``prefix``, so every cached copy is refetched."""
+        query = {"_id": {"$regex": f"^{re.escape(prefix)}"}} if prefix else {}
+        outcome = await self.collection.delete_many(query)
+        return outcome.deleted_count
+
+
+def make_etag(key: str, revision: str, variant: str = "") -> str:
+    """Strong validator for one representation (``variant`` covers query parameters)."""
+    digest = hashlib.sha1(f"{key}|{revision}|{variant}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str,
+                    last_modified: datetime) -> bool:
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified <= since
+    return False
+
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(moment, usegmt=True)
@@ -3,6 +3,23 @@ import './App.css';
 
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
+// Fetch every page of a paginated listing by following the X-Next-Cursor header
+const fetchAllPages = async (url, options) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const separator = url.includes('?') ? '&' : '?';
+    const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+    const response = await fetch(pageUrl, options);
+    if (!response.ok) {
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+    items.push(...(await response.json()));
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return items;
+};
+
 // Login Component
 const Login = ({ onLogin }) => {
   const [username, setUsername] = useState('');
@@ -113,12 +130,11 @@ const ClassList = ({ teacher, onSelectClass, onLogout }) => {
   const fetchClasses = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE_URL}/api/classes`, {
+      const data = await fetchAllPages(`${API_BASE_URL}/api/classes`, {
         headers: {
           'Authorization': `Bearer ${token}`,
         },
       });
-      const data = await response.json();
       setClasses(data);
     } catch (error) {
       console.error('Error fetching classes:', error);
@@ -215,12 +231,11 @@ const AttendanceSheet = ({ selectedClass, onBack }) => {
   const fetchStudents = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE_URL}/api/classes/${selectedClass.id}/students`, {
+      const data = await fetchAllPages(`${API_BASE_URL}/api/classes/${selectedClass.id}/students`, {
         headers: {
           'Authorization': `Bearer ${token}`,
         },
       });
-      const data = await response.json();
       setStudents(data);
       
       // Initialize attendance state
@@ -239,7 +254,7 @@ const AttendanceSheet = ({ selectedClass, onBack }) => {
   const checkExistingAttendance = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(
+      const data = await fetchAllPages(
         `${API_BASE_URL}/api/classes/${selectedClass.id}/attendance?date=${selectedDate}&session=${selectedSession}`,
         {
           headers: {
@@ -247,7 +262,6 @@ const AttendanceSheet = ({ selectedClass, onBack }) => {
           },
         }
       );
-      const data = await response.json();
       setIsSubmitted(data.length > 0);
       
       if (data.length > 0) {
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+# The backend is a flat set of modules imported as ``from attendance import ...``
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture
+def settings():
+    """Settings behind ``api``; a test module overrides this fixture to change them."""
+    from settings import Settings
+    return Settings(seed_sample_data=True)
+
+
+@pytest.fixture
+def api(monkeypatch, settings):
+    """A TestClient on an app seeded with the sample school, backed by mongomock.
+
+    ``api.login(username)`` returns the auth headers of a sample teacher,
+    ``api.as_admin(headers)`` the same teacher's headers with the admin role (or ``role``) and
+    ``api.record_session(headers)`` records a morning for the teacher's first
+    class, returning its id and roster size.
+    """
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+
+    import server
+
+    monkeypatch.setattr(server.Services, "create_client", lambda self, uri: AsyncMongoMockClient())
+    app = server.create_app(settings)
+    with TestClient(app) as client:
+        def login(username="teacher1", school_id=None):
+            response = client.post(
+                "/api/auth/login", json={"username": username, "password": "password123", "school_id": school_id}
+            )
+            assert response.status_code == 200, response.text
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def as_admin(headers, role="admin"):
+            payload = server.decode_token(headers["Authorization"].split()[1], app.state.services.settings.secret_key)
+            token = server.create_access_token({**payload, "role": role}, app.state.services.settings.secret_key)
+            return {"Authorization": f"Bearer {token}"}
+
+        def record_session(headers, date="2024-10-01"):
+            cls = client.get("/api/classes", headers=headers).json()[0]
+            students = client.get(f"/api/classes/{cls['id']}/students", headers=headers).json()
+            response = client.post(f"/api/classes/{cls['id']}/attendance", headers=headers, json={
+                "class_id": cls["id"], "date": date, "session": "morning",
+                "attendance_data": [{"student_id": student["id"], "status": "present"} for student in students]
+            })
+            assert response.status_code == 200, response.text
+            return cls["id"], len(students)
+
+        client.login = login
+        client.as_admin = as_admin
+        client.record_session = record_session
+        yield client
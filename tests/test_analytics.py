@@ -0,0 +1,74 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from analytics import ABSENT, LOAD_FIELDS, MISSING, PRESENT, StatusMatrix, absence_runs, load_columns
+
+A, P, M = ABSENT, PRESENT, MISSING
+
+
+class BufferedStore:
+    """Hands out records without ever suspending, like a cursor's buffered batch."""
+
+    def __init__(self, count):
+        self.count = count
+
+    async def iter_records(self, query, batch_size):
+        for index in range(self.count):
+            yield {"student_id": f"s{index}", "class_id": "c1", "date": "2024-10-01", "session": "morning",
+                   "status": "present", "recorded_at": None}
+
+
+def test_load_columns_yields_between_batches():
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        started = ticks
+        columns = await load_columns(BufferedStore(1000), {}, batch_size=100)
+        task.cancel()
+        return columns, ticks - started
+
+    columns, ticks = asyncio.run(scenario())
+    assert list(columns) == list(LOAD_FIELDS)
+    assert len(columns["student_id"]) == 1000
+    assert ticks >= 10
+
+
+def matrix(rows):
+    statuses = np.array(rows, dtype=np.int8).reshape(len(rows), -1)
+    sessions = statuses.shape[1]
+    return StatusMatrix(
+        student_ids=pd.Index([f"s{index}" for index in range(len(rows))]),
+        student_classes=np.array(["c1"] * len(rows), dtype=object),
+        dates=pd.DatetimeIndex(pd.date_range("2024-10-01", periods=sessions)),
+        sessions=np.array(["morning"] * sessions, dtype=object),
+        statuses=statuses
+    )
+
+
+def test_absence_runs():
+    longest, current = absence_runs(matrix([
+        [A, A, P, A, A, A],
+        [A, A, A, P, A, P],
+        [P, P, P, P, P, P],
+        # Unrecorded sessions neither break nor extend a run
+        [A, M, A, M, P, A],
+        [M, M, M, M, M, A],
+    ]))
+    assert longest.tolist() == [3, 3, 0, 2, 1]
+    assert current.tolist() == [3, 0, 0, 1, 1]
+
+
+def test_absence_runs_without_sessions():
+    longest, current = absence_runs(matrix([[], []]))
+    assert longest.tolist() == [0, 0]
+    assert current.tolist() == [0, 0]
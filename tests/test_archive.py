@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime
+
+from archive import ArchivedYear, write_archive
+
+
+class ListStore:
+    mode = "records"
+
+    def __init__(self, records):
+        self.records = records
+
+    async def iter_records(self, query, batch_size):
+        for record in self.records:
+            yield dict(record)
+
+
+def make_records():
+    records = []
+    for class_id in ("c2", "c1"):
+        for day in ("2024-10-02", "2024-10-01"):
+            for session in ("morning", "afternoon"):
+                for student in range(5):
+                    records.append({
+                        "class_id": class_id, "date": day, "session": session, "student_id": f"s{student}",
+                        "status": "absent" if student % 2 else "present",
+                        "recorded_at": datetime(2024, 10, 1, 8, 15, 0, 123000), "recorded_by": "t1"
+                    })
+    return records
+
+
+def archive(tmp_path, records, batch_size=7):
+    manifest = asyncio.run(write_archive(ListStore(records), str(tmp_path), "2024-2025", {}, batch_size))
+    return manifest, ArchivedYear(str(tmp_path / "2024-2025"))
+
+
+def read(year, query):
+    async def collect():
+        return [record async for record in year.iter_records(query, batch_size=3)]
+    return asyncio.run(collect())
+
+
+def key(record):
+    return record["class_id"], record["date"], record["session"], record["student_id"]
+
+
+def test_records_come_back_as_written_in_key_order(tmp_path):
+    records = make_records()
+    manifest, year = archive(tmp_path, records)
+    restored = read(year, {})
+    assert manifest["rows"] == len(records)
+    assert [key(record) for record in restored] == sorted(key(record) for record in records)
+    expected = {key(record): record for record in records}
+    for record in restored:
+        assert record.pop("id") == ":".join(key(record))
+        assert record == expected[key(record)]
+
+
+def test_filters_select_classes_and_date_ranges(tmp_path):
+    _, year = archive(tmp_path, make_records())
+    restored = read(year, {"class_id": {"$in": ["c2"]}, "date": {"$gte": "2024-10-02"}, "session": "morning"})
+    assert {(record["class_id"], record["date"], record["session"]) for record in restored} == {
+        ("c2", "2024-10-02", "morning")
+    }
+    assert len(restored) == 5
+
+
+def test_session_pages_follow_the_cursor(tmp_path):
+    _, year = archive(tmp_path, make_records())
+    seen, cursor = [], None
+    while True:
+        page, cursor = asyncio.run(year.session_records("c1", "2024-10-01", "afternoon", 2, cursor))
+        assert len(page) <= 2
+        seen += [record["student_id"] for record in page]
+        if cursor is None:
+            break
+    assert seen == [f"s{student}" for student in range(5)]
@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from attendance import RecordStore, SheetStore
+from indexes import ensure_indexes
+
+
+def submission(date, session, statuses):
+    return SimpleNamespace(
+        date=date, session=session,
+        attendance_data=[{"student_id": student_id, "status": status} for student_id, status in statuses.items()]
+    )
+
+
+def write_twice(store_class, whole_sessions):
+    async def scenario():
+        db = AsyncMongoMockClient()["attendance_test"]
+        store = store_class(db["attendance"])
+        first = submission("2024-10-01", "morning", {"s1": "present", "s2": "absent"})
+        # The new student comes first: mongomock numbers upserts among upserts, MongoDB among all operations
+        second = submission("2024-10-01", "morning", {"s3": "present", "s2": "present"})
+        await store.write_sessions([("c1", first)], "t1", whole_sessions=whole_sessions)
+        [result] = await store.write_sessions([("c1", second)], "t1", whole_sessions=whole_sessions)
+        records, _ = await store.session_records("c1", "2024-10-01", "morning", 10)
+        return result, {record["student_id"]: record["status"] for record in records}
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("store_class", [RecordStore, SheetStore])
+def test_overlapping_session_is_a_conflict_in_both_stores(store_class):
+    result, recorded = write_twice(store_class, whole_sessions=True)
+    assert result["status"] == "conflict"
+    assert result["inserted"] == 0
+    assert sorted(result["conflicts"]) == ["s2", "s3"]
+    # Nothing of the second submission is kept, not even the student the first one missed
+    assert recorded == {"s1": "present", "s2": "absent"}
+
+
+def test_record_store_keeps_partial_writes_for_batches():
+    result, recorded = write_twice(RecordStore, whole_sessions=False)
+    assert result["status"] == "partial"
+    assert result["inserted"] == 1
+    assert result["conflicts"] == ["s2"]
+    assert recorded == {"s1": "present", "s2": "absent", "s3": "present"}
+
+
+class Interleaved:
+    """A collection that hands the event loop back around every write, so concurrent writers interleave."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if name not in ("bulk_write", "delete_many"):
+            return attribute
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            result = await attribute(*args, **kwargs)
+            await asyncio.sleep(0)
+            return result
+        return call
+
+
+def test_concurrent_whole_session_writes_leave_exactly_one_submission():
+    async def scenario():
+        db = AsyncMongoMockClient()["attendance_test"]
+        await ensure_indexes(db)
+        first, second = (
+            RecordStore(Interleaved(db["attendance"]), claims=Interleaved(db["attendance_sessions"]))
+            for _ in range(2)
+        )
+        results = await asyncio.gather(
+            first.write_sessions([("c1", submission("2024-10-01", "morning", {"s1": "present", "s2": "absent"}))],
+                                 "t1", whole_sessions=True),
+            second.write_sessions([("c1", submission("2024-10-01", "morning", {"s2": "present", "s3": "present"}))],
+                                  "t2", whole_sessions=True),
+        )
+        records, _ = await first.session_records("c1", "2024-10-01", "morning", 10)
+        return [result for [result] in results], records
+
+    results, records = asyncio.run(scenario())
+    assert sorted(result["status"] for result in results) == ["conflict", "submitted"]
+    [winner] = [result for result in results if result["status"] == "submitted"]
+    assert winner["inserted"] == len(records) == 2
+    assert len({record["recorded_by"] for record in records}) == 1
+
+
+def test_session_recorded_before_claims_is_a_conflict():
+    async def scenario():
+        db = AsyncMongoMockClient()["attendance_test"]
+        await db["attendance"].insert_one({"class_id": "c1", "date": "2024-10-01", "session": "morning",
+                                           "student_id": "s1", "status": "absent"})
+        store = RecordStore(db["attendance"])
+        [result] = await store.write_sessions(
+            [("c1", submission("2024-10-01", "morning", {"s1": "present", "s2": "present"}))], "t1",
+            whole_sessions=True
+        )
+        return result, await db["attendance"].count_documents({})
+
+    result, rows = asyncio.run(scenario())
+    assert result["status"] == "conflict"
+    assert sorted(result["conflicts"]) == ["s1", "s2"]
+    assert rows == 1
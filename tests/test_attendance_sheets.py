@@ -0,0 +1,30 @@
+import pytest
+
+from attendance import InvalidStatus, build_sheet, expand_sheet, pack_statuses, unpack_statuses
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 8, 9, 17])
+def test_pack_round_trip(count):
+    statuses = ["absent" if index % 3 == 0 else "present" for index in range(count)]
+    packed = pack_statuses(statuses)
+    assert len(packed) == (count + 7) // 8
+    assert unpack_statuses(packed, count) == statuses
+
+
+def test_padding_bits_stay_clear():
+    # Absent counts are taken from the popcount of the whole field
+    packed = pack_statuses(["absent"] * 9)
+    assert int.from_bytes(packed, "little").bit_count() == 9
+
+
+def test_unknown_status_is_rejected():
+    with pytest.raises(InvalidStatus):
+        pack_statuses(["present", "late"])
+
+
+def test_sheet_expands_to_records_in_student_order():
+    records = [{"student_id": "s2", "status": "absent"}, {"student_id": "s1", "status": "present"}]
+    sheet = build_sheet("c1", "2024-10-01", "morning", records, "t1", None)
+    expanded = expand_sheet(sheet)
+    assert [(record["student_id"], record["status"]) for record in expanded] == [("s1", "present"), ("s2", "absent")]
+    assert len({record["id"] for record in expanded}) == 2
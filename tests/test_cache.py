@@ -0,0 +1,49 @@
+from cache import AuthorizationCache, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_invalidation_hooks_drop_what_the_write_changed():
+    cache = AuthorizationCache()
+    cache.set_owned_classes("t1", ["c1", "c2"])
+    cache.set_owned_classes("t2", ["c3"])
+    cache.set_profile("t1", {"id": "t1"})
+
+    cache.invalidate_class("c1")
+    assert cache.get_owned_classes("t1") is None
+    assert cache.get_owned_classes("t2") == frozenset({"c3"})
+
+    cache.set_owned_classes("t1", ["c2"])
+    cache.class_reassigned("c4", "t3", "t1")
+    assert cache.get_owned_classes("t1") is None
+
+    cache.invalidate_teacher("t1")
+    assert cache.get_profile("t1") is None
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from changes import collect_changes
+from pagination import encode_cursor
+
+
+def source(seqs, changed_at):
+    """A change source holding ``seqs``; numbers missing in between belong to other sources or were never used."""
+    async def fetch(after, count):
+        return [(seq, changed_at, [{"id": f"doc{seq}"}]) for seq in sorted(seqs) if seq > after][:count]
+    return fetch
+
+
+def sync(sources, since="0", limit=2):
+    return asyncio.run(collect_changes(sources, since, limit, settle=1.0, retention=3600.0))
+
+
+def test_pages_step_over_gaps_in_the_sequence():
+    settled = datetime.utcnow() - timedelta(minutes=5)
+    sources = {"attendance": source([2, 3, 9, 14], settled), "deleted": source([5, 10], settled)}
+    seen, since, pages = [], "0", 0
+    while True:
+        page = sync(sources, since)
+        pages += 1
+        seen += [int(document["id"][3:]) for kind in sources for document in page[kind]]
+        since = page["resume_token"]
+        if not page["has_more"]:
+            break
+    assert sorted(seen) == [2, 3, 5, 9, 10, 14]
+    assert len(seen) == len(set(seen))
+    assert pages == 3
+
+
+def test_unsettled_changes_wait_for_the_next_sync():
+    now = datetime.utcnow()
+    sources = {
+        "attendance": source([1], now - timedelta(minutes=5)),
+        "deleted": source([2], now + timedelta(minutes=5))
+    }
+    page = sync(sources, limit=10)
+    assert [document["id"] for document in page["attendance"]] == ["doc1"]
+    assert page["deleted"] == []
+    assert not page["has_more"]
+    # Resuming later from the token picks up the unsettled change
+    later = sync({"deleted": source([2], now - timedelta(minutes=5))}, page["resume_token"], limit=10)
+    assert [document["id"] for document in later["deleted"]] == ["doc2"]
+
+
+def test_expired_resume_token_asks_for_a_reset():
+    stale = encode_cursor([7, (datetime.utcnow() - timedelta(hours=2)).timestamp()])
+    assert sync({"attendance": source([], datetime.utcnow())}, stale)["reset"]
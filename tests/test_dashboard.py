@@ -0,0 +1,38 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from attendance import RecordStore, SheetStore
+from server import day_overview
+
+
+def submission(date, session, statuses):
+    return SimpleNamespace(
+        date=date, session=session,
+        attendance_data=[{"student_id": student_id, "status": status} for student_id, status in statuses.items()]
+    )
+
+
+@pytest.mark.parametrize("store_class", [RecordStore, SheetStore])
+def test_dashboard_shows_submitted_sessions_and_their_counts(store_class):
+    async def scenario():
+        db = AsyncMongoMockClient()["dashboard_test"]
+        store = store_class(db["attendance"])
+        await store.write_sessions([
+            ("c1", submission("2024-10-01", "morning", {"s1": "present", "s2": "absent", "s3": "absent"})),
+            ("c1", submission("2024-10-02", "afternoon", {"s1": "present"})),
+            ("c2", submission("2024-10-01", "afternoon", {"s4": "present"})),
+        ], "t1")
+        # mongomock has no $lookup with a pipeline, so run the joined pipeline for class c1 directly
+        lookup = store.day_lookup("2024-10-01", "day_attendance")["$lookup"]
+        entries = await db[lookup["from"]].aggregate(
+            [{"$match": {lookup["foreignField"]: "c1"}}, *lookup["pipeline"]]
+        ).to_list(None)
+        return day_overview(store.day_counts(entries))
+
+    assert asyncio.run(scenario()) == {
+        "morning": {"submitted": True, "present": 1, "absent": 2},
+        "afternoon": {"submitted": False, "present": 0, "absent": 0},
+    }
@@ -0,0 +1,22 @@
+import asyncio
+from datetime import date
+
+from mongomock_motor import AsyncMongoMockClient
+
+from datagen import SchoolGenerator, SchoolSpec, write_school
+
+
+def test_generated_attendance_is_partitioned_and_rolled_up():
+    async def scenario():
+        db = AsyncMongoMockClient()["datagen_test"]
+        # Two weeks straddling 1 September, so two academic years
+        spec = SchoolSpec(teachers=2, classes=3, students=30, start_date=date(2024, 8, 26), end_date=date(2024, 9, 6))
+        counts = await write_school(db, SchoolGenerator(spec, hashed_password="x"), "records", "year", batch_size=50)
+        days = await db.attendance_class_days.find({}, {"_id": 0}).to_list(None)
+        return counts, days
+
+    counts, days = asyncio.run(scenario())
+    assert counts["attendance_2023_2024"] == counts["attendance_2024_2025"] == 5 * 2 * 30
+    assert "attendance" not in counts
+    assert len(days) == 10 * 3
+    assert sum(day["present"] + day["absent"] for day in days) == 10 * 2 * 30
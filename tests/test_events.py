@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from events import BLOCK, DROP_NEWEST, DROP_OLDEST, EventBus, sse_stream
+
+
+def event(number, class_id="c1"):
+    return {"id": str(number), "type": "attendance.submitted", "class_id": class_id}
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait()["id"])
+    return events
+
+
+@pytest.mark.parametrize("policy, kept", [(DROP_OLDEST, ["2", "3"]), (DROP_NEWEST, ["1", "2"])])
+def test_full_queue_sheds_events_by_policy(policy, kept):
+    async def scenario():
+        bus = EventBus(maxsize=2, policy=policy)
+        subscription = bus.subscribe()
+        for number in (1, 2, 3):
+            await bus.publish(event(number))
+        return subscription
+
+    subscription = asyncio.run(scenario())
+    assert drain(subscription) == kept
+    assert subscription.dropped == 1
+
+
+def test_subscribers_only_receive_the_events_they_accept():
+    async def scenario():
+        bus = EventBus()
+        subscription = bus.subscribe(lambda published: published["class_id"] == "c2")
+        await bus.publish(event(1, "c1"))
+        await bus.publish(event(2, "c2"))
+        return subscription
+
+    assert drain(asyncio.run(scenario())) == ["2"]
+
+
+def test_blocked_subscriber_is_disconnected_after_the_timeout():
+    async def scenario():
+        bus = EventBus(maxsize=1, policy=BLOCK, block_timeout=0.01)
+        slow = bus.subscribe()
+        await bus.publish(event(1))
+        await bus.publish(event(2))
+        return bus, slow, await slow.get(), await slow.get()
+
+    bus, slow, first, after = asyncio.run(scenario())
+    assert slow.closed and bus.subscriber_count == 0
+    # The full queue is emptied to make room for the close marker
+    assert (first, after) == (None, None)
+
+
+def test_closing_the_bus_ends_open_streams():
+    async def scenario():
+        bus = EventBus()
+        stream = sse_stream(bus.subscribe(), heartbeat=60)
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        await bus.publish(event(1))
+        message = await stream.__anext__()
+        bus.close()
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        return message, bus.subscriber_count
+
+    message, subscribers = asyncio.run(scenario())
+    assert message.startswith("id: 1\nevent: attendance.submitted\n")
+    assert subscribers == 0
@@ -0,0 +1,19 @@
+import csv
+import io
+
+
+def exported_classes(api, headers, **params):
+    response = api.get("/api/attendance/export", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return sorted({row["class_id"] for row in csv.DictReader(io.StringIO(response.text))})
+
+
+def test_teachers_export_their_classes_and_administrators_the_whole_school(api):
+    teacher1, teacher2 = api.login("teacher1"), api.login("teacher2")
+    own_class, _ = api.record_session(teacher1)
+    other_class, _ = api.record_session(teacher2)
+
+    assert exported_classes(api, teacher1) == [own_class]
+    assert exported_classes(api, api.as_admin(teacher1)) == sorted([own_class, other_class])
+    assert exported_classes(api, api.as_admin(teacher1), class_id=other_class) == [other_class]
+    assert api.get("/api/attendance/export", headers=teacher1, params={"class_id": other_class}).status_code == 404
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from hashing import HashingSaturated, PasswordHasher
+
+
+class SlowContext:
+    def verify(self, plain_password, hashed_password):
+        time.sleep(0.05)
+        return plain_password == hashed_password
+
+    def hash(self, password):
+        time.sleep(0.05)
+        return password
+
+
+async def burst(hasher: PasswordHasher, count: int):
+    return await asyncio.gather(*(hasher.verify("pw", "pw") for _ in range(count)), return_exceptions=True)
+
+
+def test_burst_admits_only_concurrency_plus_queue():
+    hasher = PasswordHasher(SlowContext(), max_concurrency=2, max_queue=2)
+    try:
+        results = asyncio.run(burst(hasher, 8))
+    finally:
+        hasher.shutdown()
+    assert results.count(True) == 4
+    assert sum(isinstance(result, HashingSaturated) for result in results) == 4
+    assert hasher.rejected == 4
+    assert hasher.queue_depth == 0
+
+
+def test_large_burst():
+    hasher = PasswordHasher(SlowContext(), max_concurrency=2, max_queue=2)
+    try:
+        results = asyncio.run(burst(hasher, 50))
+    finally:
+        hasher.shutdown()
+    assert results.count(True) == 4
+    assert hasher.rejected == 46
+
+
+def test_queue_timeout_rejects_waiters():
+    hasher = PasswordHasher(SlowContext(), max_concurrency=1, max_queue=5, queue_timeout=0.01)
+    try:
+        results = asyncio.run(burst(hasher, 3))
+    finally:
+        hasher.shutdown()
+    assert results[0] is True
+    assert all(isinstance(result, HashingSaturated) for result in results[1:])
+
+
+def test_slots_are_released_after_a_burst():
+    hasher = PasswordHasher(SlowContext(), max_concurrency=1, max_queue=0)
+
+    async def run():
+        first = await burst(hasher, 3)
+        second = await hasher.hash("pw")
+        return first, second
+
+    try:
+        first, second = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert first.count(True) == 1
+    assert all(isinstance(result, HashingSaturated) for result in first[1:])
+    assert second == "pw"
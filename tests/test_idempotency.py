@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from idempotency import IdempotencyInProgress, IdempotencyMismatch, IdempotencyStore
+
+
+def collection():
+    return AsyncMongoMockClient()["idempotency_test"].idempotency_keys
+
+
+def test_one_of_two_racing_calls_claims_the_key():
+    async def scenario():
+        keys = collection()
+        first, second = IdempotencyStore(keys), IdempotencyStore(keys)
+        outcomes = await asyncio.gather(first.begin("t1:POST:/x:k", "fp"), second.begin("t1:POST:/x:k", "fp"),
+                                        return_exceptions=True)
+        await first.complete("t1:POST:/x:k", "fp", 200, {"ok": True})
+        # A third worker has nothing cached and replays from the collection
+        replayed = await IdempotencyStore(keys).begin("t1:POST:/x:k", "fp")
+        return outcomes, replayed
+
+    outcomes, replayed = asyncio.run(scenario())
+    assert outcomes.count(None) == 1
+    assert sum(isinstance(outcome, IdempotencyInProgress) for outcome in outcomes) == 1
+    assert replayed["status_code"] == 200
+    assert replayed["body"] == {"ok": True}
+
+
+def test_key_reused_for_another_body_is_rejected():
+    async def scenario():
+        store = IdempotencyStore(collection())
+        await store.begin("k", "fp")
+        await store.complete("k", "fp", 201, {})
+        await store.begin("k", "other")
+
+    with pytest.raises(IdempotencyMismatch):
+        asyncio.run(scenario())
+
+
+def test_expired_claim_is_taken_over():
+    async def scenario():
+        keys = collection()
+        store = IdempotencyStore(keys)
+        await store.begin("k", "fp")
+        await keys.update_one({"_id": "k"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+        return await IdempotencyStore(keys).begin("k", "fp")
+
+    assert asyncio.run(scenario()) is None
@@ -0,0 +1,40 @@
+import asyncio
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+
+from ingest import COMMITTED, QUEUED, IngestQueue
+
+
+class AcceptingStore:
+    def validate(self, submission):
+        pass
+
+    async def write_sessions(self, submissions, teacher_id, ordered=True, recorded_by=None, whole_sessions=False):
+        return [{"status": "submitted", "inserted": len(submission.attendance_data)} for _, submission in submissions]
+
+
+async def nothing(*args):
+    pass
+
+
+def test_acknowledgements_are_only_shown_to_their_teacher():
+    async def scenario():
+        acks = AsyncMongoMockClient()["ingest_test"].ingest_acks
+        queue = IngestQueue(AcceptingStore(), acks, nothing, max_delay=0.01)
+        submission = SimpleNamespace(date="2024-10-01", session="morning",
+                                     attendance_data=[{"student_id": "s1", "status": "present"}])
+        token = queue.submit("c1", submission, "t1")["token"]
+        queued = await queue.status(token, "t1"), await queue.status(token, "t2")
+        queue.start()
+        await queue.drain()
+        # A worker that never saw the token answers from the stored acknowledgements
+        other_worker = IngestQueue(AcceptingStore(), acks, nothing)
+        committed = await other_worker.status(token, "t1"), await other_worker.status(token, "t2")
+        return queued, committed
+
+    (own_queued, other_queued), (own_committed, other_committed) = asyncio.run(scenario())
+    assert own_queued["status"] == QUEUED
+    assert own_committed["status"] == COMMITTED
+    assert other_queued is None
+    assert other_committed is None
@@ -0,0 +1,37 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+from passlib.context import CryptContext
+from typer.testing import CliRunner
+
+import manage
+
+
+def test_create_admin_creates_an_account_then_promotes_existing_teachers(monkeypatch):
+    db = AsyncMongoMockClient()["manage_test"]
+    monkeypatch.setattr(manage, "get_database", lambda: db)
+    runner = CliRunner()
+
+    created = runner.invoke(manage.cli, ["create-admin", "principal", "--full-name", "Amina Idrissi"],
+                            input="principal@school.com\nsecret\nsecret\n")
+    asyncio.run(db.teachers.insert_one({"id": "t1", "username": "teacher1"}))
+    promoted = runner.invoke(manage.cli, ["create-admin", "teacher1"])
+
+    assert created.exit_code == 0, created.output
+    assert promoted.exit_code == 0, promoted.output
+    principal = asyncio.run(db.teachers.find_one({"username": "principal"}))
+    assert (principal["role"], principal["email"], principal["full_name"]) == (
+        "admin", "principal@school.com", "Amina Idrissi"
+    )
+    assert CryptContext(schemes=["bcrypt"]).verify("secret", principal["hashed_password"])
+    assert asyncio.run(db.teachers.find_one({"username": "teacher1"}))["role"] == "admin"
+
+
+def test_create_admin_can_make_an_operator(monkeypatch):
+    db = AsyncMongoMockClient()["manage_test"]
+    monkeypatch.setattr(manage, "get_database", lambda: db)
+    asyncio.run(db.teachers.insert_one({"id": "t1", "username": "ops"}))
+
+    assert CliRunner().invoke(manage.cli, ["create-admin", "ops", "--role", "operator"]).exit_code == 0
+    assert CliRunner().invoke(manage.cli, ["create-admin", "ops", "--role", "owner"]).exit_code != 0
+    assert asyncio.run(db.teachers.find_one({"username": "ops"}))["role"] == "operator"
@@ -0,0 +1,12 @@
+def test_requests_are_labelled_by_route_template(api):
+    headers = api.login()
+    class_id = api.get("/api/classes", headers=headers).json()[0]["id"]
+    assert api.get(f"/api/classes/{class_id}/students", headers=headers).status_code == 200
+    assert api.get("/api/no-such-route").status_code == 404
+
+    lines = api.get("/metrics").text.splitlines()
+    responses = [line for line in lines if line.startswith("http_responses_total{")]
+    assert any('route="/api/classes/{class_id}/students"' in line and 'status="200"' in line for line in responses)
+    assert any('route="unmatched"' in line and 'status="404"' in line for line in responses)
+    # Ids never become labels, or every class would be its own time series
+    assert not any(class_id in line for line in lines)
@@ -0,0 +1,27 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from attendance import migrate_records_to_sheets
+
+
+def test_deleted_rows_are_tombstoned_for_sync():
+    async def scenario():
+        db = AsyncMongoMockClient()["migration_test"]
+        await db.attendance.insert_many([
+            {"id": f"row{index}", "class_id": "c1", "date": "2024-10-01", "session": "morning",
+             "student_id": f"s{index}", "status": "present", "recorded_at": None, "recorded_by": "t1"}
+            for index in range(5)
+        ])
+        counts = await migrate_records_to_sheets(db, delete_source=True, batch_size=2)
+        tombstones = await db.tombstones.find({}, {"_id": 0}).to_list(None)
+        sheet = await db.attendance_sheets.find_one({})
+        return counts, tombstones, sheet, await db.attendance.count_documents({})
+
+    counts, tombstones, sheet, remaining = asyncio.run(scenario())
+    assert counts["records_deleted"] == 5
+    assert remaining == 0
+    assert sorted(tombstone["id"] for tombstone in tombstones) == [f"row{index}" for index in range(5)]
+    assert all(tombstone["kind"] == "attendance" and tombstone["class_id"] == "c1" for tombstone in tombstones)
+    # The rows are tombstoned after the sheet replacing them, so a client syncing in between never loses the session
+    assert min(tombstone["change_seq"] for tombstone in tombstones) > sheet["change_seq"]
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_page, keyset_filter
+
+
+def test_cursor_round_trip():
+    values = ["Amina Alaoui", 42, "é/+?"]
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, ["name", "count", "id"]) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(["only one"]), "eyJhIjoxfQ"])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, ["name", "id"])
+
+
+def test_keyset_filter():
+    assert keyset_filter(["id"], ["b"]) == {"id": {"$gt": "b"}}
+    assert keyset_filter(["name", "id"], ["Sara", "x"]) == {"$or": [
+        {"name": {"$gt": "Sara"}},
+        {"name": "Sara", "id": {"$gt": "x"}}
+    ]}
+
+
+def test_pages_cover_every_row_once_with_ties_on_the_first_key():
+    rows = [{"name": name, "id": f"{name}{index}"} for name in ("Adam", "Lina", "Sara") for index in range(4)]
+
+    async def scenario():
+        collection = AsyncMongoMockClient()["pagination_test"].students
+        await collection.insert_many([dict(row) for row in reversed(rows)])
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_page(collection, {}, ["name", "id"], 5, cursor, {"_id": 0})
+            seen.extend(page)
+            if cursor is None:
+                return seen
+
+    assert asyncio.run(scenario()) == rows
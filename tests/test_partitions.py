@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+
+from partitions import PartitionedStore
+
+
+def submission(date, session, statuses):
+    return SimpleNamespace(
+        date=date, session=session,
+        attendance_data=[{"student_id": student_id, "status": status} for student_id, status in statuses.items()]
+    )
+
+
+def test_a_partition_created_by_another_store_is_read_and_synced():
+    async def scenario():
+        db = AsyncMongoMockClient()["partition_test"]
+        writer, reader = PartitionedStore(db), PartitionedStore(db)
+        await writer.refresh()
+        await reader.refresh()
+        # The reader started before the 2025-2026 partition existed
+        await writer.write_sessions([("c1", submission("2025-10-01", "morning", {"s1": "present"}))], "t1")
+        records = [record async for record in reader.iter_records({"class_id": {"$in": ["c1"]}})]
+        changes = await reader.changes(["c1"], 0, 10)
+        return records, changes
+
+    records, changes = asyncio.run(scenario())
+    assert [(record["date"], record["student_id"]) for record in records] == [("2025-10-01", "s1")]
+    assert len(changes) == 1
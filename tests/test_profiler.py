@@ -0,0 +1,18 @@
+from profiler import Profiler
+
+
+def test_trigger_header_needs_the_configured_token():
+    open_header = Profiler(enabled=True)
+    guarded = Profiler(enabled=True, header_token="s3cret")
+    try:
+        assert not open_header.should_profile("/api/classes", {b"x-profile": b"1"})
+        assert not guarded.should_profile("/api/classes", {b"x-profile": b"guess"})
+        assert guarded.should_profile("/api/classes", {b"x-profile": b"s3cret"})
+    finally:
+        open_header.enabled = guarded.enabled = False
+
+
+def test_profiles_are_for_operators_not_school_administrators(api):
+    teacher = api.login()
+    assert api.get("/api/admin/profiler", headers=api.as_admin(teacher)).status_code == 403
+    assert api.get("/api/admin/profiler", headers=api.as_admin(teacher, role="operator")).status_code == 200
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from reports import DONE, FAILED, QUEUED, RUNNING, ReportJobs, is_live
+
+
+def test_queued_job_has_no_expiry_until_it_finishes():
+    async def scenario():
+        db = AsyncMongoMockClient()["reports_test"]
+        jobs = ReportJobs(db.report_jobs, store=None, students_collection=db.students)
+        status = await jobs.submit("absence-summary", {"class_ids": ["c1"]}, "csv", ["c1"], {})
+        queued = await db.report_jobs.find_one({"_id": status["id"]})
+        # Cancelling stands in for the end of the job: either way it is finished
+        await jobs.shutdown()
+        finished = await db.report_jobs.find_one({"_id": status["id"]})
+        return queued, finished
+
+    queued, finished = asyncio.run(scenario())
+    assert queued["state"] == QUEUED
+    assert "expires_at" not in queued
+    assert queued["stale_at"] > datetime.utcnow()
+    assert finished["state"] == FAILED
+    assert "stale_at" not in finished
+    assert finished["expires_at"] > finished["finished_at"]
+
+
+def test_stale_job_is_claimed_again():
+    async def scenario():
+        db = AsyncMongoMockClient()["reports_test"]
+        jobs = ReportJobs(db.report_jobs, store=None, students_collection=db.students)
+        first = await jobs.submit("absence-summary", {}, "csv", ["c1"], {})
+        await jobs.shutdown()
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        await db.report_jobs.update_one({"_id": first["id"]}, {
+            "$set": {"state": RUNNING, "stale_at": long_ago}, "$unset": {"expires_at": ""}
+        })
+        second = await jobs.submit("absence-summary", {}, "csv", ["c1"], {})
+        await jobs.shutdown()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second["id"] == first["id"]
+    assert second["state"] == QUEUED
+    assert second["created_at"] > first["created_at"]
+
+
+def test_is_live():
+    now = datetime.utcnow()
+    later, earlier = now + timedelta(minutes=1), now - timedelta(minutes=1)
+    assert is_live({"state": QUEUED, "stale_at": later}, now)
+    assert not is_live({"state": RUNNING, "stale_at": earlier}, now)
+    assert is_live({"state": DONE, "expires_at": later}, now)
+    assert not is_live({"state": DONE, "expires_at": earlier}, now)
+    assert not is_live({"state": FAILED, "expires_at": later}, now)
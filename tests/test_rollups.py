@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+
+from attendance import RecordStore
+from rollups import CLASS_DAYS, STUDENT_MONTHS, STUDENT_STREAKS, apply_rollups, rebuild_rollups
+
+
+def submission(date, session, statuses):
+    return SimpleNamespace(
+        date=date, session=session,
+        attendance_data=[{"student_id": student_id, "status": status} for student_id, status in statuses.items()]
+    )
+
+
+async def snapshot(db):
+    rollups = {}
+    for name in (STUDENT_MONTHS, CLASS_DAYS, STUDENT_STREAKS):
+        documents = await db[name].find({}, {"_id": 0}).to_list(None)
+        for document in documents:
+            if "sessions" in document:
+                document["sessions"] = sorted(document["sessions"])
+        rollups[name] = sorted(documents, key=lambda document: sorted(document.items()))
+    return rollups
+
+
+def test_incremental_rollups_match_a_rebuild():
+    writes = [
+        [("c1", submission("2024-09-30", "morning", {"s1": "absent", "s2": "present"}))],
+        [("c1", submission("2024-09-30", "afternoon", {"s1": "absent", "s2": "absent"})),
+         ("c2", submission("2024-09-30", "morning", {"s3": "present"}))],
+        # Already recorded: conflicts must not count twice
+        [("c1", submission("2024-09-30", "morning", {"s1": "present", "s2": "present"}))],
+        [("c1", submission("2024-10-01", "morning", {"s1": "absent", "s2": "present"}))],
+        [("c1", submission("2024-10-01", "afternoon", {"s1": "present", "s2": "absent"}))],
+    ]
+
+    async def scenario():
+        db = AsyncMongoMockClient()["rollups_test"]
+        store = RecordStore(db["attendance"])
+        for submissions in writes:
+            results = await store.write_sessions(submissions, "t1", whole_sessions=True)
+            await apply_rollups(db, submissions, results)
+        incremental = await snapshot(db)
+        await rebuild_rollups(db, store, batch_size=3)
+        return incremental, await snapshot(db)
+
+    incremental, rebuilt = asyncio.run(scenario())
+    assert incremental[STUDENT_MONTHS] and incremental[STUDENT_STREAKS]
+    assert incremental == rebuilt
@@ -0,0 +1,9 @@
+def test_teachers_analyse_their_classes_and_administrators_the_whole_school(api):
+    teacher1, teacher2 = api.login("teacher1"), api.login("teacher2")
+    _, own_students = api.record_session(teacher1)
+    _, other_students = api.record_session(teacher2)
+
+    own = api.get("/api/analytics", headers=teacher1).json()
+    school = api.get("/api/analytics", headers=api.as_admin(teacher1)).json()
+    assert own["students_count"] == own_students
+    assert school["students_count"] == own_students + other_students
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from settings import Settings
+
+
+@pytest.fixture
+def settings():
+    return Settings(seed_sample_data=True, school_routes=json.dumps({"north": {}}))
+
+
+def test_tokens_of_two_schools_resolve_to_separate_databases(api):
+    default, north = api.login("teacher1"), api.login("teacher1", school_id="north")
+    assert api.app.state.services.schools.routes["north"][1] == "attendance_north"
+
+    default_classes = {cls["id"] for cls in api.get("/api/classes", headers=default).json()}
+    north_classes = {cls["id"] for cls in api.get("/api/classes", headers=north).json()}
+    assert default_classes and north_classes and not default_classes & north_classes
+
+    north_class, _ = api.record_session(north)
+    assert api.get(f"/api/classes/{north_class}/students", headers=default).status_code == 404
+    assert api.get("/api/attendance/export", headers=default).text.count("\n") == 1
+    assert api.get("/api/attendance/export", headers=north).text.count("\n") > 1
@@ -0,0 +1,56 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from search import StudentIndex, StudentSearch, normalize
+
+
+def make_index():
+    index = StudentIndex()
+    index.load_class("c1", [
+        {"id": "s1", "full_name": "Zineb El Amrani"},
+        {"id": "s2", "full_name": "Amine Benali"},
+        {"id": "s3", "full_name": "Élodie Martin"},
+    ])
+    index.load_class("c2", [{"id": "s4", "full_name": "Amina Tazi"}])
+    return index
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_names_are_matched_without_accents_or_case():
+    assert normalize("  Élodie-MARTIN ") == "elodie martin"
+    assert ids(make_index().search("elod", ["c1"])) == ["s3"]
+
+
+def test_prefixes_and_misspellings_both_match():
+    assert sorted(ids(make_index().search("amin", ["c1", "c2"]))) == ["s2", "s4"]
+    assert ids(make_index().search("benaly", ["c1"])) == ["s2"]
+
+
+def test_search_stays_inside_the_given_classes():
+    assert ids(make_index().search("amina", ["c1"])) == ["s2"]
+
+
+def test_upsert_moves_and_renames_and_remove_forgets():
+    index = make_index()
+    index.upsert({"id": "s2", "class_id": "c2", "full_name": "Amine Benali Idrissi"})
+    assert ids(index.search("idrissi", ["c1", "c2"])) == ["s2"]
+    assert index.search("idrissi", ["c1"]) == []
+    index.remove("s2")
+    assert index.search("idrissi", ["c1", "c2"]) == []
+
+
+def test_classes_are_reloaded_once_their_copy_is_stale():
+    async def scenario(refresh_after):
+        students = AsyncMongoMockClient()["search_test"]["students"]
+        await students.insert_one({"id": "s1", "class_id": "c1", "full_name": "Zineb El Amrani"})
+        search = StudentSearch(students, refresh_after=refresh_after)
+        await search.search("zineb", ["c1"])
+        await students.insert_one({"id": "s2", "class_id": "c1", "full_name": "Zineb Tazi"})
+        return sorted(ids(await search.search("zineb", ["c1"])))
+
+    assert asyncio.run(scenario(300)) == ["s1"]
+    assert asyncio.run(scenario(-1)) == ["s1", "s2"]
@@ -0,0 +1,37 @@
+import pytest
+from pydantic import ValidationError
+
+from server import AttendanceBatch, AttendanceSubmission, ReportRequest
+
+
+def test_empty_submission_is_rejected():
+    with pytest.raises(ValidationError):
+        AttendanceSubmission(class_id="c1", date="2024-10-01", session="morning", attendance_data=[])
+
+
+def test_empty_submission_is_rejected_inside_a_batch():
+    with pytest.raises(ValidationError):
+        AttendanceBatch(submissions=[
+            {"class_id": "c1", "date": "2024-10-01", "session": "morning", "attendance_data": []}
+        ])
+
+
+def test_submission_with_records_is_accepted():
+    submission = AttendanceSubmission(
+        class_id="c1", date="2024-10-01", session="morning",
+        attendance_data=[{"student_id": "s1", "status": "present"}]
+    )
+    assert len(submission.attendance_data) == 1
+
+
+@pytest.mark.parametrize("day", ["2024-1-05", "yesterday", "2024-10-01T08:00", ""])
+def test_submission_date_must_be_an_iso_day(day):
+    with pytest.raises(ValidationError):
+        AttendanceSubmission(
+            class_id="c1", date=day, session="morning", attendance_data=[{"student_id": "s1", "status": "present"}]
+        )
+
+
+def test_report_dates_must_be_iso_days():
+    with pytest.raises(ValidationError):
+        ReportRequest(kind="absence-summary", start_date="2024-13")
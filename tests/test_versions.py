@@ -0,0 +1,38 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from versions import SHEET_PREFIX, ResourceVersions, make_etag, roster_key, sheet_key
+
+
+def run(scenario):
+    return asyncio.run(scenario(ResourceVersions(AsyncMongoMockClient()["versions_test"].resource_versions)))
+
+
+def test_bump_changes_the_revision():
+    async def scenario(versions):
+        key = roster_key("c1")
+        before, _ = await versions.get(key)
+        again, _ = await versions.get(key)
+        await versions.bump(key)
+        after, _ = await versions.get(key)
+        return before, again, after
+
+    before, again, after = run(scenario)
+    assert before == again
+    assert after != before
+
+
+def test_reset_never_repeats_a_revision():
+    async def scenario(versions):
+        sheet, roster = sheet_key("c1", "2024-10-01", "morning"), roster_key("c1")
+        before = [(await versions.get(key))[0] for key in (sheet, roster)]
+        deleted = await versions.reset(SHEET_PREFIX)
+        after = [(await versions.get(key))[0] for key in (sheet, roster)]
+        return before, after, deleted
+
+    before, after, deleted = run(scenario)
+    assert deleted == 1
+    # The counter starts over, but the epoch does not
+    assert make_etag("sheet", after[0]) != make_etag("sheet", before[0])
+    assert after[1] == before[1]